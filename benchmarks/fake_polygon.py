@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+'''
+Local HTTP stand-in for the Polygon.io REST API, serving synthetic responses
+of configurable size, so `poly` can be benchmarked (and tested) offline.
+
+Endpoints (the ones `poly` wraps):
+  /v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/{from}/{to}
+      a full regular session of minute bars (09:30 - 16:00 New York) for
+      every weekday in the range, or one bar per weekday for day bars,
+      truncated to `limit` like Polygon does
+  /v2/reference/dividends/{symbol}
+      `dividends` quarterly dividends, the latest one `DIVIDEND_LEAD_DAYS`
+      ahead of today
+  /v1/marketstatus/now
+      a fixed status, US stocks 'open'
+
+eg,
+    with FakePolygonServer() as server:
+        client = poly.PolyClient(api_key, base_url=server.url)
+        client.get_ticker_aggregates('BAC', '2021-01-04', '2021-01-08')
+    server.requests  # paths requested, in order
+'''
+
+import contextlib
+import datetime
+import http.server
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import zoneinfo
+
+NEW_YORK = zoneinfo.ZoneInfo('America/New_York')
+
+# minute bars in a regular session
+SESSION_MINUTES = 390
+
+DEFAULT_DIVIDENDS = 40
+
+# the latest synthetic dividend is this many days in the future
+DIVIDEND_LEAD_DAYS = 30
+
+MARKET_STATUS = {
+    'market': 'open',
+    'serverTime': '2021-01-04T10:00:00-05:00',
+    'exchanges': {'nyse': 'open', 'nasdaq': 'open', 'otc': 'open'},
+    'currencies': {'fx': 'open', 'crypto': 'open'},
+}
+
+AGGREGATES_PATH = re.compile(
+    r'/v2/aggs/ticker/(?P<ticker>[^/]+)/range/(?P<multiplier>\d+)/'
+    r'(?P<timespan>[a-z]+)/(?P<from_>[\d-]+)/(?P<to>[\d-]+)$')
+DIVIDENDS_PATH = re.compile(r'/v2/reference/dividends/(?P<symbol>[^/]+)$')
+MARKET_STATUS_PATH = '/v1/marketstatus/now'
+
+
+def _weekdays(from_, to):
+    day = datetime.date.fromisoformat(from_)
+    last = datetime.date.fromisoformat(to)
+    while day <= last:
+        if day.weekday() < 5:
+            yield day
+        day += datetime.timedelta(days=1)
+
+
+def _bar(rng, timestamp, price):
+    close = price + rng.uniform(-0.05, 0.05)
+    return {'v': float(rng.randrange(100, 10000)), 'vw': (price + close) / 2,
+            'o': price, 'c': close, 'h': max(price, close) + 0.01,
+            'l': min(price, close) - 0.01, 't': timestamp,
+            'n': rng.randrange(1, 100)}
+
+
+def aggregates(ticker, multiplier, timespan, from_, to, limit=5000):
+    '''
+    Returns a synthetic aggregates response (see the module docstring).
+    Prices are a random walk seeded by the ticker and date, so the same
+    request always gets the same bars.
+    '''
+    results = []
+    for day in _weekdays(from_, to):
+        rng = random.Random(f'{ticker}{day}')
+        price = 10 + rng.random() * 90
+        opening = datetime.datetime(day.year, day.month, day.day, 9, 30,
+                                    tzinfo=NEW_YORK)
+        start = int(opening.timestamp() * 1000)
+        if timespan == 'day':
+            results.append(_bar(rng, start, price))
+            continue
+        for minute in range(0, SESSION_MINUTES, multiplier):
+            bar = _bar(rng, start + minute * 60000, price)
+            price = bar['c']
+            results.append(bar)
+        if len(results) >= limit:
+            break
+    results = results[:limit]
+    return {'ticker': ticker, 'status': 'OK', 'queryCount': len(results),
+            'resultsCount': len(results), 'adjusted': True,
+            'results': results}
+
+
+def dividends(symbol, count=DEFAULT_DIVIDENDS, today=None):
+    '''
+    Returns a synthetic dividends response of `count` quarterly dividends,
+    newest first like Polygon.
+    '''
+    today = today or datetime.date.today()
+    latest = today + datetime.timedelta(days=DIVIDEND_LEAD_DAYS)
+    results = []
+    for quarter in range(count):
+        ex_date = latest - datetime.timedelta(days=91 * quarter)
+        results.append({
+            'ticker': symbol,
+            'exDate': ex_date.isoformat(),
+            'paymentDate': (ex_date + datetime.timedelta(days=21)).isoformat(),
+            'recordDate': (ex_date + datetime.timedelta(days=2)).isoformat(),
+            'declaredDate': (ex_date - datetime.timedelta(days=40)).isoformat(),
+            'amount': 0.18,
+            })
+    return {'status': 'OK', 'count': len(results), 'results': results}
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes, don't let Nagle delay the body
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        server = self.server.stand_in
+        server.requests.append(url.path)
+        with server.track_in_flight():
+            self._respond(url, query, server)
+
+    def _respond(self, url, query, server):
+
+        match = AGGREGATES_PATH.match(url.path)
+        if match:
+            return self._send_json(aggregates(
+                match['ticker'], int(match['multiplier']), match['timespan'],
+                match['from_'], match['to'],
+                int(query.get('limit', 5000))))
+        match = DIVIDENDS_PATH.match(url.path)
+        if match:
+            return self._send_json(dividends(match['symbol'],
+                                             server.dividends))
+        if url.path == MARKET_STATUS_PATH:
+            return self._send_json(MARKET_STATUS)
+        self._send_json({'status': 'NOT_FOUND'}, status=404)
+
+
+class FakePolygonServer:
+    '''
+    Serves the synthetic Polygon.io API on a free localhost port, from a
+    background thread, while used as a context manager.
+
+    dividends: dividends returned per ticker.
+    latency: seconds every response is delayed by.
+
+    `peak_in_flight` is the most requests ever handled at once.
+    '''
+
+    def __init__(self, dividends=DEFAULT_DIVIDENDS, latency=0.0):
+        self.dividends = dividends
+        self.latency = latency
+        self.requests = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                       _Handler)
+        self._server.daemon_threads = True
+        self._server.stand_in = self
+        self.url = f'http://127.0.0.1:{self._server.server_address[1]}'
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+
+    @contextlib.contextmanager
+    def track_in_flight(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join(5)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+'''
+Benchmarks `poly` against a local Polygon.io stand-in (see fake_polygon.py),
+so no api key, network or quota is needed and runs are comparable.
+
+Measures latency (seconds per call), throughput and peak memory of
+  marketstatus     get_marketstatus (uncached)
+  dividends        get_dividends for `--tickers` tickers
+  aggregates       get_ticker_aggregates of `--bars` minute bars
+  aggregates_bars  the same, as_bars=True
+  cli_aggregates   `trademin-poly aggregates` (a new process every run)
+  cli_save_as      `trademin-poly aggregates --save-as` to NDJSON
+
+Peak memory is the tracemalloc peak of one extra run for the in-process
+benchmarks, and the peak RSS of the process for the CLI ones.
+
+eg,
+    $> python benchmarks/run.py --output before.json
+    $> python benchmarks/run.py --output after.json --compare before.json
+    $> python benchmarks/run.py --bars 5000 --tickers 50 --only aggregates
+'''
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# like bin/trademin-poly.py, fall back to the repository's own packages
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import poly
+from benchmarks.fake_polygon import FakePolygonServer, SESSION_MINUTES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+CLI = os.path.join(ROOT, 'bin', 'trademin-poly.py')
+
+API_KEY = 'benchmark'
+
+# the first day of the synthetic aggregates
+FIRST_DAY = datetime.date(2021, 1, 4)
+
+BENCHMARKS = ('marketstatus', 'dividends', 'aggregates', 'aggregates_bars',
+              'cli_aggregates', 'cli_save_as')
+
+
+def _last_day(bars):
+    '''
+    Returns the last day of the range starting on FIRST_DAY holding at least
+    `bars` minute bars (one session per weekday).
+    '''
+    day, sessions = FIRST_DAY, -(-bars // SESSION_MINUTES)
+    while True:
+        if day.weekday() < 5:
+            sessions -= 1
+            if sessions <= 0:
+                return day
+        day += datetime.timedelta(days=1)
+
+
+def _summary(name, latencies, items, unit, peak_memory):
+    median = statistics.median(latencies)
+    return {
+        'name': name,
+        'runs': len(latencies),
+        'latency_s': {'min': min(latencies), 'median': median,
+                      'max': max(latencies)},
+        'items': items,
+        'throughput': {'value': items / median if median else None,
+                       'unit': f'{unit}/s'},
+        'peak_memory_bytes': peak_memory,
+        }
+
+
+def measure(name, function, items, unit, repeat):
+    '''
+    Time `repeat` calls of `function`, then trace one more for its peak
+    memory. Returns the summary dictionary.
+    '''
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return _summary(name, latencies, items, unit, peak)
+
+
+def measure_process(name, command, env, items, unit, repeat):
+    '''
+    Time `repeat` runs of the `command` process. Peak memory is the largest
+    peak RSS of the runs.
+    '''
+    latencies = []
+    peak = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+        _, status, usage = os.wait4(process.pid, 0)
+        latencies.append(time.perf_counter() - start)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, command)
+        # ru_maxrss is in kilobytes on Linux, bytes on macOS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        peak = max(peak, usage.ru_maxrss * scale)
+    return _summary(name, latencies, items, unit, peak)
+
+
+def run(args):
+    '''
+    Run the selected benchmarks, returns the results document.
+    '''
+    selected = args.only or BENCHMARKS
+    from_, to = FIRST_DAY.isoformat(), _last_day(args.bars).isoformat()
+    tickers = [f'T{number:04d}' for number in range(args.tickers)]
+    results = []
+
+    with FakePolygonServer(dividends=args.dividends) as server, \
+            tempfile.TemporaryDirectory() as workdir:
+        os.environ[poly.BASE_URL_ENV] = server.url
+        poly.close_clients()
+
+        config = os.path.join(workdir, 'polygon.json')
+        with open(config, 'w') as f:
+            json.dump({'api_key': API_KEY}, f)
+        env = dict(os.environ)
+        # never forwarded to a user's `serve` daemon, which would send the
+        # requests to its own POLY_BASE_URL
+        cli = [sys.executable, CLI, '--config', config, '--no-daemon',
+               'aggregates', 'BAC', '--from_', from_, '--to', to,
+               '--no-cache']
+        bars = len(poly.get_ticker_aggregates(API_KEY, 'BAC', from_,
+                                              to)['results'])
+
+        if 'marketstatus' in selected:
+            results.append(measure(
+                'marketstatus',
+                lambda: poly.get_marketstatus(API_KEY, ttl=0, verbose=False),
+                1, 'calls', args.repeat * 10))
+        if 'dividends' in selected:
+            results.append(measure(
+                'dividends', lambda: poly.get_dividends(API_KEY, tickers),
+                len(tickers), 'tickers', args.repeat))
+        if 'aggregates' in selected:
+            results.append(measure(
+                'aggregates',
+                lambda: poly.get_ticker_aggregates(API_KEY, 'BAC', from_, to),
+                bars, 'bars', args.repeat))
+        if 'aggregates_bars' in selected:
+            results.append(measure(
+                'aggregates_bars',
+                lambda: poly.get_ticker_aggregates(API_KEY, 'BAC', from_, to,
+                                                   as_bars=True),
+                bars, 'bars', args.repeat))
+        if 'cli_aggregates' in selected:
+            results.append(measure_process(
+                'cli_aggregates', cli, env, bars, 'bars', args.repeat))
+        if 'cli_save_as' in selected:
+            results.append(measure_process(
+                'cli_save_as',
+                cli + ['--save-as', os.path.join(workdir, 'BAC.ndjson')],
+                env, bars, 'bars', args.repeat))
+        poly.close_clients()
+        del os.environ[poly.BASE_URL_ENV]
+
+    return {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'revision': _revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {'bars': bars, 'tickers': args.tickers,
+                       'dividends': args.dividends, 'repeat': args.repeat},
+        'results': results,
+        }
+
+
+def _revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(document, baseline):
+    '''
+    Returns report lines comparing the median latency and peak memory of
+    `document` with `baseline` (both results documents).
+    '''
+    before = {result['name']: result for result in baseline['results']}
+    lines = []
+    for result in document['results']:
+        old = before.get(result['name'])
+        if old is None:
+            continue
+        latency = (result['latency_s']['median'] /
+                   old['latency_s']['median'])
+        memory = (result['peak_memory_bytes'] / old['peak_memory_bytes']
+                  if old['peak_memory_bytes'] else float('nan'))
+        lines.append(f"{result['name']:<16} latency x{latency:.2f}  "
+                     f"memory x{memory:.2f}")
+    return lines
+
+
+def report(document):
+    lines = []
+    for result in document['results']:
+        throughput = result['throughput']
+        lines.append(
+            f"{result['name']:<16} {result['latency_s']['median']:9.4f} s  "
+            f"{throughput['value']:12.1f} {throughput['unit']:<10} "
+            f"{result['peak_memory_bytes'] / 2**20:8.1f} MiB")
+    return lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark poly against a local Polygon.io stand-in.')
+    parser.add_argument('--bars', type=int, default=50000,
+                        help='minute bars fetched by the aggregates benchmarks')
+    parser.add_argument('--tickers', type=int, default=1000,
+                        help='tickers fetched by the dividends benchmark')
+    parser.add_argument('--dividends', type=int, default=40,
+                        help='dividends served per ticker')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS)
+    parser.add_argument('--output', type=str, default=None,
+                        help='write the JSON results here (default stdout)')
+    parser.add_argument('--compare', type=str, default=None,
+                        help='a previous --output to compare against')
+    args = parser.parse_args()
+
+    document = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2)
+    else:
+        json.dump(document, sys.stdout, indent=2)
+        print()
+    print('\n'.join(report(document)), file=sys.stderr)
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n'.join(compare(document, json.load(f))), file=sys.stderr)
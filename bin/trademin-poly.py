@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 
 import argparse
+import contextlib
 import datetime
+import json
 import os
 import sys
 
@@ -19,10 +21,58 @@ except ImportError:
     import poly
 
 
-def run_marketstatus(args):
+@contextlib.contextmanager
+def _profiled(args):
     '''
+    With --profile (or --cprofile), record poly's spans (see
+    poly/instrument.py) while the command runs and report them at the end.
     '''
+    if not (args.profile or args.cprofile):
+        yield
+        return
+    recorder = poly.instrument.enable()
+    profiler = None
+    if args.cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+        poly.instrument.disable()
+        report = recorder.json() if args.profile == 'json' else recorder.table()
+        if args.profile_output:
+            with open(args.profile_output, 'w') as f:
+                print (report, file=f)
+        else:
+            print (report, file=sys.stderr)
+
+
+def _load_api_key(args):
+    '''
+    Load the api key and apply the config's rate limit ('requests_per_minute',
+    'requests_burst') to the api key's request scheduler. Requests are
+    recorded to or replayed from an archive with --record / --replay.
+    '''
+    if args.record:
+        poly.set_transport(poly.open_transport('record', args.record))
+    elif args.replay:
+        poly.set_transport(poly.open_transport('replay', args.replay))
+    else:
+        # a `serve` daemon runs many commands, do not keep the last one's
+        poly.set_transport(None)
     api_key = poly.load_api_key_from_path(args.config)
+    poly.get_scheduler(api_key, poly.load_config(args.config))
+    return api_key
+
+
+def run_marketstatus(args):
+    '''
+    '''
+    api_key = _load_api_key(args)
     poly.get_marketstatus(api_key)
 
 
@@ -48,8 +98,14 @@ def run_dividends(args):
     '''
     Display some basic information about a ticker's dividend events.
     '''
-    api_key = poly.load_api_key_from_path(args.config)
-    dividends = poly.get_dividends(api_key, args.tickers)
+    api_key = _load_api_key(args)
+    max_age_days = args.max_age_days
+    if max_age_days is None:
+        max_age_days = poly.load_config(args.config).get(
+            'dividend_max_age_days', poly.DEFAULT_DIVIDEND_MAX_AGE_DAYS)
+    store = None if args.no_store else poly.DividendStore(args.store)
+    dividends = poly.get_dividends(api_key, args.tickers, store=store,
+                                   max_age_days=max_age_days)
     for ticker, data in dividends.items():
         print (
         f'Summary: {ticker.upper()} as of {datetime.date.today()}\n'
@@ -60,49 +116,170 @@ def run_dividends(args):
             f'  Last:   ${data["last"]["amount"]} on {data["last"]["exDate"]}'
             )
             if data["next"].get("guess"):
-                print (f'  Next:   {data["next"]["exDate"]} (ESTIMATE)')
+                print (
+                f'  Next:   ${data["next"]["amount"]} on '
+                f'{data["next"]["exDate"]} (ESTIMATE)'
+                )
             else:
                 print (f'  Next:   {data["next"]["exDate"]}')
         print('---')
 
 
+def _convert_timestamps(bars):
+    isoformats = poly.timestamps_to_isoformat([bar['t'] for bar in bars])
+    for bar, isoformat in zip(bars, isoformats):
+        bar['t'] = isoformat
+
+
 def run_aggregates(args):
     '''
     Display ticker data as JSON
     '''
 
     # FIXME: make CONVERTING timetamps to isoformat OPTIONAL
-    api_key = poly.load_api_key_from_path(args.config)
-    aggregates = poly.get_ticker_aggregates(
-        api_key,
-        ticker=args.ticker,
+    tickers = list(args.tickers)
+    if args.universe:
+        tickers.extend(poly.load_universe(args.universe))
+    if not tickers:
+        sys.exit("aggregates: give at least one ticker or a --universe file")
+    if args.save_dir or len(tickers) > 1:
+        return run_universe_aggregates(args, tickers)
+
+    api_key = _load_api_key(args)
+    priority = args.priority or ('bulk' if args.save_as else 'interactive')
+    client = poly.get_client(api_key, priority)
+    query = dict(
+        ticker=tickers[0],
         from_=args.from_,
         to=args.to,
         multiplier=args.multiplier,
         timespan=args.timespan,
         unadjusted=args.unadjusted,
         sort=args.sort,
-        limit=args.limit
+        limit=args.limit,
+        max_workers=args.workers,
+        cache=None if args.no_cache else poly.BarCache(args.cache_dir)
         )
 
+    if args.from_minutes:
+        # fetch (or read from the cache) 1 minute bars, resample them locally
+        query.update(multiplier=1, timespan='minute', sort='asc')
+        minutes = client.get_ticker_aggregates(as_bars=True, **query)
+        bars = poly.resample.resample(minutes, args.multiplier, args.timespan)
+        results = bars.to_results()
+        if args.sort == 'desc':
+            results.reverse()
+        if not args.keep_epochs:
+            _convert_timestamps(results)
+        if args.save_as:
+            with poly.open_writer(args.save_as, args.format, True) as writer:
+                writer.write(results)
+        if not results:
+            print ("No results returned!")
+        return {'ticker': bars.ticker, 'status': 'OK',
+                'resultsCount': len(results), 'results': results}
+
+    if args.save_as:
+        # stream the bars to disk as each date window arrives
+        with poly.open_writer(args.save_as, args.format, True) as writer:
+            for bars in client.iter_ticker_aggregates(**query):
+                if not args.keep_epochs:
+                    _convert_timestamps(bars)
+                writer.write(bars)
+        if writer.count == 0:
+            print ("No results returned!")
+        return writer.count
+
+    aggregates = client.get_ticker_aggregates(**query)
     if aggregates['resultsCount'] == 0:
         print ("No results returned!")
         return aggregates
 
     if not args.keep_epochs:
-        modified_results = []
-        for result in aggregates['results']:
-            result['t'] = poly.timestamp_to_isoformat(result['t'])
-            modified_results.append(result)
-        aggregates['results'] = modified_results
-
-    if args.save_as:
-        poly.json_dump(args.save_as, aggregates['results'], True)
+        _convert_timestamps(aggregates['results'])
     return aggregates
 
 
-# This runs the script when executed from the commandline
-if __name__ == '__main__':
+def run_universe_aggregates(args, tickers):
+    '''
+    Save the bars of many tickers under --save-dir, one file per ticker and
+    date, then print a summary report.
+    '''
+    if not args.save_dir:
+        sys.exit("aggregates: many tickers need --save-dir")
+    if args.save_as or args.from_minutes:
+        sys.exit("aggregates: --save-as and --from-minutes take one ticker")
+    api_key = _load_api_key(args)
+    client = poly.get_client(api_key, args.priority or 'bulk')
+    done = []
+
+    def progress(ticker, report):
+        done.append(ticker)
+        error = report['failed'].get(ticker)
+        print (f'[{len(done)}/{report["tickers"]}] {ticker}'
+               f'{" FAILED: " + error if error else ""}',
+               file=sys.stderr, flush=True)
+
+    report = client.save_universe_aggregates(
+        tickers, args.save_dir, args.from_, args.to, args.multiplier,
+        args.timespan, args.unadjusted, args.limit, args.workers,
+        None if args.no_cache else poly.BarCache(args.cache_dir),
+        args.format or 'ndjson', not args.keep_epochs, args.max_tickers,
+        progress)
+    print (
+    f'Summary: {report["tickers"]} tickers in {report["seconds"]:.1f}s\n'
+    f'  Succeeded: {len(report["succeeded"])}\n'
+    f'  Failed:    {len(report["failed"])}\n'
+    f'  Bars:      {report["bars"]} in {report["files"]} files\n'
+    f'  Requests:  {report["requests"]}'
+    )
+    for ticker, error in report['failed'].items():
+        print (f'  {ticker}: {error}')
+    return report
+
+
+def run_stream(args):
+    '''
+    Print minute bars (one JSON object per line) as they stream in, until
+    interrupted.
+    '''
+    api_key = _load_api_key(args)
+    client = poly.StreamClient(api_key, args.tickers, channels=args.channels,
+                               buffer_size=args.buffer_size, url=args.url)
+
+    def print_bar(ticker, bar):
+        if not args.keep_epochs:
+            bar = dict(bar, t=poly.timestamp_to_isoformat(bar['t']))
+        print (json.dumps(dict(bar, ticker=ticker)), flush=True)
+
+    client.on('bar', print_bar)
+    try:
+        client.run(reconnect=5)
+    except KeyboardInterrupt:
+        client.close()
+
+
+def run_serve(args, parser):
+    '''
+    Run the resident daemon (see poly/daemon.py) until stopped, or stop the
+    one running with --stop.
+    '''
+    if args.stop:
+        if not poly.daemon.stop(args.socket):
+            sys.exit(f"serve: no daemon on {poly.daemon.socket_path(args.socket)}")
+        return
+    daemon = poly.daemon.Daemon(
+        lambda argv: run_command(parser.parse_args(argv), parser), args.socket)
+    print (f"trademin-poly serving on {daemon.path}", file=sys.stderr,
+           flush=True)
+    daemon.serve()
+
+
+# commands a running `serve` daemon runs in place of a new process
+FORWARDED_COMMANDS = ('marketstatus', 'dividends', 'aggregates')
+
+
+def build_parser():
     '''
     ```$> trademin-poly COMMAND```
     Available commmands
@@ -110,10 +287,29 @@ if __name__ == '__main__':
     * marketstatus : displays summary of current market status (open/closed)
     * dividends    : displays summary of dividends info for requested tickers
     * aggregates   : displays summary of ticker candle / bar data
+    * stream       : prints minute bars live from the Polygon.io websocket
+    * serve        : keeps a warm process running the commands above
     '''
     # Set-up the CLI parser
     parser = argparse.ArgumentParser()
     parser.add_argument('--config', type=str, default=poly.DEFAULT_CONFIG_PATH, help="")
+    parser.add_argument('--profile', nargs='?', const='table', default=None,
+                        choices=('table', 'json'),
+                        help="report where the time went (default as a table)")
+    parser.add_argument('--profile-output', type=str, metavar='FILE',
+                        default=None, help="write the report here, not stderr")
+    parser.add_argument('--cprofile', type=str, metavar='FILE', default=None,
+                        help="also save cProfile stats here (see pstats)")
+    transport = parser.add_mutually_exclusive_group()
+    transport.add_argument('--record', type=str, metavar='DIR', default=None,
+                           help="save every Polygon request and response to DIR")
+    transport.add_argument('--replay', type=str, metavar='DIR', default=None,
+                           help="answer Polygon requests from DIR, no network")
+    parser.add_argument('--socket', type=str, metavar='PATH', default=None,
+                        help="the serve daemon's socket (default "
+                        f"${poly.daemon.SOCKET_ENV} or ~/.config/trademin/poly.sock)")
+    parser.add_argument('--no-daemon', default=False, action='store_true',
+                        help="run here even if a serve daemon is running")
 
     subparser = parser.add_subparsers(dest="command")
 
@@ -128,10 +324,20 @@ if __name__ == '__main__':
     # commmand: `dividends`
     c_dividends = subparser.add_parser("dividends")
     c_dividends.add_argument('tickers', nargs='+', type=str, default=None)
+    c_dividends.add_argument('--store', type=str,
+                             default=poly.DEFAULT_DIVIDEND_STORE_PATH)
+    c_dividends.add_argument('--no-store', default=False, action='store_true')
+    c_dividends.add_argument('--max-age-days', type=float, default=None)
 
     # commmand: `aggregates`
     c_aggregates = subparser.add_parser("aggregates")
-    c_aggregates.add_argument('ticker', type=str, default=None)
+    c_aggregates.add_argument('tickers', nargs='*', type=str)
+    c_aggregates.add_argument('--universe', type=str, default=None,
+                              help="file of tickers to fetch as well")
+    c_aggregates.add_argument('--save-dir', type=str, default=None,
+                              help="save one file per ticker and date here")
+    c_aggregates.add_argument('--max-tickers', type=int,
+                              default=poly.DEFAULT_MAX_TICKERS)
     c_aggregates.add_argument('--from_', type=str, default='yesterday')
     c_aggregates.add_argument('--to', type=str, default='yesterday')
     c_aggregates.add_argument('--unadjusted', type=str, default='yesterday')  # FIXME BOOLEAN
@@ -139,19 +345,68 @@ if __name__ == '__main__':
     c_aggregates.add_argument('--timespan', type=str, default='minute')
     c_aggregates.add_argument('--limit', type=int, default=5000)
     c_aggregates.add_argument('--sort', type=str, default='asc')
+    c_aggregates.add_argument('--workers', type=int,
+                              default=poly.DEFAULT_MAX_WORKERS)
+    c_aggregates.add_argument('--cache-dir', type=str,
+                              default=poly.DEFAULT_CACHE_DIR)
+    c_aggregates.add_argument('--no-cache', default=False, action='store_true')
     c_aggregates.add_argument('--save-as', type=str)
+    c_aggregates.add_argument('--format', type=str, default=None,
+                              choices=sorted(poly.writers.WRITERS))
     c_aggregates.add_argument('--keep-epochs', default=False, action='store_true')
+    c_aggregates.add_argument('--from-minutes', default=False,
+                              action='store_true')
+    c_aggregates.add_argument('--priority', type=str, default=None,
+                              choices=poly.scheduler.PRIORITIES)
 
+    # commmand: `stream`
+    c_stream = subparser.add_parser("stream")
+    c_stream.add_argument('tickers', nargs='+', type=str)
+    c_stream.add_argument('--channels', nargs='+', type=str, default=['AM'],
+                          choices=poly.stream.CHANNELS)
+    c_stream.add_argument('--buffer-size', type=int,
+                          default=poly.stream.DEFAULT_BUFFER_SIZE)
+    c_stream.add_argument('--url', type=str,
+                          default=poly.stream.DEFAULT_STREAM_URL)
+    c_stream.add_argument('--keep-epochs', default=False, action='store_true')
 
-    args = parser.parse_args()
+    # command: `serve`
+    c_serve = subparser.add_parser("serve")
+    c_serve.add_argument('--stop', default=False, action='store_true',
+                         help="stop the running daemon")
+    return parser
 
-    if args.command == 'marketstatus':
-        run_marketstatus(args)
-    elif args.command == 'configure':
-        run_configure(args)
-    elif args.command == 'dividends':
-        run_dividends(args)
-    elif args.command == 'aggregates':
-        run_aggregates(args)
-    else:
-        print ("How may a help you? Try `trademin-poly --help`")
+
+def run_command(args, parser):
+    with _profiled(args):
+        if args.command == 'marketstatus':
+            run_marketstatus(args)
+        elif args.command == 'configure':
+            run_configure(args)
+        elif args.command == 'dividends':
+            run_dividends(args)
+        elif args.command == 'aggregates':
+            run_aggregates(args)
+        elif args.command == 'stream':
+            run_stream(args)
+        elif args.command == 'serve':
+            run_serve(args, parser)
+        else:
+            print ("How may a help you? Try `trademin-poly --help`")
+    return 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command in FORWARDED_COMMANDS and not args.no_daemon:
+        status = poly.daemon.forward(argv, args.socket)
+        if status is not None:
+            return status
+    return run_command(args, parser)
+
+
+# This runs the script when executed from the commandline
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,49 +8,232 @@ API services.
 # import pdb; pdb.set_trace()
 
 
+import collections
 import datetime
+import functools
+import importlib
 import json
 import os
-import pytz
 import re
+import threading
+import time
 
-import pandas
+# Heavy dependencies (numpy, pandas, requests, polygon) are only imported by
+# the functions which need them, or on first access of the names below (see
+# `__getattr__`), so `import poly` stays cheap for simple CLI commands.
+from . import instrument
+from .cache import (BarCache, CACHEABLE_TIMESPANS, DEFAULT_CACHE_DIR,
+                    is_cacheable)
+from .market import (DEFAULT_MARKET_STATUS_TTL, MarketStatus,
+                     MarketStatusCache, NEW_YORK)
+from .dividends import (DEFAULT_DIVIDEND_MAX_AGE_DAYS,
+                        DEFAULT_DIVIDEND_STORE_PATH, DividendStore,
+                        dividend_calendar)
+from .scheduler import RequestScheduler
+from .stream import StreamClient
+from . import trading_calendar
+from .transport import PassthroughTransport, ReplayMissError, open_transport
+from .writers import open_writer
 
-from polygon import RESTClient
+# name: (module, attribute or None for the module itself), imported on first
+# access as `poly.<name>`
+_LAZY_ATTRIBUTES = {
+    'RESTClient': ('polygon', 'RESTClient'),
+    'AsyncPolyClient': ('.aio', 'AsyncPolyClient'),
+    'aio': ('.aio', None),
+    'backtest': ('.backtest', None),
+    'Bars': ('.bars', 'Bars'),
+    'BarStore': ('.barstore', 'BarStore'),
+    'barstore': ('.barstore', None),
+    'bars': ('.bars', None),
+    'daemon': ('.daemon', None),
+    'indicators': ('.indicators', None),
+    'resample': ('.resample', None),
+    'sweep': ('.sweep', None),
+}
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, attribute = _LAZY_ATTRIBUTES[name]
+    value = importlib.import_module(module_name, __name__)
+    if attribute is not None:
+        value = getattr(value, attribute)
+    globals()[name] = value
+    return value
+
+def _lazy(name):
+    '''
+    Returns module attribute `name`, importing it first if it is lazy. Unlike
+    a bare name, this also sees values replaced by tests (monkeypatch).
+    '''
+    return globals()[name] if name in globals() else __getattr__(name)
 
 # the default path to where Polygon.io API key is found, under key 'api_key'
 DEFAULT_CONFIG_PATH = os.path.expanduser("~/.config/trademin/polygon.json")
 
+# every New York time in the package uses the same zoneinfo timezone
 TIMEZONES = {
-    'America/New York': pytz.timezone('America/New_York')
+    'America/New York': NEW_YORK
 }
 
+# configs already read, {path: ((mtime, size), config)}, see `load_config`
+_CONFIG_CACHE = {}
+
+# shared clients, one per api key and priority, see `get_client`
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+# the transport of every shared client, see `set_transport`
+_TRANSPORT = None
+
+# shared request schedulers, one per api key, see `get_scheduler`
+_SCHEDULERS = {}
+_SCHEDULERS_LOCK = threading.Lock()
+
+# connections kept alive per host by each PolyClient
+DEFAULT_POOL_SIZE = 16
+
+# environment variable overriding the Polygon.io API root of every PolyClient,
+# eg a local stand-in server (see benchmarks/fake_polygon.py)
+BASE_URL_ENV = 'POLY_BASE_URL'
+
+# all parsed dates are in UTC
+UTC = datetime.timezone.utc
+
+# strict 'YYYY-MM-DD' dates, which can skip dateutil entirely
+ISO_DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+# number of distinct date strings `date_parse` remembers
+DATE_PARSE_CACHE_SIZE = 8192
+
+# Polygon counts `limit` against the *base* aggregates used to build the bars,
+# minute bars for intraday timespans and daily bars for anything coarser.
+# An extended hours session (04:00 - 20:00 New York) has at most 960 minutes.
+BASE_AGGREGATES_PER_DAY = {
+    'minute': 960,
+    'hour': 960,
+    'day': 1,
+    'week': 1,
+    'month': 1,
+    'quarter': 1,
+    'year': 1,
+}
+
+# ticker prefixes of markets trading every day (crypto and forex), which do
+# not follow the NYSE trading calendar
+ROUND_THE_CLOCK_PREFIXES = ('X:', 'C:')
+
+# timespans whose requests are planned around trading sessions, coarser bars
+# are requested by calendar date
+TRADING_CALENDAR_TIMESPANS = ('minute', 'hour', 'day')
+
+# default number of concurrent requests used for chunked aggregate queries
+DEFAULT_MAX_WORKERS = 4
+
+# default number of tickers fetched at once by `save_universe_aggregates`
+DEFAULT_MAX_TICKERS = 4
+
 ## Generic functions ##
 def timestamp_to_isoformat(ts):
-    # FIXME: We're assuming hardcoded conversion to NEW YORK timezone from local
-    dt_local = datetime.datetime.fromtimestamp(ts/1000.0)
-    dt_new_york_timezone = dt_local.astimezone(TIMEZONES['America/New York'])
+    '''
+    Convert a Unix msec timestamp to an ISO 8601 string in New York time.
+    eg, 1609770600000 -> '2021-01-04T09:30:00-05:00'
+    '''
+    dt_utc = datetime.datetime.fromtimestamp(ts/1000.0, tz=datetime.timezone.utc)
+    dt_new_york_timezone = dt_utc.astimezone(TIMEZONES['America/New York'])
     dt_string = dt_new_york_timezone.isoformat()
     return dt_string
 
-def date_parse(date_string, as_date=True):
-    from dateutil.parser import parse as dtparse
+def timestamps_to_datetime64(timestamps):
+    '''
+    Convert a sequence of Unix msec timestamps to a timezone aware
+    pandas.DatetimeIndex in New York time, in a single vectorized pass.
+    '''
+    import numpy
+    import pandas
+    return pandas.to_datetime(
+        numpy.asarray(timestamps, dtype='int64'), unit='ms', utc=True
+        ).tz_convert(TIMEZONES['America/New York'])
+
+@instrument.timed('timestamps_to_isoformat')
+def timestamps_to_isoformat(timestamps):
+    '''
+    Batch version of `timestamp_to_isoformat`. Converts a sequence of Unix
+    msec timestamps to a list of ISO 8601 strings in New York time, without
+    calling into zoneinfo or datetime once per timestamp.
+    '''
+    import numpy
+    utc_ms = numpy.asarray(timestamps, dtype='int64')
+    if not len(utc_ms):
+        return []
+    local = timestamps_to_datetime64(utc_ms)
+    local_ms = local.tz_localize(None).as_unit('ms').asi8
+    offsets = (local_ms - utc_ms) // 1000
 
-    class simple_utc(datetime.tzinfo):
-        def tzname(self,**kwargs):
-            return "UTC"
-        def utcoffset(self, dt):
-            return datetime.timedelta(0)
+    local_dt = local_ms.astype('datetime64[ms]')
+    stamps = numpy.datetime_as_string(local_dt, unit='s').astype('<U26')
+    # isoformat only shows the fractional part when there is one
+    fractional = (utc_ms % 1000) != 0
+    if fractional.any():
+        stamps[fractional] = numpy.datetime_as_string(local_dt[fractional],
+                                                      unit='us')
 
-    date_string = date_string.strip().lower()
-    if date_string == 'today':
-        date = datetime.datetime.utcnow()
-    elif date_string == 'yesterday':
-        date = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+    # there are only ever a couple of distinct offsets (EST / EDT)
+    offset_strings = numpy.empty(len(offsets), dtype='<U6')
+    for offset in numpy.unique(offsets):
+        sign = '-' if offset < 0 else '+'
+        hours, minutes = divmod(abs(int(offset)) // 60, 60)
+        offset_strings[offsets == offset] = f'{sign}{hours:02d}:{minutes:02d}'
+    return numpy.char.add(stamps, offset_strings).tolist()
+
+def timestamp_to_date(ts):
+    '''
+    Returns the New York date (datetime.date) of a Unix msec timestamp.
+    '''
+    dt_utc = datetime.datetime.fromtimestamp(ts/1000.0, tz=datetime.timezone.utc)
+    return dt_utc.astimezone(TIMEZONES['America/New York']).date()
+
+@functools.lru_cache(maxsize=DATE_PARSE_CACHE_SIZE)
+def _parse_date_string(date_string):
+    '''
+    Parse an absolute (not relative, like 'today') date string into a UTC
+    datetime. Plain ISO 'YYYY-MM-DD' strings take a fast path, anything else
+    falls back to dateutil. Results are memoized since the same dates (eg,
+    dividend exDates) are parsed over and over again.
+    '''
+    if ISO_DATE_PATTERN.match(date_string):
+        date = datetime.datetime.fromisoformat(date_string)
     else:
+        from dateutil.parser import parse as dtparse
         date = dtparse(date_string)
+    return date.replace(tzinfo=UTC)
 
-    date_tzinfo = date.replace(tzinfo=simple_utc())
+@instrument.timed('date_parse')
+def date_parse(date_string, as_date=True, trading=False):
+    '''
+    Parse a date string, eg '2021-01-04', 'Jan 4 2021', 'today' or
+    'yesterday', into a UTC datetime.date (or datetime.datetime if `as_date`
+    is False).
+
+    trading: resolve 'today' and 'yesterday' to trading sessions instead, in
+        New York: 'today' is the latest trading day (today, unless it is a
+        weekend or holiday) and 'yesterday' the trading day before today.
+    '''
+    date_string = date_string.strip().lower()
+    if trading and date_string in ('today', 'yesterday'):
+        today = trading_calendar.new_york_today()
+        if date_string == 'today':
+            day = trading_calendar.last_trading_day(today)
+        else:
+            day = trading_calendar.previous_trading_day(today)
+        date_tzinfo = datetime.datetime.combine(day, datetime.time(), UTC)
+    elif date_string == 'today':
+        date_tzinfo = datetime.datetime.now(UTC)
+    elif date_string == 'yesterday':
+        date_tzinfo = datetime.datetime.now(UTC) - datetime.timedelta(days=1)
+    else:
+        date_tzinfo = _parse_date_string(date_string)
 
     if as_date:
         date = date_tzinfo.date()
@@ -59,6 +242,15 @@ def date_parse(date_string, as_date=True):
 
     return date
 
+def date_parse_many(date_strings, as_date=True):
+    '''
+    Batch version of `date_parse`. Each distinct string is only parsed once.
+    Returns a list of dates in the same order as `date_strings`.
+    '''
+    parsed = {date_string: date_parse(date_string, as_date)
+              for date_string in set(date_strings)}
+    return [parsed[date_string] for date_string in date_strings]
+
 def json_dump(path, data, overwrite=False):
     '''
     Dump any data to a (temporary) json file.
@@ -142,20 +334,27 @@ def load_config(config_path):
     Expects a valid path (optional) to JSON file that contains a dictionary with
     various configuration options related to polygon.io API services.
 
-    Returns the full configuration dictionary object.
+    Returns the full configuration dictionary object. The file is only read
+    again once it changes (eg, for the many commands of a `serve` daemon).
     Raises an expection is error has occurred.
     '''
+    stat = os.stat(config_path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _CONFIG_CACHE.get(config_path)
+    if cached is not None and cached[0] == version:
+        return dict(cached[1])
     try:
         with open(config_path) as _config_path:
             config = json.load(_config_path)
     except json.JSONDecodeError:
-        if os.stat(config_path).st_size == 0:
+        if stat.st_size == 0:
             # FIXME: DEBUG
             print ("Config file is empty.")
             config = {}
         else:
             raise json.JSONDecodeError(f"Invalid JSON Detected. Check {config_path}.")
-    return config
+    _CONFIG_CACHE[config_path] = (version, config)
+    return dict(config)
 
 def load_api_key_from_path(config_path):
     '''
@@ -219,30 +418,312 @@ def save_api_key_to_path(api_key, config_path, overwrite=False):
     return True
 
 
+## API Client ##
+
+def _record_response(response, *args, **kwargs):
+    '''
+    requests response hook, records an 'http' span (see `instrument`).
+    '''
+    if instrument.enabled():
+        instrument.record('http', response.elapsed.total_seconds(),
+                          status=response.status_code,
+                          bytes=len(response.content))
+
+class PolyClient:
+    '''
+    Long lived client for Polygon.io API services. Owns one pooled,
+    keep-alive HTTP session, so consecutive calls (many tickers, chunked
+    date ranges, repeated status checks) reuse warm connections instead of
+    paying connection and TLS setup every time.
+
+    Safe to share across threads. Every API wrapper function in this module
+    is available as a method, eg,
+        with PolyClient(api_key) as client:
+            status = client.get_marketstatus(verbose=False)
+            dividends = client.get_dividends(['BAC', 'T'])
+
+    The module level functions (`get_marketstatus(api_key, ...)` etc) are
+    shortcuts onto a client shared by every caller using the same api key,
+    see `get_client`.
+
+    Every request goes through `scheduler` (by default the one shared by
+    the api key, see `get_scheduler`) in the `priority` lane, 'interactive'
+    or 'bulk'. eg, for a backfill that should give way to everything else,
+        client = PolyClient(api_key, priority='bulk')
+
+    `base_url` replaces the Polygon.io API root (default $POLY_BASE_URL, or
+    polygon's own host), eg 'http://127.0.0.1:8000' for a local stand-in.
+
+    `transport` records or replays requests (see `transport.py`), eg
+        client = PolyClient(api_key, transport=open_transport('replay', dir))
+    '''
+
+    def __init__(self, api_key, pool_size=DEFAULT_POOL_SIZE, timeout=None,
+                 scheduler=None, priority='interactive', base_url=None,
+                 transport=None):
+        self.api_key = api_key
+        self.scheduler = scheduler or get_scheduler(api_key)
+        self.priority = priority
+        self.transport = transport or PassthroughTransport()
+
+        import requests
+        import requests.adapters
+        self.session = requests.Session()
+        self.session.params['apiKey'] = api_key
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.hooks['response'].append(_record_response)
+
+        # polygon's RESTClient builds the requests and unmarshals responses,
+        # but sends them through our pooled session
+        self._rest = _lazy('RESTClient')(api_key)
+        if getattr(self._rest, '_session', None) is not None:
+            self._rest._session.close()
+        self._rest._session = self.session
+        self._rest.timeout = timeout
+        base_url = base_url or os.environ.get(BASE_URL_ENV)
+        if base_url:
+            self._rest.url = base_url.rstrip('/')
+
+        self._lock = threading.Lock()
+        self._market_status_cache = None
+        # requests made (or replayed) by this client
+        self.request_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def _request(self, endpoint, *args, **kwargs):
+        '''
+        Request the RESTClient `endpoint` method through the transport.
+        '''
+        with self._lock:
+            self.request_count += 1
+        return self.transport.request(self._send, endpoint, *args, **kwargs)
+
+    def _send(self, endpoint, *args, **kwargs):
+        '''
+        Call the RESTClient `endpoint` method through the scheduler.
+        '''
+        return self.scheduler.call(getattr(self._rest, endpoint), *args,
+                                   priority=self.priority, **kwargs)
+
+    def market_status_cache(self, ttl=DEFAULT_MARKET_STATUS_TTL):
+        '''
+        Returns this client's `MarketStatusCache`, see `market_status_cache`.
+        '''
+        with self._lock:
+            if self._market_status_cache is None:
+                self._market_status_cache = MarketStatusCache(
+                    functools.partial(_fetch_marketstatus, self), ttl)
+            self._market_status_cache.ttl = ttl
+        return self._market_status_cache
+
+    def get_marketstatus(self, ttl=DEFAULT_MARKET_STATUS_TTL, verbose=True,
+                         **query_params):
+        '''
+        See `get_marketstatus`.
+        '''
+        if ttl and not query_params:
+            status = self.market_status_cache(ttl).get()
+        else:
+            status = _fetch_marketstatus(self, **query_params)
+        if verbose:
+            print(status.template())
+        return status
+
+    def get_dividends(self, tickers, store=None,
+                      max_age_days=DEFAULT_DIVIDEND_MAX_AGE_DAYS,
+                      **query_params):
+        '''
+        See `get_dividends`.
+        '''
+        symbols = list(dict.fromkeys(symbol.upper() for symbol in tickers))
+        if store is not None:
+            stale = store.stale_tickers(symbols, max_age_days)
+        else:
+            stale = symbols
+
+        results = {}
+        counts = {}
+        for symbol in stale:
+            resp = self._request('reference_stock_dividends', symbol,
+                                 **query_params)
+            results[symbol] = getattr(resp, 'results', None) or []
+            counts[symbol] = resp.count
+        return _summarize_dividends(symbols, stale, results, counts, store)
+
+    def get_ticker_aggregates(self, ticker, from_='yesterday', to='yesterday',
+                        multiplier=1, timespan='minute', unadjusted=True,
+                        sort='asc', limit=5000, max_workers=DEFAULT_MAX_WORKERS,
+                        cache=None, as_bars=False, **query_params):
+        '''
+        See `get_ticker_aggregates`.
+        '''
+        symbol = ticker.upper()
+        trading = follows_trading_calendar(symbol)
+        responses = _iter_aggregate_responses(
+            self, symbol, date_parse(from_, trading=trading),
+            date_parse(to, trading=trading), multiplier, timespan, unadjusted,
+            sort, limit, max_workers, cache, **query_params)
+        if as_bars:
+            from .bars import Bars
+            return Bars.concat(
+                (Bars.from_results(data.get('results') or [])
+                 for data in responses), ticker=symbol)
+        # a range without trading sessions needs no request at all
+        return _merge_aggregates(
+            list(responses) or [_cached_response(symbol, unadjusted, [])],
+            sort)
+
+    def iter_ticker_aggregates(self, ticker, from_='yesterday', to='yesterday',
+                        multiplier=1, timespan='minute', unadjusted=True,
+                        sort='asc', limit=5000, max_workers=DEFAULT_MAX_WORKERS,
+                        cache=None, **query_params):
+        '''
+        See `iter_ticker_aggregates`.
+        '''
+        symbol = ticker.upper()
+        trading = follows_trading_calendar(symbol)
+        responses = _iter_aggregate_responses(
+            self, symbol, date_parse(from_, trading=trading),
+            date_parse(to, trading=trading), multiplier, timespan, unadjusted,
+            sort, limit, max_workers, cache, **query_params)
+        for data in responses:
+            bars = {bar['t']: bar for bar in data.get('results') or []}
+            if bars:
+                yield [bars[t] for t in sorted(bars, reverse=(sort == 'desc'))]
+
+    def save_universe_aggregates(self, tickers, directory, from_='yesterday',
+                        to='yesterday', multiplier=1, timespan='minute',
+                        unadjusted=True, limit=5000,
+                        max_workers=DEFAULT_MAX_WORKERS, cache=None,
+                        format='ndjson', isoformat=False,
+                        max_tickers=DEFAULT_MAX_TICKERS, progress=None,
+                        **query_params):
+        '''
+        See `save_universe_aggregates`.
+        '''
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        symbols = list(dict.fromkeys(ticker.upper() for ticker in tickers))
+        started = time.monotonic()
+        requests = self.request_count
+        report = {'tickers': len(symbols), 'succeeded': [], 'failed': {},
+                  'bars': 0, 'files': 0}
+
+        with ThreadPoolExecutor(max_workers=max(max_tickers, 1)) as executor:
+            futures = {
+                executor.submit(
+                    _save_partitioned, self, symbol, directory, format,
+                    isoformat, from_=from_, to=to, multiplier=multiplier,
+                    timespan=timespan, unadjusted=unadjusted, limit=limit,
+                    max_workers=max_workers, cache=cache, **query_params):
+                symbol for symbol in symbols}
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    bars, files = future.result()
+                except Exception as error:
+                    report['failed'][symbol] = f'{type(error).__name__}: {error}'
+                else:
+                    report['succeeded'].append(symbol)
+                    report['bars'] += bars
+                    report['files'] += files
+                if progress is not None:
+                    progress(symbol, report)
+
+        report['succeeded'].sort(key=symbols.index)
+        report['requests'] = self.request_count - requests
+        report['seconds'] = time.monotonic() - started
+        return report
+
+def get_client(api_key, priority='interactive'):
+    '''
+    Returns the `PolyClient` shared by every caller using `api_key` in the
+    `priority` lane, creating it on first use. Clients of both lanes share
+    the api key's scheduler.
+    '''
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get((api_key, priority))
+        if client is None:
+            client = _CLIENTS[(api_key, priority)] = PolyClient(
+                api_key, priority=priority, transport=_TRANSPORT)
+    return client
+
+def set_transport(transport):
+    '''
+    Use `transport` (see `transport.open_transport`) for every shared client,
+    current and future, eg to replay a recorded session from the CLI. None
+    goes back to sending requests.
+    '''
+    global _TRANSPORT
+    with _CLIENTS_LOCK:
+        _TRANSPORT = transport
+        for client in _CLIENTS.values():
+            client.transport = transport or PassthroughTransport()
+
+def get_scheduler(api_key, config=None):
+    '''
+    Returns the `RequestScheduler` shared by every client using `api_key`,
+    creating it on first use. When `config` (as returned by `load_config`)
+    is given, the rate limit is (re)configured from its
+    'requests_per_minute' and 'requests_burst' options.
+    '''
+    with _SCHEDULERS_LOCK:
+        scheduler = _SCHEDULERS.get(api_key)
+        if scheduler is None:
+            scheduler = _SCHEDULERS[api_key] = RequestScheduler()
+    if config is not None:
+        scheduler.configure(config.get('requests_per_minute'),
+                            config.get('requests_burst', 1))
+    return scheduler
+
+def close_clients():
+    '''
+    Close and forget every shared client created by `get_client`.
+    '''
+    with _CLIENTS_LOCK:
+        clients = list(_CLIENTS.values())
+        _CLIENTS.clear()
+    for client in clients:
+        client.close()
+
+
 ## API Wrapper funtions ##
 
-def get_marketstatus(api_key, **query_params):
+def _fetch_marketstatus(client, **query_params):
+    resp = client._request('reference_market_status', **query_params)
+    return MarketStatus.from_response(resp)
+
+def market_status_cache(api_key, ttl=DEFAULT_MARKET_STATUS_TTL):
+    '''
+    Returns the `MarketStatusCache` shared by every caller using `api_key`,
+    eg to ask `market_status_cache(api_key).is_open('nyse', at)`.
+    '''
+    return get_client(api_key).market_status_cache(ttl)
+
+def get_marketstatus(api_key, ttl=DEFAULT_MARKET_STATUS_TTL, verbose=True,
+                     **query_params):
     '''
-    Call Polygon API `marketstatus` and print the resulting data onscreen.
+    Call Polygon API `marketstatus` and print the resulting data onscreen
+    (unless `verbose` is False).
+
+    Returns a `MarketStatus` object. Statuses are cached for up to `ttl`
+    seconds, or until the next session boundary (see `market.py`), so
+    repeated calls rarely need a request. Set `ttl` to 0 to always query.
     eg,
+        status = get_marketstatus(api_key, verbose=False)
+        status.is_open('nyse')
     '''
-    with RESTClient(api_key) as client:
-        resp = client.reference_market_status(**query_params)
-    nyse = resp.exchanges['nyse']
-    nasdaq = resp.exchanges['nasdaq']
-    otc = resp.exchanges['otc']
-    fx = resp.currencies['fx']
-    crypto = resp.currencies['crypto']
-    template = (f'As of {resp.serverTime}\n'
-                f'  Global Crypto:\t{crypto}\n'
-                f'  Global FX:\t\t{fx}\n'
-                f'  US Stocks:\t\t{resp.market}\n'
-                f'\tNYSE:\t\t{nyse}\n'
-                f'\tNASDAQ:\t\t{nasdaq}\n'
-                f'\tOTC:\t\t{otc}\n'
-    )
-    print(template)
-    return resp
+    return get_client(api_key).get_marketstatus(ttl, verbose, **query_params)
 
 def _get_next_dividend(results, guess=True):
     '''
@@ -263,81 +744,349 @@ def _get_next_dividend(results, guess=True):
     If there is not, then we should guess (if guess is True) the next month
     when the dividend will be based on looking for the most common months
     dividends occured in the past.
+
+    Single ticker shortcut for `dividends.dividend_calendar`.
     '''
     # there are no dividends to work with
     if not results:
         return None
-
-    # grab the most recent dividend
-    most_recent = sorted(results, key=lambda x: date_parse(x['exDate']))[-1]
-
-    # Check if most recent known is in the past
-    next_dividend = None
-    now = datetime.date.today()
-    if date_parse(most_recent['exDate']).date() < now:
-        # if in the past, we can only guess when the next dividend will occur
-        if guess:
-            # Lets try to guess based on previous exDate's
-            df = pandas.DataFrame(results).sort_values(['exDate'],
-                                                       ascending=False)
-            # Get all the months past dividends were executed in
-            df['month'] = df.exDate.apply(lambda x: x.split('-')[1])
-            # identify top 4 most common months
-            most_common_months = sorted(
-                df.groupby('month').count()['ticker'].sort_values(
-                    ascending=False)[0:4].index.values)
-            # find index of the next future month which closest to today
-            this_month = datetime.datetime.now().month
-            # set december to 0 value for simpler sorting
-            this_month = 0 if this_month == 12 else this_month
-            closest_month = sorted(most_common_months,
-                key = lambda x: int(x) < this_month)[0]
-
-            guess_result = df[
-                df.exDate.str.contains('-'+closest_month+'-')].iloc[0].to_dict()
-            guess_exDate_dt = date_parse(guess_result['exDate'])
-            next_dividend = {
-                'ticker': guess_result['ticker'],
-                'guess': 1,
-                'exDate': re.sub(r"^\d\d\d\d",
-                                 str(guess_exDate_dt.year + 1),
-                                 guess_result['exDate'])
-                }
-        else:
-            pass # Otherwise, move on, we don't want to guess
-    else:
-        next_dividend = most_recent
-
-    return next_dividend
+    ticker = results[0].get('ticker')
+    calendar = dividend_calendar({ticker: results}, guess=guess)
+    return calendar[ticker]['next']
 
 def _get_last_dividend(results):
     if not results:
         return None
     # grab the most recent dividend
-    last_dividend = sorted(results, key=lambda x: date_parse(x['exDate']))[-1]
-    return last_dividend
+    ticker = results[0].get('ticker')
+    calendar = dividend_calendar({ticker: results}, guess=False)
+    return calendar[ticker]['last']
 
-def get_dividends(api_key, tickers, **query_params):
+def _summarize_dividends(symbols, stale, results, counts, store=None):
     '''
-    Call Polygon API `reference/dividends` for input tickers and display a
-    summary of the results
-    '''
-    with RESTClient(api_key) as client:
-        dividends = {}
-        for symbol in tickers:
-            symbol = symbol.upper()
-            resp = client.reference_stock_dividends(symbol, **query_params)
-            dividends[symbol] = {
-                'count': resp.count,
-                'results': resp.results,
-                'last': _get_last_dividend(resp.results),
-                'next': _get_next_dividend(resp.results)
-                }
+    Completes `get_dividends` once the `stale` tickers have been fetched
+    (their `results` and `counts`): loads the others from `store`, works out
+    every ticker's last and next dividend and saves the fetched ones.
+    '''
+    for symbol in symbols:
+        if symbol not in results:
+            results[symbol] = store.load(symbol)
+            counts[symbol] = store.count(symbol)
+    calendar = dividend_calendar(
+        {symbol: results[symbol] for symbol in symbols})
+
+    if store is not None:
+        for symbol in stale:
+            next_dividend = calendar[symbol]['next']
+            store.save(symbol, results[symbol], counts[symbol],
+                       next_dividend['exDate'] if next_dividend else None)
+
+    dividends = {}
+    for symbol in symbols:
+        dividends[symbol] = {
+            'count': counts[symbol],
+            'results': results[symbol],
+            'last': calendar[symbol]['last'],
+            'next': calendar[symbol]['next']
+            }
     return dividends
 
+def get_dividends(api_key, tickers, store=None,
+                  max_age_days=DEFAULT_DIVIDEND_MAX_AGE_DAYS, **query_params):
+    '''
+    Call Polygon API `reference/dividends` for input tickers and display a
+    summary of the results.
+
+    The last and next (or guessed next) dividend of every ticker is worked
+    out in one pass by `dividends.dividend_calendar`.
+
+    store: (default = None) A `DividendStore` holding previously fetched
+        histories. Only tickers that are missing from it, older than
+        `max_age_days`, or whose next exDate has been reached since they were
+        last refreshed are requested from Polygon; the rest come from the
+        store.
+    '''
+    return get_client(api_key).get_dividends(tickers, store, max_age_days,
+                                             **query_params)
+
+def follows_trading_calendar(ticker):
+    '''
+    True if the bars of `ticker` only exist in NYSE trading sessions (stocks,
+    not crypto or forex).
+    '''
+    return not ticker.upper().startswith(ROUND_THE_CLOCK_PREFIXES)
+
+def _aggregate_windows(dt_from, dt_to, timespan, limit, trading=False):
+    '''
+    Split the inclusive date range `dt_from` - `dt_to` into a list of
+    (from, to) date tuples, each small enough that a single aggregates request
+    should not be truncated by `limit`.
+
+    trading: size windows by the expected bars of each NYSE trading session
+        (so early closes count less, and weekends and holidays not at all).
+        A range without any trading day gets no windows.
+    '''
+    if trading and timespan in TRADING_CALENDAR_TIMESPANS:
+        return _trading_windows(dt_from, dt_to, timespan, limit)
+    per_day = BASE_AGGREGATES_PER_DAY.get(timespan, 1)
+    window_days = max(limit // per_day, 1)
+
+    windows = []
+    start = dt_from
+    while start <= dt_to:
+        end = min(start + datetime.timedelta(days=window_days - 1), dt_to)
+        windows.append((start, end))
+        start = end + datetime.timedelta(days=1)
+    return windows
+
+def _trading_windows(dt_from, dt_to, timespan, limit):
+    '''
+    See `_aggregate_windows`. Each window holds as many trading sessions as
+    fit in `limit` base aggregates, and takes in the closed days around them
+    (which cost nothing to request) so the windows still cover the range.
+    '''
+    days = trading_calendar.trading_days(dt_from, dt_to)
+    if not days:
+        return []
+    one_day = datetime.timedelta(days=1)
+    windows = []
+    start = dt_from
+    expected = 0
+    for previous, day in zip([None] + days, days):
+        if timespan == 'day':
+            bars = 1
+        else:
+            bars = trading_calendar.session_minutes(day)
+        if expected and expected + bars > limit:
+            windows.append((start, previous))
+            start, expected = previous + one_day, 0
+        expected += bars
+    windows.append((start, dt_to))
+    return windows
+
+def _fetch_aggregates_window(client, symbol, multiplier, timespan,
+                             dt_from, dt_to, limit, **query_params):
+    '''
+    Fetch a single window of aggregates. If the response looks truncated
+    (it hit `limit`) and the window spans more than one day, split the window
+    in half and fetch both halves instead.
+
+    Returns a list of response dictionaries.
+    '''
+    resp = client._request(
+        'stocks_equities_aggregates',
+        ticker=symbol,
+        multiplier=multiplier,
+        timespan=timespan,
+        from_=dt_from,
+        to=dt_to,
+        limit=limit,
+        **query_params)
+    data = resp.__dict__
+
+    if data.get('resultsCount', 0) >= limit and dt_from < dt_to:
+        middle = dt_from + (dt_to - dt_from) / 2
+        return (
+            _fetch_aggregates_window(client, symbol, multiplier, timespan,
+                                     dt_from, middle, limit, **query_params) +
+            _fetch_aggregates_window(client, symbol, multiplier, timespan,
+                                     middle + datetime.timedelta(days=1),
+                                     dt_to, limit, **query_params))
+    return [data]
+
+@instrument.timed('aggregates.merge')
+def _merge_aggregates(responses, sort='asc'):
+    '''
+    Merge a list of aggregate response dictionaries into a single response,
+    de-duplicating bars on their timestamp and ordering them by `sort`.
+    '''
+    bars = {}
+    for data in responses:
+        for bar in data.get('results') or []:
+            bars[bar['t']] = bar
+    results = [bars[t] for t in sorted(bars, reverse=(sort == 'desc'))]
+
+    merged = dict(responses[0]) if responses else {}
+    merged['queryCount'] = sum(data.get('queryCount', 0) for data in responses)
+    merged['resultsCount'] = len(results)
+    merged['results'] = results
+    return merged
+
+def _store_in_cache(cache, cache_key, ranges, responses, limit):
+    '''
+    Save freshly fetched bars into `cache`, one entry per date in `ranges`.
+    Dates without bars are stored as empty so they are not requested again.
+    Today and future dates are skipped since they may not be complete yet,
+    and so are dates covered by a response that hit `limit` (a single day
+    window that is still truncated).
+    '''
+    today = datetime.datetime.now(TIMEZONES['America/New York']).date()
+    bars_by_date = {}
+    for r_from, r_to in ranges:
+        day = r_from
+        while day <= r_to and day < today:
+            bars_by_date[day] = []
+            day += datetime.timedelta(days=1)
+
+    truncated = set()
+    for data in responses:
+        results = data.get('results') or []
+        if data.get('resultsCount', 0) >= limit:
+            truncated.update(timestamp_to_date(bar['t']) for bar in results)
+            continue
+        for bar in results:
+            day = timestamp_to_date(bar['t'])
+            if day in bars_by_date:
+                bars_by_date[day].append(bar)
+    for day in truncated:
+        bars_by_date.pop(day, None)
+
+    for bars in bars_by_date.values():
+        bars.sort(key=lambda bar: bar['t'])
+    if bars_by_date:
+        cache.store(cache_key, bars_by_date)
+
+def _plan_aggregate_segments(cache, cache_key, dt_from, dt_to, timespan,
+                             limit, trading=False):
+    '''
+    Plan the date windows of an aggregates query in date order, as a list of
+    (source, from, to) tuples, where source is 'fetch' (a request sized by
+    `_aggregate_windows`, for trading sessions only if `trading`) or 'cache'
+    (dates already in `cache`, if any).
+    '''
+    one_day = datetime.timedelta(days=1)
+    if cache is not None:
+        missing = cache.missing_ranges(cache_key, dt_from, dt_to)
+    else:
+        missing = [(dt_from, dt_to)]
+
+    segments = []
+    day = dt_from
+    for m_from, m_to in missing:
+        if day < m_from:
+            segments.append(('cache', day, m_from - one_day))
+        segments.extend(
+            ('fetch', w_from, w_to)
+            for w_from, w_to in _aggregate_windows(m_from, m_to, timespan,
+                                                   limit, trading))
+        day = m_to + one_day
+    if cache is not None and day <= dt_to:
+        segments.append(('cache', day, dt_to))
+    return segments
+
+def _cached_response(symbol, unadjusted, results):
+    '''
+    Wraps bars read from the cache like an aggregates response.
+    '''
+    return {
+        'ticker': symbol,
+        'status': 'OK',
+        'adjusted': not unadjusted,
+        'queryCount': 0,
+        'results': results}
+
+def _iter_aggregate_responses(client, symbol, dt_from, dt_to, multiplier,
+                              timespan, unadjusted, sort, limit, max_workers,
+                              cache, **query_params):
+    '''
+    Generator behind `get_ticker_aggregates` and `iter_ticker_aggregates`.
+
+    Yields response dictionaries one date window at a time, in `sort` order.
+    Windows missing from `cache` are fetched concurrently, at most
+    2 * `max_workers` windows ahead of the consumer, and saved to the cache as
+    they arrive. Cached windows are read back from disk.
+    '''
+    if cache is not None and not is_cacheable(multiplier, timespan):
+        cache = None
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.key(symbol, multiplier, timespan, unadjusted)
+    segments = _plan_aggregate_segments(cache, cache_key, dt_from, dt_to,
+                                        timespan, limit,
+                                        follows_trading_calendar(symbol))
+    if sort == 'desc':
+        segments.reverse()
+    segments = iter(segments)
+
+    from concurrent.futures import ThreadPoolExecutor
+    max_workers = max(max_workers, 1)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    queue = collections.deque()
+
+    def fill_queue():
+        while sum(future is not None for *_, future in queue) < 2 * max_workers:
+            segment = next(segments, None)
+            if segment is None:
+                return
+            source, s_from, s_to = segment
+            future = None
+            if source == 'fetch':
+                future = executor.submit(
+                    _fetch_aggregates_window, client, symbol, multiplier,
+                    timespan, s_from, s_to, limit,
+                    unadjusted='true' if unadjusted else 'false',
+                    **query_params)
+            queue.append((s_from, s_to, future))
+
+    try:
+        fill_queue()
+        while queue:
+            s_from, s_to, future = queue.popleft()
+            fill_queue()
+            if future is None:
+                yield _cached_response(symbol, unadjusted,
+                                       cache.load(cache_key, s_from, s_to))
+                continue
+
+            responses = future.result()
+            if cache is not None:
+                _store_in_cache(cache, cache_key, [(s_from, s_to)], responses,
+                                limit)
+            if sort == 'desc':
+                responses.reverse()
+            yield from responses
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def _save_partitioned(client, symbol, directory, format, isoformat,
+                      **aggregates_query):
+    '''
+    Write the bars of `symbol` to one `format` file per New York date, under
+    `directory`/`symbol`/. Returns the number of (bars, files) written.
+    '''
+    ticker_dir = os.path.join(directory, symbol)
+    os.makedirs(ticker_dir, exist_ok=True)
+    counts = [0, 0]
+
+    def write(day, bars):
+        if isoformat:
+            isoformats = timestamps_to_isoformat([bar['t'] for bar in bars])
+            bars = [dict(bar, t=stamp) for bar, stamp in zip(bars, isoformats)]
+        path = os.path.join(ticker_dir, f'{day.isoformat()}.{format}')
+        with open_writer(path, format, overwrite=True) as writer:
+            writer.write(bars)
+        counts[0] += len(bars)
+        counts[1] += 1
+
+    # windows arrive in date order, only the latest date of a window may
+    # continue in the next one
+    pending = {}
+    for bars in client.iter_ticker_aggregates(symbol, sort='asc',
+                                              **aggregates_query):
+        for bar in bars:
+            pending.setdefault(timestamp_to_date(bar['t']), []).append(bar)
+        latest = max(pending)
+        for day in sorted(pending):
+            if day != latest:
+                write(day, pending.pop(day))
+    for day in sorted(pending):
+        write(day, pending[day])
+    return tuple(counts)
+
 def get_ticker_aggregates(api_key, ticker, from_='yesterday', to='yesterday',
                     multiplier=1, timespan='minute', unadjusted=True,
-                    sort='asc', limit=5000, **query_params):
+                    sort='asc', limit=5000, max_workers=DEFAULT_MAX_WORKERS,
+                    cache=None, as_bars=False, **query_params):
     '''
     Polgygon.io Stock ticker Aggregates (Candles / Bars)
     GET /v2/aggs/ticker/{stocksTicker}/range/{multiplier}/{timespan}/{from}/{to}
@@ -363,8 +1112,8 @@ def get_ticker_aggregates(api_key, ticker, from_='yesterday', to='yesterday',
             Available: YYYY-MM-DD or 'today' or 'yesterday'
 
     unadjusted: (default = True) Whether or not the results are adjusted for
-            splits. By default, results are adjusted.
-            Set this to true to get results that are NOT adjusted for splits.
+            splits. By default, results are NOT adjusted for splits.
+            Set this to False to get results that are adjusted.
 
     sort: (default 'asc) Sort the results by timestamp.
         Available:
@@ -375,6 +1124,21 @@ def get_ticker_aggregates(api_key, ticker, from_='yesterday', to='yesterday',
         create the aggregate results.
         Polygon API Max 50000 and API Default 5000.
 
+    max_workers: (default = 4) Long date ranges are split into windows that
+        each fit within `limit`. The windows are fetched concurrently by up to
+        `max_workers` threads, then merged and de-duplicated into one ordered
+        result.
+
+    cache: (default = None) A `BarCache` to read bars from and save newly
+        fetched bars to. Only dates missing from the cache are requested from
+        Polygon. Dates from today onwards are never cached since they may
+        still be incomplete. Timespans coarser than 'day', and multi-day
+        bars, bypass the cache.
+
+    as_bars: (default = False) Return a columnar `Bars` object (one NumPy
+        array per field, always oldest first) instead of the JSON response
+        dictionary. Cheaper to hold and much faster to scan for large ranges.
+
     JSON Response Attributes
     ticker: The exchange symbol that this item is traded under.
     status: The status of this request's response.
@@ -392,18 +1156,71 @@ def get_ticker_aggregates(api_key, ticker, from_='yesterday', to='yesterday',
         t: The Unix Msec timestamp for the start of the aggregate window.
         n: The number of items in the aggregate windowAggr.
     '''
-    dt_from = date_parse(from_)
-    dt_to = date_parse(to)
+    return get_client(api_key).get_ticker_aggregates(
+        ticker, from_, to, multiplier, timespan, unadjusted, sort, limit,
+        max_workers, cache, as_bars, **query_params)
 
-    with RESTClient(api_key) as client:
-        symbol = ticker.upper()
-        resp = client.stocks_equities_aggregates(
-            ticker=symbol,
-            multiplier=multiplier,
-            timespan=timespan,
-            from_=dt_from,
-            to=dt_to,
-            limit=limit,
-            **query_params)
-        data = resp.__dict__
-    return data
+def iter_ticker_aggregates(api_key, ticker, from_='yesterday', to='yesterday',
+                    multiplier=1, timespan='minute', unadjusted=True,
+                    sort='asc', limit=5000, max_workers=DEFAULT_MAX_WORKERS,
+                    cache=None, **query_params):
+    '''
+    Streaming version of `get_ticker_aggregates`, takes the same parameters.
+
+    Yields the bars (list of dictionaries) one date window at a time, in
+    `sort` order, as soon as each window is available. Only a few windows
+    are fetched ahead of the consumer, so memory use stays flat however long
+    the date range is.
+    eg,
+        with poly.writers.open_writer('BAC.ndjson') as writer:
+            for bars in poly.iter_ticker_aggregates(api_key, 'BAC', ...):
+                writer.write(bars)
+    '''
+    return get_client(api_key).iter_ticker_aggregates(
+        ticker, from_, to, multiplier, timespan, unadjusted, sort, limit,
+        max_workers, cache, **query_params)
+
+def load_universe(path):
+    '''
+    Returns the tickers listed in a universe file, separated by whitespace,
+    commas or new lines, in order and without duplicates. Anything after a
+    '#' on a line is a comment. eg,
+        # large caps
+        BAC, T
+        UBER
+    '''
+    tickers = []
+    with open(path) as universe:
+        for line in universe:
+            tickers.extend(re.split(r'[\s,]+', line.split('#', 1)[0].strip()))
+    return list(dict.fromkeys(ticker.upper() for ticker in tickers if ticker))
+
+def save_universe_aggregates(api_key, tickers, directory, from_='yesterday',
+                    to='yesterday', multiplier=1, timespan='minute',
+                    unadjusted=True, limit=5000,
+                    max_workers=DEFAULT_MAX_WORKERS, cache=None,
+                    format='ndjson', isoformat=False,
+                    max_tickers=DEFAULT_MAX_TICKERS, progress=None,
+                    **query_params):
+    '''
+    Fetch the aggregates of many tickers, `max_tickers` at a time (each
+    fetching up to `max_workers` date windows at once), and save them
+    partitioned by ticker and New York date, eg,
+
+        directory/BAC/2021-01-04.ndjson
+
+    `format` is any `writers.WRITERS` format, `isoformat` converts the
+    timestamps to ISO 8601 strings. A ticker that fails does not stop the
+    others. Requests go through the api key's 'bulk' lane.
+
+    progress: (default = None) called as progress(ticker, report) as each
+        ticker finishes.
+
+    Returns a report dictionary: 'tickers' (count), 'succeeded' (list),
+    'failed' ({ticker: error}), 'bars' and 'files' written, 'requests' made
+    and 'seconds' (wall time).
+    '''
+    return get_client(api_key, 'bulk').save_universe_aggregates(
+        tickers, directory, from_, to, multiplier, timespan, unadjusted,
+        limit, max_workers, cache, format, isoformat, max_tickers, progress,
+        **query_params)
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+'''
+asyncio counterparts of the `poly` API wrappers, for use inside an event
+loop without blocking it or needing a thread per call.
+
+`AsyncPolyClient` owns one aiohttp session (requires aiohttp,
+$> pip install aiohttp). At most `max_concurrency` requests are in flight at
+once, each still paced by the api key's shared `RequestScheduler` (the same
+rate limit as the blocking clients) and retried like them. Cancelling a call
+cancels all of its outstanding requests. The blocking work of a call (the
+`DividendStore` and `BarCache` reads and writes) runs in the loop's default
+executor, so it never holds up the other tasks.
+
+eg,
+    async with AsyncPolyClient(api_key) as client:
+        status, dividends = await asyncio.gather(
+            client.get_marketstatus(),
+            client.get_dividends(['BAC', 'T']))
+        bars = await client.get_ticker_aggregates('BAC', '2021-01-04',
+                                                  '2021-01-29', as_bars=True)
+
+Results are the same as the blocking `get_marketstatus`, `get_dividends` and
+`get_ticker_aggregates`.
+'''
+
+import asyncio
+import datetime
+import json
+import os
+import time
+
+from . import (BASE_URL_ENV, instrument, DEFAULT_DIVIDEND_MAX_AGE_DAYS,
+               DEFAULT_MARKET_STATUS_TTL, MarketStatus, MarketStatusCache,
+               _cached_response, _merge_aggregates, _plan_aggregate_segments,
+               _store_in_cache, _summarize_dividends, date_parse,
+               follows_trading_calendar, get_scheduler, is_cacheable)
+from .scheduler import RETRY_STATUSES
+
+DEFAULT_BASE_URL = 'https://api.polygon.io'
+
+# requests in flight at once per client
+DEFAULT_MAX_CONCURRENCY = 64
+
+
+async def _gather(*coroutines):
+    '''
+    Like asyncio.gather, but the first failure cancels the rest.
+    '''
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def _query_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value)
+
+
+class AsyncPolyClient:
+    '''
+    Async client for Polygon.io API services, see the module docstring.
+
+    max_concurrency: requests in flight at once.
+    timeout: seconds per request, None for aiohttp's default.
+    base_url: API root (default $POLY_BASE_URL, or Polygon's own host).
+    scheduler: rate limit and retries (default the api key's shared one).
+    '''
+
+    def __init__(self, api_key, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 timeout=None, base_url=None, scheduler=None,
+                 priority='interactive'):
+        try:
+            import aiohttp
+        except ImportError:
+            raise RuntimeError('AsyncPolyClient requires aiohttp '
+                               '($> pip install aiohttp)') from None
+        self._aiohttp = aiohttp
+        self.api_key = api_key
+        self.base_url = (base_url or os.environ.get(BASE_URL_ENV) or
+                         DEFAULT_BASE_URL).rstrip('/')
+        self.scheduler = scheduler or get_scheduler(api_key)
+        self.priority = priority
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_concurrency = max_concurrency
+        self.request_count = 0
+        self._session = None
+        self._semaphore = None
+        self._market_status_cache = None
+        self._market_status_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _open(self):
+        # created lazily, inside the running event loop
+        if self._session is None:
+            connector = self._aiohttp.TCPConnector(limit=self.max_concurrency)
+            self._session = self._aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._market_status_lock = asyncio.Lock()
+        return self._session
+
+    async def _acquire(self):
+        while True:
+            wait = self.scheduler.try_acquire(self.priority)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    async def _get(self, path, **query_params):
+        '''
+        GET `path` (under the API root), returns the decoded JSON response.
+        Rate limited (429), server error (5xx) and connection failures are
+        retried with the scheduler's backoff, other errors raise
+        aiohttp.ClientResponseError.
+        '''
+        session = self._open()
+        params = {key: _query_value(value)
+                  for key, value in query_params.items() if value is not None}
+        params['apiKey'] = self.api_key
+        url = f'{self.base_url}{path}'
+        with instrument.span('request', call=path,
+                             priority=self.priority, retries=0) as span:
+            return await self._send(session, span, url, params)
+
+    async def _send(self, session, span, url, params):
+        attempt = 0
+        while True:
+            await self._acquire()
+            self.request_count += 1
+            response = None
+            try:
+                async with self._semaphore:
+                    started = time.perf_counter()
+                    async with session.get(url, params=params) as response:
+                        body = await response.read()
+                        instrument.record('http', time.perf_counter() - started,
+                                          status=response.status,
+                                          bytes=len(body))
+                        if (response.status in RETRY_STATUSES or
+                                response.status >= 500):
+                            failure = self._aiohttp.ClientResponseError(
+                                response.request_info, response.history,
+                                status=response.status,
+                                message=response.reason)
+                        else:
+                            response.raise_for_status()
+                            return json.loads(body)
+            except (self._aiohttp.ClientConnectionError,
+                    asyncio.TimeoutError) as error:
+                failure = error
+            if attempt >= self.scheduler.max_retries:
+                raise failure
+            await asyncio.sleep(self.scheduler.backoff_delay(attempt, response))
+            attempt += 1
+            span.add(retries=1)
+            self.scheduler.retries += 1
+
+    ## API wrappers ##
+
+    def market_status_cache(self, ttl=DEFAULT_MARKET_STATUS_TTL):
+        '''
+        Returns this client's `MarketStatusCache` (filled by
+        `get_marketstatus`, so use its `cached` or `is_open` with `at`).
+        '''
+        if self._market_status_cache is None:
+            self._market_status_cache = MarketStatusCache(None, ttl)
+        self._market_status_cache.ttl = ttl
+        return self._market_status_cache
+
+    async def _fetch_marketstatus(self, **query_params):
+        return MarketStatus(**await self._get('/v1/marketstatus/now',
+                                              **query_params))
+
+    async def get_marketstatus(self, ttl=DEFAULT_MARKET_STATUS_TTL,
+                               verbose=False, **query_params):
+        '''
+        See `poly.get_marketstatus`. Concurrent calls share one request.
+        '''
+        if ttl and not query_params:
+            cache = self.market_status_cache(ttl)
+            self._open()
+            async with self._market_status_lock:
+                status = cache.cached()
+                if status is None:
+                    fetched_at = cache.clock()
+                    status = await self._fetch_marketstatus()
+                    cache.put(status, fetched_at)
+        else:
+            status = await self._fetch_marketstatus(**query_params)
+        if verbose:
+            print(status.template())
+        return status
+
+    async def _fetch_dividends(self, symbol, **query_params):
+        data = await self._get(f'/v2/reference/dividends/{symbol}',
+                               **query_params)
+        return data.get('results') or [], data.get('count')
+
+    async def get_dividends(self, tickers, store=None,
+                            max_age_days=DEFAULT_DIVIDEND_MAX_AGE_DAYS,
+                            **query_params):
+        '''
+        See `poly.get_dividends`. Every stale ticker is requested at once.
+        '''
+        symbols = list(dict.fromkeys(symbol.upper() for symbol in tickers))
+        if store is not None:
+            stale = await asyncio.to_thread(store.stale_tickers, symbols,
+                                            max_age_days)
+        else:
+            stale = symbols
+        fetched = await _gather(*(self._fetch_dividends(symbol, **query_params)
+                                  for symbol in stale))
+        results = {symbol: data[0] for symbol, data in zip(stale, fetched)}
+        counts = {symbol: data[1] for symbol, data in zip(stale, fetched)}
+        if store is None:
+            return _summarize_dividends(symbols, stale, results, counts, store)
+        return await asyncio.to_thread(_summarize_dividends, symbols, stale,
+                                       results, counts, store)
+
+    async def _fetch_aggregates_window(self, symbol, multiplier, timespan,
+                                       dt_from, dt_to, limit, **query_params):
+        '''
+        See `poly._fetch_aggregates_window`, truncated windows are split in
+        half and both halves fetched at once.
+        '''
+        data = await self._get(
+            f'/v2/aggs/ticker/{symbol}/range/{multiplier}/{timespan}/'
+            f'{dt_from.isoformat()}/{dt_to.isoformat()}',
+            limit=limit, **query_params)
+        if data.get('resultsCount', 0) >= limit and dt_from < dt_to:
+            middle = dt_from + (dt_to - dt_from) / 2
+            halves = await _gather(
+                self._fetch_aggregates_window(
+                    symbol, multiplier, timespan, dt_from, middle, limit,
+                    **query_params),
+                self._fetch_aggregates_window(
+                    symbol, multiplier, timespan,
+                    middle + datetime.timedelta(days=1), dt_to, limit,
+                    **query_params))
+            return halves[0] + halves[1]
+        return [data]
+
+    async def get_ticker_aggregates(self, ticker, from_='yesterday',
+                                    to='yesterday', multiplier=1,
+                                    timespan='minute', unadjusted=True,
+                                    sort='asc', limit=5000, cache=None,
+                                    as_bars=False, **query_params):
+        '''
+        See `poly.get_ticker_aggregates`. Every date window is requested at
+        once (within `max_concurrency`).
+        '''
+        symbol = ticker.upper()
+        trading = follows_trading_calendar(symbol)
+        dt_from = date_parse(from_, trading=trading)
+        dt_to = date_parse(to, trading=trading)
+        if cache is not None and not is_cacheable(multiplier, timespan):
+            cache = None
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.key(symbol, multiplier, timespan, unadjusted)
+        segments = await asyncio.to_thread(
+            _plan_aggregate_segments, cache, cache_key, dt_from, dt_to,
+            timespan, limit, trading)
+
+        async def segment(source, s_from, s_to):
+            if source == 'cache':
+                bars = await asyncio.to_thread(cache.load, cache_key, s_from,
+                                               s_to)
+                return [_cached_response(symbol, unadjusted, bars)]
+            responses = await self._fetch_aggregates_window(
+                symbol, multiplier, timespan, s_from, s_to, limit,
+                unadjusted=unadjusted, **query_params)
+            if cache is not None:
+                await asyncio.to_thread(_store_in_cache, cache, cache_key,
+                                        [(s_from, s_to)], responses, limit)
+            return responses
+
+        chunks = await _gather(*(segment(*planned) for planned in segments))
+        responses = [data for chunk in chunks for data in chunk]
+        if as_bars:
+            from .bars import Bars
+            return Bars.concat(
+                (Bars.from_results(data.get('results') or [])
+                 for data in responses), ticker=symbol)
+        return _merge_aggregates(
+            responses or [_cached_response(symbol, unadjusted, [])], sort)
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+'''
+Vectorized backtests of trading signals over aggregate bars.
+
+A strategy is a signal per bar: the target position in a ticker after that
+bar's close, as a fraction of the capital (1 long with all of it, -0.5 short
+half of it, 0 flat). Signals may be given as arrays (one value per bar) or as
+a function of a ticker's `Bars` returning that array, eg
+
+    def crossover(bars, fast=20, slow=50):
+        return numpy.where(indicators.sma(bars, fast) >
+                           indicators.sma(bars, slow), 1.0, 0.0)
+
+    minutes = poly.get_ticker_aggregates(api_key, 'BAC', '2019-01-01',
+                                         '2021-12-31', as_bars=True)
+    result = run(minutes, crossover, commission=0.0005, slippage=0.0002)
+    result.metrics()['sharpe']
+
+The simulation is signals -> positions -> PnL, all as array operations:
+  - tickers are aligned on the union of their timestamps, each one's last
+    close and signal carried forward over bars it does not have
+  - positions are the signals (NaN = flat) clipped to `max_position` per
+    ticker (and to no shorts unless `allow_short`), then scaled down so the
+    gross exposure stays within `max_gross`
+  - a position taken at a bar's close earns the ticker's return to the next
+    bar's close, so a signal never trades on the bar it was computed from
+  - trading costs `commission` plus `slippage` (fractions of the value
+    traded) for every change of position
+  - positions are held as fractions of the current equity, ie rebalanced to
+    their targets at every bar
+
+Several tickers are backtested together by passing `Bars` for each (a list,
+or {ticker: Bars}), and signals for each (a function, or {ticker: array}).
+'''
+
+import numpy
+
+from .bars import Bars
+
+YEAR_MS = 365.25 * 24 * 60 * 60 * 1000
+
+
+def _as_bars_by_ticker(bars):
+    if isinstance(bars, Bars):
+        return {bars.ticker: bars}
+    if isinstance(bars, dict):
+        return dict(bars)
+    return {item.ticker: item for item in bars}
+
+
+def _signal_arrays(bars_by_ticker, signals):
+    '''
+    Returns {ticker: array of signals, one per bar}.
+    '''
+    arrays = {}
+    for ticker, bars in bars_by_ticker.items():
+        if callable(signals):
+            signal = signals(bars)
+        elif isinstance(signals, dict):
+            signal = signals[ticker]
+        elif len(bars_by_ticker) == 1:
+            signal = signals
+        else:
+            raise ValueError('signals of several tickers must be a function '
+                             'or {ticker: signals}')
+        signal = numpy.asarray(signal, dtype=numpy.float64)
+        if signal.shape != (len(bars),):
+            raise ValueError(f'{len(signal)} signals for {len(bars)} bars '
+                             f'of {ticker}')
+        arrays[ticker] = signal
+    return arrays
+
+
+def align(bars_by_ticker, signals_by_ticker):
+    '''
+    Returns (timestamps, closes, signals): the union of the tickers'
+    timestamps and (bars x tickers) matrices of close prices and signals,
+    carried forward over missing bars (NaN before a ticker's first bar).
+    '''
+    tickers = list(bars_by_ticker)
+    if len(tickers) == 1:
+        bars = bars_by_ticker[tickers[0]]
+        return (bars.t, bars.c[:, numpy.newaxis],
+                signals_by_ticker[tickers[0]][:, numpy.newaxis])
+
+    t = numpy.unique(numpy.concatenate(
+        [bars.t for bars in bars_by_ticker.values()]))
+    closes = numpy.full((len(t), len(tickers)), numpy.nan)
+    signals = numpy.full((len(t), len(tickers)), numpy.nan)
+    for column, ticker in enumerate(tickers):
+        bars = bars_by_ticker[ticker]
+        # position of each ticker's latest bar at every timestamp
+        latest = numpy.full(len(t), -1)
+        latest[numpy.searchsorted(t, bars.t)] = numpy.arange(len(bars))
+        latest = numpy.maximum.accumulate(latest)
+        present = latest >= 0
+        closes[present, column] = bars.c[latest[present]]
+        signals[present, column] = signals_by_ticker[ticker][latest[present]]
+    return t, closes, signals
+
+
+class BacktestResult:
+    '''
+    The outcome of `run`. Arrays, one value (or row, one column per ticker)
+    per aligned bar:
+
+    t          Unix msec timestamps
+    positions  target positions after each bar, fractions of equity
+    asset_returns
+               each ticker's return from the previous bar's close
+    returns    portfolio return of each bar, after costs
+    turnover   value traded at each bar, as a fraction of equity
+    costs      trading costs of each bar, as a fraction of equity
+    equity     portfolio value after each bar
+    '''
+
+    def __init__(self, tickers, capital, t, positions, asset_returns,
+                 returns, turnover, costs, equity):
+        self.tickers = tickers
+        self.capital = capital
+        self.t = t
+        self.positions = positions
+        self.asset_returns = asset_returns
+        self.returns = returns
+        self.turnover = turnover
+        self.costs = costs
+        self.equity = equity
+
+    def __repr__(self):
+        return (f'<BacktestResult {", ".join(map(str, self.tickers))} '
+                f'({len(self.t)} bars)>')
+
+    @property
+    def drawdown(self):
+        '''
+        Fall of the equity from its running peak (at least the initial
+        capital), 0 at a new high.
+        '''
+        peak = numpy.maximum(numpy.maximum.accumulate(self.equity),
+                             self.capital)
+        return self.equity / peak - 1
+
+    def contributions(self):
+        '''
+        Returns {ticker: sum of the ticker's share of the returns} (before
+        costs).
+        '''
+        pnl = (self.positions[:-1] * self.asset_returns[1:]).sum(axis=0)
+        return {ticker: float(value)
+                for ticker, value in zip(self.tickers, pnl)}
+
+    def metrics(self):
+        '''
+        Returns the standard statistics of the backtest:
+
+        total_return    final equity / initial capital - 1
+        cagr            compound annual growth rate
+        volatility      annualized standard deviation of the returns
+        sharpe          annualized mean / standard deviation of the returns
+                        (no risk free rate)
+        max_drawdown    largest fall from a peak (negative)
+        turnover        total value traded, in multiples of equity
+        annual_turnover the same per year
+        costs           total trading costs, as a fraction of equity
+        exposure        fraction of bars holding any position
+        trades          number of bars where a position changed
+        '''
+        bars = len(self.t)
+        if bars < 2:
+            years = 0.0
+        else:
+            years = (self.t[-1] - self.t[0]) / YEAR_MS
+        total_return = self.equity[-1] / self.capital - 1 if bars else 0.0
+        mean, std = ((self.returns[1:].mean(), self.returns[1:].std())
+                     if bars > 1 else (0.0, 0.0))
+        per_year = (bars - 1) / years if years else 0.0
+        gross = numpy.abs(self.positions).sum(axis=1)
+        with numpy.errstate(over='ignore'):
+            cagr = (max(1 + total_return, 0.0) ** (1 / years) - 1
+                    if years else 0.0)
+        return {
+            'total_return': float(total_return),
+            'cagr': float(cagr),
+            'volatility': float(std * numpy.sqrt(per_year)),
+            'sharpe': float(mean / std * numpy.sqrt(per_year)
+                            if std else 0.0),
+            'max_drawdown': float(self.drawdown.min()) if bars else 0.0,
+            'turnover': float(self.turnover.sum()),
+            'annual_turnover': float(self.turnover.sum() / years
+                                     if years else 0.0),
+            'costs': float(self.costs.sum()),
+            'exposure': float((gross > 0).mean()) if bars else 0.0,
+            'trades': int((self.turnover > 0).sum()),
+        }
+
+    def to_dataframe(self):
+        '''
+        The per-bar results as a pandas DataFrame indexed by New York time,
+        with one position column per ticker.
+        '''
+        import pandas
+        from .market import NEW_YORK
+        frame = pandas.DataFrame(
+            {'equity': self.equity, 'returns': self.returns,
+             'turnover': self.turnover, 'costs': self.costs,
+             'drawdown': self.drawdown},
+            index=pandas.to_datetime(self.t, unit='ms',
+                                     utc=True).tz_convert(NEW_YORK))
+        for column, ticker in enumerate(self.tickers):
+            frame[f'position_{ticker}'] = self.positions[:, column]
+        return frame
+
+
+def run(bars, signals, capital=1.0, commission=0.0, slippage=0.0,
+        max_position=1.0, max_gross=None, allow_short=True):
+    '''
+    Backtest `signals` over `bars`, see the module docstring. Returns a
+    `BacktestResult`.
+
+    bars: `Bars` of one ticker, or a list / {ticker: Bars} of several.
+    signals: target positions (fractions of equity) after each bar, as an
+        array (one ticker), {ticker: array}, or a function of a ticker's
+        `Bars` returning the array.
+    capital: initial equity.
+    commission, slippage: costs per trade, as fractions of the value traded.
+    max_position: largest position in any one ticker.
+    max_gross: largest sum of absolute positions (None for no limit beyond
+        `max_position`).
+    allow_short: if False, negative signals are flat.
+    '''
+    bars_by_ticker = _as_bars_by_ticker(bars)
+    if not bars_by_ticker:
+        raise ValueError('no bars to backtest')
+    signals_by_ticker = _signal_arrays(bars_by_ticker, signals)
+    t, closes, positions = align(bars_by_ticker, signals_by_ticker)
+
+    positions = numpy.nan_to_num(positions, nan=0.0, posinf=0.0, neginf=0.0)
+    positions = numpy.clip(positions, -max_position if allow_short else 0.0,
+                           max_position)
+    if max_gross is not None:
+        gross = numpy.abs(positions).sum(axis=1)
+        scale = numpy.minimum(1.0, max_gross / numpy.maximum(gross, 1e-300))
+        positions = positions * scale[:, numpy.newaxis]
+
+    asset_returns = numpy.zeros_like(closes)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        numpy.divide(closes[1:], closes[:-1], out=asset_returns[1:])
+    asset_returns[1:] -= 1
+    asset_returns[~numpy.isfinite(asset_returns)] = 0.0
+    # nothing can be held before a ticker's first bar
+    positions[numpy.isnan(closes)] = 0.0
+
+    returns = numpy.zeros(len(t))
+    returns[1:] = numpy.einsum('ij,ij->i', positions[:-1], asset_returns[1:])
+    changes = numpy.abs(numpy.diff(
+        positions, axis=0, prepend=numpy.zeros((1, positions.shape[1]))))
+    turnover = changes.sum(axis=1)
+    costs = turnover * (commission + slippage)
+    returns -= costs
+    equity = capital * numpy.cumprod(1 + returns)
+    return BacktestResult(list(bars_by_ticker), capital, t, positions,
+                          asset_returns, returns, turnover, costs, equity)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+'''
+Compact columnar (struct of arrays) container for aggregate bars.
+
+Rather than a list of per-bar dictionaries, `Bars` keeps one typed NumPy array
+per field, always ordered by timestamp (oldest first). Slicing, including by
+time range with `between`, returns views onto the same memory rather than
+copies, and `to_dataframe` hands the arrays to pandas without copying them.
+
+eg,
+    bars = poly.get_ticker_aggregates(api_key, 'BAC', ..., as_bars=True)
+    morning = bars.between(1609770600000, 1609783200000)
+    morning.c.mean()
+'''
+
+import datetime
+
+import numpy
+
+from .market import NEW_YORK
+
+# field name to array dtype, in the order bars are usually presented
+FIELDS = {
+    't': numpy.int64,    # Unix msec timestamp for the start of the window
+    'o': numpy.float64,  # open price
+    'h': numpy.float64,  # high price
+    'l': numpy.float64,  # low price
+    'c': numpy.float64,  # close price
+    'v': numpy.float64,  # trading volume (may be fractional)
+    'vw': numpy.float64, # volume weighted average price
+    'n': numpy.int64,    # number of trades in the window
+}
+
+# value used when a bar is missing an optional field
+MISSING = {
+    'vw': float('nan'),
+    'n': 0,
+}
+
+
+def _to_epoch_ms(value):
+    '''
+    Accepts Unix msec timestamps (int), timezone aware datetimes or
+    pandas.Timestamps, and returns Unix msec timestamps.
+    '''
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp() * 1000)
+    return int(value)
+
+
+class Bars:
+    '''
+    Aggregate bars for one ticker, stored as one NumPy array per field.
+    Arrays are available as attributes (bars.t, bars.o, ... bars.n).
+    '''
+
+    def __init__(self, ticker=None, **arrays):
+        self.ticker = ticker
+        size = len(arrays['t']) if 't' in arrays else 0
+        for field, dtype in FIELDS.items():
+            if field in arrays:
+                array = numpy.asarray(arrays[field], dtype=dtype)
+            else:
+                array = numpy.full(size, MISSING.get(field, 0), dtype=dtype)
+            setattr(self, field, array)
+
+    @classmethod
+    def from_results(cls, results, ticker=None):
+        '''
+        Build from the list of bar dictionaries found under 'results' in a
+        Polygon aggregates response. Bars are sorted by timestamp.
+        '''
+        size = len(results)
+        arrays = {}
+        for field, dtype in FIELDS.items():
+            default = MISSING.get(field, 0)
+            arrays[field] = numpy.fromiter(
+                (bar.get(field, default) for bar in results),
+                dtype=dtype, count=size)
+        bars = cls(ticker, **arrays)
+        if size and not (numpy.diff(bars.t) >= 0).all():
+            bars = bars.take(numpy.argsort(bars.t, kind='stable'))
+        return bars
+
+    @classmethod
+    def concat(cls, bars_list, ticker=None):
+        '''
+        Join several `Bars` into one, sorted by timestamp, keeping only the
+        last bar seen for any repeated timestamp (the same rule as merging
+        aggregate responses).
+        '''
+        bars_list = list(bars_list)
+        if ticker is None and bars_list:
+            ticker = bars_list[0].ticker
+        arrays = {
+            field: numpy.concatenate(
+                [getattr(bars, field) for bars in bars_list] or
+                [numpy.empty(0, dtype=dtype)])
+            for field, dtype in FIELDS.items()}
+        # unique() finds first occurrences, so search the reversed timestamps
+        size = len(arrays['t'])
+        _, first = numpy.unique(arrays['t'][::-1], return_index=True)
+        last = size - 1 - first
+        return cls(ticker, **{field: array[last]
+                              for field, array in arrays.items()})
+
+    def __len__(self):
+        return len(self.t)
+
+    def __repr__(self):
+        return f'<Bars {self.ticker} ({len(self)} bars)>'
+
+    def __getitem__(self, index):
+        '''
+        Slices (bars[10:20]) return views, anything else (boolean masks,
+        index arrays) returns a copy, just like NumPy.
+        '''
+        if isinstance(index, (int, numpy.integer)):
+            return {field: getattr(self, field)[index].item()
+                    for field in FIELDS}
+        return Bars(self.ticker, **{field: getattr(self, field)[index]
+                                    for field in FIELDS})
+
+    def take(self, indices):
+        return self[numpy.asarray(indices)]
+
+    def between(self, start=None, end=None):
+        '''
+        Returns a view of the bars with timestamps in [start, end).
+        Either bound may be None (open ended), a Unix msec timestamp or a
+        timezone aware datetime.
+        '''
+        lo = 0 if start is None else numpy.searchsorted(
+            self.t, _to_epoch_ms(start), side='left')
+        hi = len(self) if end is None else numpy.searchsorted(
+            self.t, _to_epoch_ms(end), side='left')
+        return self[lo:hi]
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, field).nbytes for field in FIELDS)
+
+    def to_dataframe(self, index=True):
+        '''
+        Returns a pandas.DataFrame with one column per field. When `index` is
+        True the frame is indexed by the bar start time in New York time.
+        '''
+        import pandas
+        frame = pandas.DataFrame(
+            {field: getattr(self, field) for field in FIELDS}, copy=False)
+        if index:
+            frame.index = pandas.to_datetime(
+                self.t, unit='ms', utc=True).tz_convert(NEW_YORK)
+        return frame
+
+    def to_results(self):
+        '''
+        Returns the bars as a list of dictionaries, the same shape Polygon
+        returns under 'results'.
+        '''
+        columns = [getattr(self, field).tolist() for field in FIELDS]
+        return [dict(zip(FIELDS, row)) for row in zip(*columns)]
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+'''
+Append-only, memory-mapped binary store of aggregate bars.
+
+Each (ticker, multiplier, timespan, adjustment) key is one file of fixed
+width records (the `bars.FIELDS`, 64 bytes a bar) ordered by timestamp, plus
+a small time index, eg,
+
+    ~/.config/trademin/bars/BAC/1-minute-unadjusted.bars
+    ~/.config/trademin/bars/BAC/1-minute-unadjusted.idx
+
+Reading maps the file (read only) and returns `Bars` whose arrays are views
+straight onto the mapped pages: nothing is parsed or copied, the OS pages in
+only what is touched and every process reading the same file shares the same
+pages. The index holds the timestamp of every `index_stride`-th record, so a
+time range is found by searching the index and one stride of records.
+
+eg,
+    store = BarStore()
+    key = store.key('BAC', 1, 'minute', unadjusted=True)
+    store.append(key, poly.get_ticker_aggregates(api_key, 'BAC', ...,
+                                                 as_bars=True))
+    january = store.read(key, start=jan_1_ms, end=feb_1_ms)
+    january.c.mean()
+
+Appending only ever adds bars newer than the last stored one. The record
+count in the file header is updated after the records are written, so
+readers (and a crashed writer) never see a partially written bar.
+'''
+
+import os
+
+import numpy
+
+from . import instrument
+from .bars import Bars, FIELDS, _to_epoch_ms
+from .cache import BarCache
+
+try:
+    import fcntl
+except ImportError:  # not on Windows, appends are not locked there
+    fcntl = None
+
+# the default directory where the bar store files live
+DEFAULT_BAR_STORE_DIR = os.path.expanduser("~/.config/trademin/bars")
+
+MAGIC = b'POLYBARS'
+VERSION = 1
+
+# one fixed width record per bar, the same fields and types as `Bars`
+RECORD = numpy.dtype([(field, dtype) for field, dtype in FIELDS.items()])
+
+HEADER = numpy.dtype([('magic', 'S8'), ('version', '<u4'),
+                      ('record_size', '<u4'), ('index_stride', '<u8'),
+                      ('count', '<u8')])
+# records start after a header padded to one record
+HEADER_SIZE = 64
+
+# records per index entry
+DEFAULT_INDEX_STRIDE = 4096
+
+
+class BarStore:
+    '''
+    Memory-mapped bar files under `path`, see the module docstring.
+    Any number of processes may read, appends to a key are serialized.
+    '''
+
+    def __init__(self, path=DEFAULT_BAR_STORE_DIR,
+                 index_stride=DEFAULT_INDEX_STRIDE):
+        self.path = path
+        # only used for new files, existing ones keep their own
+        self.index_stride = index_stride
+        # key: (count, records, index) of the latest mapping
+        self._maps = {}
+
+    key = staticmethod(BarCache.key)
+
+    def _paths(self, key):
+        base = os.path.join(self.path, key)
+        return base + '.bars', base + '.idx'
+
+    @staticmethod
+    def _read_header(f):
+        f.seek(0)
+        data = f.read(HEADER.itemsize)
+        if len(data) < HEADER.itemsize:
+            return None
+        header = numpy.frombuffer(data, dtype=HEADER).copy()[0]
+        if (header['magic'] != MAGIC or header['version'] != VERSION or
+                header['record_size'] != RECORD.itemsize):
+            raise RuntimeError(f'{f.name} is not a version {VERSION} bar '
+                               'store file')
+        return header
+
+    def count(self, key):
+        '''
+        Returns the number of bars stored for `key`.
+        '''
+        bars_path, _ = self._paths(key)
+        try:
+            with open(bars_path, 'rb') as f:
+                header = self._read_header(f)
+        except FileNotFoundError:
+            return 0
+        return 0 if header is None else int(header['count'])
+
+    @instrument.timed('barstore.append')
+    def append(self, key, bars):
+        '''
+        Append `bars` (`Bars`, or a list of bar dictionaries) to `key`. Bars
+        not newer than the last stored bar are skipped, and only the last of
+        any repeated timestamp is kept. Returns the number of bars appended.
+        '''
+        if not isinstance(bars, Bars):
+            bars = Bars.from_results(bars)
+        if len(bars) and not (numpy.diff(bars.t) > 0).all():
+            bars = Bars.concat([bars])
+        bars_path, index_path = self._paths(key)
+        os.makedirs(os.path.dirname(bars_path), exist_ok=True)
+
+        fd = os.open(bars_path, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, 'r+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            header = self._read_header(f)
+            if header is None:
+                header = numpy.zeros((), dtype=HEADER)
+                header['magic'] = MAGIC
+                header['version'] = VERSION
+                header['record_size'] = RECORD.itemsize
+                header['index_stride'] = self.index_stride
+            count = int(header['count'])
+            stride = int(header['index_stride'])
+
+            if count:
+                f.seek(HEADER_SIZE + (count - 1) * RECORD.itemsize)
+                last = numpy.frombuffer(f.read(RECORD.itemsize),
+                                        dtype=RECORD)[0]['t']
+                bars = bars[numpy.searchsorted(bars.t, last, side='right'):]
+            if not len(bars):
+                return 0
+
+            records = numpy.empty(len(bars), dtype=RECORD)
+            for field in FIELDS:
+                records[field] = getattr(bars, field)
+            # anything past `count` is left over from an interrupted append
+            f.seek(HEADER_SIZE + count * RECORD.itemsize)
+            f.write(records.data)
+            f.truncate()
+            f.flush()
+
+            header['count'] = count + len(records)
+            f.seek(0)
+            f.write(header.tobytes().ljust(HEADER_SIZE, b'\0'))
+            f.flush()
+
+            # index entries for the new multiples of `stride`, or all of them
+            # if an interrupted append lost some
+            first = -(-count // stride) * stride
+            try:
+                indexed = os.path.getsize(index_path) // 8
+            except FileNotFoundError:
+                indexed = 0
+            if indexed < first // stride:
+                first = 0
+            total = count + len(records)
+            timestamps = numpy.memmap(f, dtype=RECORD, mode='r',
+                                      offset=HEADER_SIZE, shape=(total,))['t']
+            with open(index_path, 'ab') as index:
+                index.truncate(first // stride * 8)
+                index.write(numpy.asarray(timestamps[first::stride],
+                                          dtype='<i8').tobytes())
+            del timestamps
+        return len(records)
+
+    def _map(self, key):
+        '''
+        Returns the mapped records of `key` and its (stride, timestamps)
+        index, mapping the file again when it has grown.
+        '''
+        bars_path, index_path = self._paths(key)
+        try:
+            with open(bars_path, 'rb') as f:
+                header = self._read_header(f)
+        except FileNotFoundError:
+            header = None
+        count = 0 if header is None else int(header['count'])
+        cached = self._maps.get(key)
+        if cached is not None and cached[0] == count:
+            return cached[1:]
+
+        if not count:
+            records = numpy.empty(0, dtype=RECORD)
+            index = (self.index_stride, numpy.empty(0, dtype='<i8'))
+        else:
+            stride = int(header['index_stride'])
+            records = numpy.memmap(bars_path, dtype=RECORD, mode='r',
+                                   offset=HEADER_SIZE, shape=(count,))
+            entries = -(-count // stride)
+            try:
+                index = numpy.fromfile(index_path, dtype='<i8',
+                                       count=entries)
+            except FileNotFoundError:
+                index = numpy.empty(0, dtype='<i8')
+            if len(index) < entries:
+                # an append was interrupted before its index was written
+                index = numpy.asarray(records['t'][::stride])
+            index = (stride, index)
+        self._maps[key] = (count, records, index)
+        return records, index
+
+    @staticmethod
+    def _search(records, index, timestamp):
+        '''
+        Returns the position of the first record at or after `timestamp`.
+        '''
+        stride, starts = index
+        block = int(numpy.searchsorted(starts, timestamp, side='left'))
+        lo = max(block - 1, 0) * stride
+        hi = min(block * stride, len(records))
+        return lo + int(numpy.searchsorted(records['t'][lo:hi], timestamp,
+                                           side='left'))
+
+    @instrument.timed('barstore.read')
+    def read(self, key, start=None, end=None):
+        '''
+        Returns the stored bars of `key` with timestamps in [start, end), as
+        `Bars` viewing the mapped file (read only, no copies). Either bound
+        may be None (open ended), a Unix msec timestamp or a timezone aware
+        datetime, like `Bars.between`.
+        '''
+        records, index = self._map(key)
+        lo = 0 if start is None else self._search(records, index,
+                                                  _to_epoch_ms(start))
+        hi = len(records) if end is None else self._search(records, index,
+                                                           _to_epoch_ms(end))
+        window = records[lo:max(lo, hi)]
+        ticker = key.split(os.sep)[0]
+        return Bars(ticker, **{field: window[field] for field in FIELDS})
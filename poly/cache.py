@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+'''
+Local on-disk cache of aggregate bars.
+
+Bars are stored as one JSON file per New York trading date, under a directory
+per (ticker, multiplier, timespan, adjustment) key, eg,
+
+    ~/.config/trademin/cache/BAC/1-minute-adjusted/2021-01-04.json
+
+The presence of a date file means that date has been fully fetched (a file
+holding an empty list is a date without any bars, eg a weekend). This lets us
+work out which sub-ranges of a query are missing and only ask Polygon for
+those.
+'''
+
+import datetime
+import json
+import os
+import tempfile
+
+from . import instrument
+
+# the default directory where cached bars are stored
+DEFAULT_CACHE_DIR = os.path.expanduser("~/.config/trademin/cache")
+
+# timespans whose bars never straddle a date, so can be cached per date
+CACHEABLE_TIMESPANS = ('minute', 'hour', 'day')
+
+
+def is_cacheable(multiplier, timespan):
+    '''
+    Can bars of this size be cached per date? Multi-day bars (eg, 5 day) are
+    not, since they straddle dates and are aligned to the query's start date.
+    '''
+    if timespan == 'day':
+        return multiplier == 1
+    return timespan in CACHEABLE_TIMESPANS
+
+
+class BarCache:
+    '''
+    Stores aggregate bars on disk, one JSON file per date per key.
+    '''
+
+    def __init__(self, path=DEFAULT_CACHE_DIR):
+        self.path = path
+
+    @staticmethod
+    def key(ticker, multiplier, timespan, unadjusted):
+        '''
+        Returns the relative directory used to store bars for a query.
+        '''
+        adjustment = 'unadjusted' if unadjusted else 'adjusted'
+        return os.path.join(ticker.upper(),
+                            f'{multiplier}-{timespan}-{adjustment}')
+
+    def _key_dir(self, key):
+        return os.path.join(self.path, key)
+
+    def cached_dates(self, key):
+        '''
+        Returns the set of dates which are fully cached for `key`.
+        '''
+        try:
+            names = os.listdir(self._key_dir(key))
+        except FileNotFoundError:
+            return set()
+        dates = set()
+        for name in names:
+            if name.endswith('.json'):
+                try:
+                    dates.add(datetime.date.fromisoformat(name[:-5]))
+                except ValueError:
+                    pass  # not one of ours
+        return dates
+
+    def missing_ranges(self, key, dt_from, dt_to):
+        '''
+        Returns a list of inclusive (from, to) date tuples covering every date
+        between `dt_from` and `dt_to` that is not cached yet.
+        '''
+        cached = self.cached_dates(key)
+        ranges = []
+        day = dt_from
+        while day <= dt_to:
+            if day not in cached:
+                if ranges and ranges[-1][1] == day - datetime.timedelta(days=1):
+                    ranges[-1] = (ranges[-1][0], day)
+                else:
+                    ranges.append((day, day))
+            day += datetime.timedelta(days=1)
+        return ranges
+
+    @instrument.timed('cache.load')
+    def load(self, key, dt_from, dt_to):
+        '''
+        Returns the cached bars between `dt_from` and `dt_to` (inclusive),
+        ordered by date. Dates which are not cached are skipped.
+        '''
+        cached = self.cached_dates(key)
+        bars = []
+        for day in sorted(d for d in cached if dt_from <= d <= dt_to):
+            path = os.path.join(self._key_dir(key), f'{day.isoformat()}.json')
+            with open(path) as _path:
+                bars.extend(json.load(_path))
+        return bars
+
+    @instrument.timed('cache.store')
+    def store(self, key, bars_by_date):
+        '''
+        Save bars for each date in the `bars_by_date` dictionary
+        ({datetime.date: [bar, ...]}), replacing anything cached for those
+        dates. Each file is written atomically, so an interrupted run never
+        leaves a partially written date behind.
+        '''
+        key_dir = self._key_dir(key)
+        os.makedirs(key_dir, exist_ok=True)
+        for day, bars in bars_by_date.items():
+            path = os.path.join(key_dir, f'{day.isoformat()}.json')
+            fd, tmp_path = tempfile.mkstemp(dir=key_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as _tmp:
+                    json.dump(bars, _tmp)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        return True
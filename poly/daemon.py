@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+'''
+Resident `trademin-poly serve` daemon, and the client forwarding commands
+to it.
+
+A daemon is one long lived process listening on a Unix socket (only
+accessible by its user). It runs the commands it is sent in-process, so
+they skip the interpreter start, imports and config parsing, and reuse
+everything kept warm between commands: the shared `PolyClient`s (their
+pooled HTTP connections and market status caches), the request schedulers
+(the api key's rate limit, shared by every command), parsed configs and
+dates.
+
+Requests and replies are JSON lines. The client sends
+    {"argv": ["aggregates", "BAC"], "cwd": "/home/me",
+     "env": {"POLY_BASE_URL": null, "TRADEMIN_POLY_SOCKET": null}}
+and the daemon replies with the command's output as it is written, then its
+exit status
+    {"stdout": "..."}  {"stderr": "..."}  ...  {"exit": 0}
+{"argv": null} asks the daemon to stop.
+
+Commands run one at a time, in the client's working directory. The warm
+clients were made with the daemon's environment, so a client whose
+`FORWARDED_ENV` settings differ is refused ({"refused": "..."}) and runs
+the command itself instead.
+
+eg,
+    $> trademin-poly serve &
+    $> trademin-poly marketstatus  # forwarded to the daemon
+'''
+
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+
+from . import BASE_URL_ENV
+
+# where the daemon listens by default
+DEFAULT_SOCKET_PATH = os.path.expanduser("~/.config/trademin/poly.sock")
+
+# environment variable overriding the socket path
+SOCKET_ENV = 'TRADEMIN_POLY_SOCKET'
+
+
+# environment variables a command must see the same in the daemon
+FORWARDED_ENV = (BASE_URL_ENV, SOCKET_ENV)
+
+
+def socket_path(path=None):
+    return path or os.environ.get(SOCKET_ENV) or DEFAULT_SOCKET_PATH
+
+
+def _environment():
+    return {name: os.environ.get(name) for name in FORWARDED_ENV}
+
+
+class _ReplyStream(io.TextIOBase):
+    '''
+    A text stream sending whatever is written to it as {name: text} lines.
+    '''
+
+    def __init__(self, send, name):
+        self._send = send
+        self.name = name
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if text:
+            self._send({self.name: text})
+        return len(text)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def _send(self, message):
+        self.wfile.write(json.dumps(message).encode() + b'\n')
+        self.wfile.flush()
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        request = json.loads(line)
+        if request.get('argv') is None:
+            self._send({'exit': 0})
+            threading.Thread(target=self.server.shutdown).start()
+            return
+        environment = _environment()
+        differs = sorted(name for name, value in request.get('env', {}).items()
+                         if environment.get(name) != value)
+        if differs:
+            self._send({'refused': f'{", ".join(differs)} differs from the '
+                        "daemon's"})
+            return
+        status = self.server.run_command(request['argv'], request.get('cwd'),
+                                         self._send)
+        with contextlib.suppress(BrokenPipeError, ConnectionResetError):
+            self._send({'exit': status})
+
+
+class Daemon(socketserver.ThreadingUnixStreamServer):
+    '''
+    Listens on the Unix socket `path` and runs each command it receives with
+    `run(argv)` (returning an exit status, or raising SystemExit), with its
+    stdout and stderr sent back to the client.
+    '''
+    daemon_threads = True
+
+    def __init__(self, run, path=None):
+        self.run = run
+        self.path = socket_path(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            if is_running(self.path):
+                raise RuntimeError(f"a daemon is already running on "
+                                   f"{self.path}")
+            os.unlink(self.path)
+        self._lock = threading.Lock()
+        umask = os.umask(0o077)
+        try:
+            super().__init__(self.path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def run_command(self, argv, cwd, send):
+        '''
+        Runs one command, returns its exit status.
+        '''
+        stdout = _ReplyStream(send, 'stdout')
+        stderr = _ReplyStream(send, 'stderr')
+        with self._lock, contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr):
+            previous = os.getcwd()
+            try:
+                if cwd:
+                    os.chdir(cwd)
+                status = self.run(argv)
+            except SystemExit as exit:
+                status = exit.code
+                if isinstance(status, str):
+                    print (status, file=sys.stderr)
+                    status = 1
+            except (BrokenPipeError, ConnectionResetError):
+                # the client went away
+                return 1
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                os.chdir(previous)
+        return status or 0
+
+    def serve(self):
+        '''
+        Serve until stopped (see `stop`) or interrupted.
+        '''
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server_close()
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+
+
+def _connect(path):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except OSError:
+        client.close()
+        return None
+    return client
+
+
+def is_running(path=None):
+    client = _connect(socket_path(path))
+    if client is None:
+        return False
+    client.close()
+    return True
+
+
+def _request(client, message, stdout, stderr):
+    with client, client.makefile('rwb') as stream:
+        stream.write(json.dumps(message).encode() + b'\n')
+        stream.flush()
+        for line in stream:
+            reply = json.loads(line)
+            if 'stdout' in reply:
+                stdout.write(reply['stdout'])
+                stdout.flush()
+            elif 'stderr' in reply:
+                stderr.write(reply['stderr'])
+                stderr.flush()
+            elif 'exit' in reply:
+                return reply['exit']
+            elif 'refused' in reply:
+                return None
+    raise ConnectionError('the daemon closed the connection')
+
+
+def forward(argv, path=None, stdout=None, stderr=None):
+    '''
+    Runs the command `argv` in the daemon listening on `path`, writing its
+    output to `stdout` and `stderr` (default sys.stdout and sys.stderr).
+    Returns the command's exit status, or None if no daemon is running or
+    it refused the command (its `FORWARDED_ENV` differs from ours).
+    '''
+    client = _connect(socket_path(path))
+    if client is None:
+        return None
+    return _request(client, {'argv': list(argv), 'cwd': os.getcwd(),
+                             'env': _environment()},
+                    stdout or sys.stdout, stderr or sys.stderr)
+
+
+def stop(path=None):
+    '''
+    Stops the daemon listening on `path`. Returns False if none was running.
+    '''
+    client = _connect(socket_path(path))
+    if client is None:
+        return False
+    _request(client, {'argv': None}, sys.stdout, sys.stderr)
+    return True
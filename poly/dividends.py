@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+'''
+Batch dividend calendar engine.
+
+Works out the last dividend, the next known dividend, or a guess at the next
+ex-dividend date, for any number of tickers at once, using a handful of
+vectorized pandas operations over one frame holding every ticker's history.
+
+eg,
+    calendar = dividend_calendar({
+        'BAC': [{'exDate': '2020-12-03', 'amount': 0.18, ...}, ...],
+        'UBER': [],
+        })
+    calendar['BAC']['next']
+
+`DividendStore` keeps each ticker's full dividend history in a local SQLite
+file, so it only needs to be fetched again once it is considered stale.
+'''
+
+import datetime
+import json
+import os
+import threading
+import time
+
+from . import instrument
+
+# how many of the most common dividend months are considered for a guess
+GUESS_MONTHS = 4
+
+# the default path of the local dividend history store
+DEFAULT_DIVIDEND_STORE_PATH = os.path.expanduser(
+    "~/.config/trademin/dividends.sqlite")
+
+# how many days a stored dividend history is trusted before it is fetched
+# again, overridden by 'dividend_max_age_days' in the JSON config
+DEFAULT_DIVIDEND_MAX_AGE_DAYS = 7
+
+
+def dividends_frame(results_by_ticker):
+    '''
+    Build one frame from a {ticker: [dividend record, ...]} dictionary, as
+    returned under 'results' by Polygon `reference/dividends`. The original
+    record dictionaries are kept in the '_record' column.
+    '''
+    import pandas
+    tickers, ex_dates, records = [], [], []
+    for ticker, results in results_by_ticker.items():
+        for record in results or []:
+            tickers.append(ticker)
+            ex_dates.append(record['exDate'])
+            records.append(record)
+    return pandas.DataFrame({
+        'ticker': pandas.Series(tickers, dtype=object),
+        'exDate': pandas.Series(ex_dates, dtype=object),
+        '_record': pandas.Series(records, dtype=object)})
+
+
+def _record(frame, row):
+    if '_record' in frame:
+        return frame['_record'].iat[row]
+    return frame.iloc[row].to_dict()
+
+
+@instrument.timed('dividends.calendar')
+def dividend_calendar(dividends, today=None, guess=True):
+    '''
+    Input: either a {ticker: [dividend record, ...]} dictionary or a frame
+    with (at least) 'ticker' and 'exDate' columns holding the dividend history
+    of every ticker.
+
+    Output: {ticker: {'last': record, 'next': record}}
+
+    'last' is the record with the most recent exDate (None without history).
+
+    'next' is that same record when its exDate is not in the past (ie, it is
+    already announced). Otherwise, if `guess` is True, it is an estimate
+    based on the most common months dividends were paid in before: the first
+    of the (up to 4) most common months that is not behind the current month
+    (or the earliest of them), projected a year on from the last time a
+    dividend was paid in that month. eg,
+        {'ticker': 'BAC', 'guess': 1, 'exDate': '2021-03-04', 'amount': 0.18}
+    where 'amount' is the most recent dividend amount. With `guess` False,
+    'next' is None until the next dividend is announced.
+    '''
+    import numpy
+    import pandas
+
+    if today is None:
+        today = datetime.date.today()
+
+    if isinstance(dividends, dict):
+        tickers = list(dividends)
+        frame = dividends_frame(dividends)
+    else:
+        frame = dividends.reset_index(drop=True)
+        tickers = list(pandas.unique(frame['ticker']))
+
+    calendar = {ticker: {'last': None, 'next': None} for ticker in tickers}
+    if frame.empty:
+        return calendar
+
+    df = pandas.DataFrame({
+        'ticker': frame['ticker'].to_numpy(),
+        'exDate': frame['exDate'].to_numpy(),
+        'row': numpy.arange(len(frame))})
+    df['date'] = pandas.to_datetime(df['exDate'])
+    # oldest first, ties keep their original order
+    df = df.sort_values(['ticker', 'date', 'row'], kind='stable')
+
+    last = df.drop_duplicates('ticker', keep='last')
+    for ticker, row in zip(last['ticker'], last['row']):
+        calendar[ticker]['last'] = _record(frame, row)
+
+    announced = last['date'] >= pandas.Timestamp(today)
+    for ticker, row in zip(last['ticker'][announced], last['row'][announced]):
+        calendar[ticker]['next'] = _record(frame, row)
+
+    if not guess or announced.all():
+        return calendar
+
+    # Guess for every ticker whose last dividend is in the past
+    history = df[df['ticker'].isin(last['ticker'][~announced])].copy()
+    history['month'] = history['date'].dt.month
+
+    # the most common dividend months per ticker
+    counts = (history.groupby(['ticker', 'month']).size()
+              .rename('count').reset_index())
+    counts = counts.sort_values(['ticker', 'count', 'month'],
+                                ascending=[True, False, True], kind='stable')
+    common = counts.groupby('ticker').head(GUESS_MONTHS).copy()
+
+    # pick the first common month which is not behind this month, falling
+    # back to the earliest (december counts as 0, for simpler sorting)
+    this_month = 0 if today.month == 12 else today.month
+    common['behind'] = common['month'] < this_month
+    chosen = (common.sort_values(['ticker', 'behind', 'month'], kind='stable')
+              .drop_duplicates('ticker')[['ticker', 'month']])
+
+    # the most recent dividend paid in the chosen month
+    in_month = history.merge(chosen, on=['ticker', 'month'])
+    in_month = (in_month.sort_values(['ticker', 'date', 'row'], kind='stable')
+                .drop_duplicates('ticker', keep='last'))
+
+    for ticker, ex_date, year in zip(in_month['ticker'], in_month['exDate'],
+                                     in_month['date'].dt.year):
+        calendar[ticker]['next'] = {
+            'ticker': ticker,
+            'guess': 1,
+            'exDate': f'{year + 1}{ex_date[4:]}',
+            'amount': calendar[ticker]['last'].get('amount'),
+            }
+    return calendar
+
+
+class DividendStore:
+    '''
+    SQLite backed store of dividend histories, one set of records per ticker
+    along with when it was last refreshed from Polygon and what its next
+    (announced or guessed) exDate was at the time.
+
+    Safe to share across threads.
+    '''
+
+    def __init__(self, path=DEFAULT_DIVIDEND_STORE_PATH):
+        import sqlite3
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            columns = [row[1] for row in self._db.execute(
+                'PRAGMA table_info(dividends)')]
+            if columns and 'seq' not in columns:
+                # older stores keyed on (ticker, exDate), which collapsed
+                # dividends sharing an exDate, so fetch everything again
+                self._db.execute('DROP TABLE dividends')
+                self._db.execute('DROP TABLE IF EXISTS refreshed')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS dividends ('
+                ' ticker TEXT NOT NULL,'
+                ' seq INTEGER NOT NULL,'
+                ' exDate TEXT NOT NULL,'
+                ' record TEXT NOT NULL,'
+                ' PRIMARY KEY (ticker, seq))')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS refreshed ('
+                ' ticker TEXT PRIMARY KEY,'
+                ' refreshed_at REAL NOT NULL,'
+                ' count INTEGER,'
+                ' next_exDate TEXT)')
+
+    def close(self):
+        self._db.close()
+
+    def load(self, ticker):
+        '''
+        Returns the stored dividend records for `ticker`, oldest first.
+        '''
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT record FROM dividends WHERE ticker = ?'
+                ' ORDER BY exDate, seq', (ticker,)).fetchall()
+        return [json.loads(record) for record, in rows]
+
+    def count(self, ticker):
+        '''
+        Returns the dividend count Polygon reported at the last refresh.
+        '''
+        with self._lock:
+            row = self._db.execute(
+                'SELECT count FROM refreshed WHERE ticker = ?',
+                (ticker,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, ticker, results, count=None, next_ex_date=None,
+             refreshed_at=None):
+        '''
+        Replace the stored history of `ticker` with `results` and mark it as
+        refreshed at `refreshed_at` (Unix seconds, default now).
+        '''
+        if refreshed_at is None:
+            refreshed_at = time.time()
+        if count is None:
+            count = len(results)
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM dividends WHERE ticker = ?',
+                             (ticker,))
+            self._db.executemany(
+                'INSERT INTO dividends VALUES (?, ?, ?, ?)',
+                [(ticker, seq, record['exDate'], json.dumps(record))
+                 for seq, record in enumerate(results)])
+            self._db.execute(
+                'INSERT OR REPLACE INTO refreshed VALUES (?, ?, ?, ?)',
+                (ticker, refreshed_at, count, next_ex_date))
+        return True
+
+    def stale_tickers(self, tickers, max_age_days=DEFAULT_DIVIDEND_MAX_AGE_DAYS,
+                      now=None):
+        '''
+        Returns the tickers (in the given order) whose history needs fetching:
+        never stored, refreshed more than `max_age_days` ago, or whose next
+        exDate has been reached since the last refresh.
+        '''
+        if now is None:
+            now = time.time()
+        today = datetime.date.fromtimestamp(now).isoformat()
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT ticker, refreshed_at, next_exDate FROM refreshed'
+                ).fetchall()
+        refreshed = {ticker: (at, next_ex) for ticker, at, next_ex in rows}
+
+        stale = []
+        for ticker in tickers:
+            if ticker not in refreshed:
+                stale.append(ticker)
+                continue
+            refreshed_at, next_ex_date = refreshed[ticker]
+            refreshed_on = datetime.date.fromtimestamp(refreshed_at).isoformat()
+            if now - refreshed_at > max_age_days * 86400:
+                stale.append(ticker)
+            elif next_ex_date and refreshed_on < next_ex_date <= today:
+                stale.append(ticker)
+        return stale
@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+'''
+Technical indicators over bar series, in two modes giving the same values:
+
+  batch      vectorized over a whole history (`Bars`), eg
+                 closes_sma = sma(bars, 20)
+                 values = compute(bars, {'sma20': ('sma', 20),
+                                         'rsi14': ('rsi', 14)})
+
+  streaming  stateful objects updated one bar (dictionary) at a time, in
+             constant time per bar, eg
+                 engine = IndicatorEngine({'sma20': ('sma', 20)})
+                 stream_client.on('bar', engine.update)
+                 engine.values('BAC')['sma20']
+
+Indicators ('kind' in the specs):
+  sma     simple moving average of `field` (default close)
+  ema     exponential moving average of `field`, alpha = 2 / (period + 1),
+          seeded with the SMA of the first `period` values
+  vwap    rolling volume weighted average price over `period` bars, using
+          each bar's 'vw' (or (h + l + c) / 3 when missing)
+  atr     average true range, Wilder smoothed (alpha = 1 / period)
+  rsi     relative strength index of `field`, Wilder smoothed
+
+Values are NaN until an indicator has seen enough bars. SMA and VWAP match
+bit for bit across both modes, the exponentially smoothed ones (EMA, ATR and
+RSI) up to floating point rounding. The rolling sums behind SMA and VWAP
+restart every `SUM_BLOCK` values, so their rounding error stays bounded
+however long a stream runs.
+'''
+
+import collections
+import math
+
+import numpy
+
+NAN = float('nan')
+
+# values per block of the rolling sums' running totals, see `_rolling_sums`
+SUM_BLOCK = 1024
+
+
+def _price(bar):
+    vw = bar.get('vw', NAN)
+    if vw is None or math.isnan(vw):
+        return (bar['h'] + bar['l'] + bar['c']) / 3
+    return vw
+
+
+def _prices(bars):
+    return numpy.where(numpy.isnan(bars.vw), (bars.h + bars.l + bars.c) / 3,
+                       bars.vw)
+
+
+## batch ##
+
+def _rolling_sums(values, period):
+    '''
+    Returns the sum of each `period` long window of `values`, ending at
+    every index from period - 1 on.
+
+    Running totals are restarted at every block of max(`SUM_BLOCK`, period)
+    values, so they never grow large enough to lose the precision of a
+    window (a window spans at most two blocks). `_RollingSum` does the same
+    operations one value at a time, so both modes round the same way.
+    '''
+    values = numpy.asarray(values, dtype=numpy.float64)
+    block = max(SUM_BLOCK, period)
+    padded = numpy.zeros(-(-len(values) // block) * block)
+    padded[:len(values)] = values
+    totals = numpy.cumsum(padded.reshape(-1, block), axis=1).ravel()
+
+    ends = numpy.arange(period - 1, len(values))
+    starts = ends - period + 1
+    # (unused where a window starts at index 0, or within the first block)
+    before = totals[starts - 1]
+    block_end = totals[ends // block * block - 1]
+    return numpy.where(
+        starts % block == 0, totals[ends],
+        numpy.where(starts // block == ends // block, totals[ends] - before,
+                    (block_end - before) + totals[ends]))
+
+
+def _smooth(values, alpha, period):
+    '''
+    Exponential smoothing of `values` seeded with the mean of the first
+    `period` values, NaN before that.
+    '''
+    import pandas
+    values = numpy.asarray(values, dtype=numpy.float64)
+    smoothed = numpy.full(len(values), numpy.nan)
+    if len(values) < period:
+        return smoothed
+    seeded = values[period - 1:].copy()
+    seeded[0] = numpy.cumsum(values[:period])[-1] / period
+    smoothed[period - 1:] = pandas.Series(seeded).ewm(
+        alpha=alpha, adjust=False).mean().to_numpy()
+    return smoothed
+
+
+def _rsi_from_averages(gain, loss):
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100 - 100 / (1 + gain / loss)
+    rsi = numpy.where(loss == 0, numpy.where(gain == 0, 50.0, 100.0), rsi)
+    return numpy.where(numpy.isnan(gain), numpy.nan, rsi)
+
+
+def sma(bars, period, field='c'):
+    values = getattr(bars, field).astype(numpy.float64)
+    result = numpy.full(len(values), numpy.nan)
+    if len(values) >= period:
+        result[period - 1:] = _rolling_sums(values, period) / period
+    return result
+
+
+def ema(bars, period, field='c'):
+    return _smooth(getattr(bars, field), 2 / (period + 1), period)
+
+
+def rolling_vwap(bars, period):
+    result = numpy.full(len(bars), numpy.nan)
+    if len(bars) >= period:
+        volume = _rolling_sums(bars.v, period)
+        weighted = _rolling_sums(_prices(bars) * bars.v, period)
+        window = result[period - 1:]
+        numpy.divide(weighted, volume, out=window, where=volume > 0)
+    return result
+
+
+def true_range(bars):
+    previous = numpy.concatenate(([numpy.nan], bars.c[:-1]))
+    ranges = numpy.stack([bars.h - bars.l, numpy.abs(bars.h - previous),
+                          numpy.abs(bars.l - previous)])
+    return numpy.nanmax(ranges, axis=0) if len(bars) else bars.h - bars.l
+
+
+def atr(bars, period):
+    return _smooth(true_range(bars), 1 / period, period)
+
+
+def rsi(bars, period, field='c'):
+    values = getattr(bars, field).astype(numpy.float64)
+    result = numpy.full(len(values), numpy.nan)
+    deltas = numpy.diff(values)
+    gain = _smooth(numpy.maximum(deltas, 0), 1 / period, period)
+    loss = _smooth(numpy.maximum(-deltas, 0), 1 / period, period)
+    result[1:] = _rsi_from_averages(gain, loss)
+    return result
+
+
+## streaming ##
+
+class _RollingSum:
+    '''
+    Streaming `_rolling_sums`: `update` returns the sum of the last `period`
+    values (NaN until there are that many).
+    '''
+
+    def __init__(self, period):
+        self.period = period
+        self.block = max(SUM_BLOCK, period)
+        self._count = 0
+        # block running totals of the last `period` + 1 values
+        self._totals = collections.deque(maxlen=period + 1)
+        # the running total at the end of the previous block
+        self._block_end = 0.0
+
+    def update(self, value):
+        end = self._count
+        self._count += 1
+        total = (value if end % self.block == 0 else
+                 self._totals[-1] + value)
+        self._totals.append(total)
+        start = end - self.period + 1
+        if start < 0:
+            window = NAN
+        elif start % self.block == 0:
+            window = total
+        elif start // self.block == end // self.block:
+            window = total - self._totals[0]
+        else:
+            window = (self._block_end - self._totals[0]) + total
+        if end % self.block == self.block - 1:
+            self._block_end = total
+        return window
+
+
+class SMA:
+    '''
+    Streaming `sma`.
+    '''
+
+    def __init__(self, period, field='c'):
+        self.period = period
+        self.field = field
+        self.value = NAN
+        self._sum = _RollingSum(period)
+
+    def update(self, bar):
+        self.value = self._sum.update(bar[self.field]) / self.period
+        return self.value
+
+
+class _Smoothed:
+    '''
+    Exponential smoothing, seeded with the mean of the first `period` values.
+    '''
+
+    def __init__(self, period, alpha):
+        self.period = period
+        self.alpha = alpha
+        self.value = NAN
+        self._count = 0
+        self._total = 0.0
+
+    def update(self, value):
+        if self._count < self.period:
+            self._count += 1
+            self._total += value
+            if self._count == self.period:
+                self.value = self._total / self.period
+        else:
+            self.value = (1 - self.alpha) * self.value + self.alpha * value
+        return self.value
+
+
+class EMA:
+    '''
+    Streaming `ema`.
+    '''
+
+    def __init__(self, period, field='c'):
+        self.field = field
+        self._ema = _Smoothed(period, 2 / (period + 1))
+        self.value = NAN
+
+    def update(self, bar):
+        self.value = self._ema.update(bar[self.field])
+        return self.value
+
+
+class VWAP:
+    '''
+    Streaming `rolling_vwap`.
+    '''
+
+    def __init__(self, period):
+        self.period = period
+        self.value = NAN
+        self._weighted = _RollingSum(period)
+        self._volume = _RollingSum(period)
+
+    def update(self, bar):
+        weighted = self._weighted.update(_price(bar) * bar['v'])
+        volume = self._volume.update(bar['v'])
+        self.value = weighted / volume if volume > 0 else NAN
+        return self.value
+
+
+class ATR:
+    '''
+    Streaming `atr`.
+    '''
+
+    def __init__(self, period):
+        self._atr = _Smoothed(period, 1 / period)
+        self._close = None
+        self.value = NAN
+
+    def update(self, bar):
+        high, low = bar['h'], bar['l']
+        true_range = high - low
+        if self._close is not None:
+            true_range = max(true_range, abs(high - self._close),
+                             abs(low - self._close))
+        self._close = bar['c']
+        self.value = self._atr.update(true_range)
+        return self.value
+
+
+class RSI:
+    '''
+    Streaming `rsi`.
+    '''
+
+    def __init__(self, period, field='c'):
+        self.field = field
+        self._gain = _Smoothed(period, 1 / period)
+        self._loss = _Smoothed(period, 1 / period)
+        self._last = None
+        self.value = NAN
+
+    def update(self, bar):
+        value = bar[self.field]
+        if self._last is not None:
+            delta = value - self._last
+            gain = self._gain.update(max(delta, 0.0))
+            loss = self._loss.update(max(-delta, 0.0))
+            if not math.isnan(gain):
+                if loss == 0:
+                    self.value = 50.0 if gain == 0 else 100.0
+                else:
+                    self.value = 100 - 100 / (1 + gain / loss)
+        self._last = value
+        return self.value
+
+
+# kind: (batch function, streaming class)
+INDICATORS = {
+    'sma': (sma, SMA),
+    'ema': (ema, EMA),
+    'vwap': (rolling_vwap, VWAP),
+    'atr': (atr, ATR),
+    'rsi': (rsi, RSI),
+}
+
+
+def _spec(spec):
+    kind, *args = spec
+    if kind not in INDICATORS:
+        raise ValueError(f"unknown indicator ({kind})")
+    return INDICATORS[kind], args
+
+
+def compute(bars, specs):
+    '''
+    Batch mode. `specs` maps a name to (kind, period[, field]), eg
+    {'sma20': ('sma', 20)}. Returns {name: numpy array, one value per bar}.
+    '''
+    results = {}
+    for name, spec in specs.items():
+        (function, _), args = _spec(spec)
+        results[name] = function(bars, *args)
+    return results
+
+
+class IndicatorEngine:
+    '''
+    Streaming mode for many tickers. Keeps one set of `specs` indicators
+    (see `compute`) per ticker, created on the ticker's first bar.
+    '''
+
+    def __init__(self, specs):
+        self.specs = {name: _spec(spec) for name, spec in specs.items()}
+        self._indicators = {}
+        self._values = {}
+
+    def update(self, ticker, bar):
+        '''
+        Feed the next bar (dictionary) of `ticker`, returns {name: value}.
+        '''
+        indicators = self._indicators.get(ticker)
+        if indicators is None:
+            indicators = self._indicators[ticker] = {
+                name: cls(*args) for name, ((_, cls), args)
+                in self.specs.items()}
+        values = self._values[ticker] = {
+            name: indicator.update(bar)
+            for name, indicator in indicators.items()}
+        return values
+
+    def values(self, ticker):
+        '''
+        Returns the latest {name: value} of `ticker`.
+        '''
+        return self._values.get(ticker, {})
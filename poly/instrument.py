@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+'''
+Lightweight performance instrumentation.
+
+Code in `poly` marks its stages with spans, eg,
+
+    with instrument.span('cache.load', ticker=symbol):
+        ...
+
+Spans are only recorded while a `Recorder` is enabled. Disabled (the
+default), `span` returns a shared do-nothing context, so instrumented code
+costs one global lookup and a function call per span.
+
+Recorded spans:
+  request           every Polygon API call, including rate limit waits and
+                    retries (fields: call, retries)
+  http              every HTTP response received (fields: status, bytes),
+                    its duration is the time until the response headers
+  rate_limit.wait   time spent waiting for the rate limit
+  ...               stages such as date_parse, dividends.calendar,
+                    aggregates.merge, timestamps_to_isoformat, cache.load,
+                    cache.store, barstore.append, barstore.read and
+                    writer.write
+
+eg,
+    recorder = instrument.enable()
+    poly.get_ticker_aggregates(api_key, 'BAC', '2021-01-04', '2021-01-29')
+    instrument.disable()
+    print(recorder.table())
+'''
+
+import functools
+import json
+import threading
+import time
+
+_RECORDER = None
+
+# numeric span fields summed up by `Recorder.summary`, others are labels
+COUNTERS = ('bytes', 'retries')
+
+
+class _NullSpan:
+    '''
+    The span used while instrumentation is disabled.
+    '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def add(self, **counts):
+        pass
+
+    def set(self, **fields):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    '''
+    A timed stage, recorded by `recorder` once the `with` block exits.
+    '''
+    __slots__ = ('recorder', 'name', 'fields', 'start', 'duration')
+
+    def __init__(self, recorder, name, fields):
+        self.recorder = recorder
+        self.name = name
+        self.fields = fields
+        self.start = None
+        self.duration = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.fields['error'] = exc_type.__name__
+        self.recorder.spans.append(self)
+        return False
+
+    def add(self, **counts):
+        '''
+        Add to numeric fields, eg span.add(retries=1).
+        '''
+        for key, value in counts.items():
+            self.fields[key] = self.fields.get(key, 0) + value
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def to_dict(self):
+        return dict(self.fields, name=self.name,
+                    start=self.start - self.recorder.started,
+                    duration=self.duration)
+
+
+class Recorder:
+    '''
+    Collects the spans recorded while it is enabled, from any thread.
+    '''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stopped = None
+        # list.append is atomic, no lock needed to record
+        self.spans = []
+
+    def span(self, name, **fields):
+        return Span(self, name, fields)
+
+    def record(self, name, duration, **fields):
+        '''
+        Record a span measured elsewhere, `duration` seconds long ending now.
+        '''
+        span = Span(self, name, fields)
+        span.start = time.perf_counter() - duration
+        span.duration = duration
+        self.spans.append(span)
+
+    @property
+    def wall(self):
+        return (self.stopped or time.perf_counter()) - self.started
+
+    def summary(self):
+        '''
+        Returns {name: statistics} of the spans, by total time: count,
+        total, mean, p50 and max seconds, plus the sum of each of their
+        `COUNTERS` fields.
+        '''
+        stats = {}
+        for span in list(self.spans):
+            entry = stats.setdefault(span.name, {'count': 0, 'total': 0.0,
+                                                 'max': 0.0, 'durations': []})
+            entry['count'] += 1
+            entry['total'] += span.duration
+            entry['max'] = max(entry['max'], span.duration)
+            entry['durations'].append(span.duration)
+            for key in COUNTERS:
+                if key in span.fields:
+                    entry[key] = entry.get(key, 0) + span.fields[key]
+        for entry in stats.values():
+            durations = sorted(entry.pop('durations'))
+            entry['mean'] = entry['total'] / entry['count']
+            entry['p50'] = durations[len(durations) // 2]
+        return dict(sorted(stats.items(), key=lambda item: -item[1]['total']))
+
+    def to_dict(self, spans=True):
+        '''
+        The JSON report: wall time, the summary and (optionally) every span.
+        '''
+        report = {'wall': self.wall, 'summary': self.summary()}
+        if spans:
+            report['spans'] = [span.to_dict() for span in list(self.spans)]
+        return report
+
+    def json(self, spans=True):
+        return json.dumps(self.to_dict(spans), indent=2, default=str)
+
+    def table(self):
+        '''
+        Returns the summary as a text table.
+        '''
+        lines = [f'{"span":<24} {"count":>7} {"total s":>9} {"mean ms":>9} '
+                 f'{"p50 ms":>9} {"max ms":>9}  other']
+        for name, entry in self.summary().items():
+            other = ', '.join(f'{key}={entry[key]:,}' for key in COUNTERS
+                              if key in entry)
+            lines.append(
+                f'{name:<24} {entry["count"]:>7} {entry["total"]:>9.3f} '
+                f'{entry["mean"] * 1000:>9.2f} {entry["p50"] * 1000:>9.2f} '
+                f'{entry["max"] * 1000:>9.2f}  {other}')
+        lines.append(f'wall time {self.wall:.3f} s')
+        return '\n'.join(lines)
+
+
+_LOCK = threading.Lock()
+
+
+def enable(recorder=None):
+    '''
+    Start recording spans into `recorder` (default a new `Recorder`), which
+    is returned.
+    '''
+    global _RECORDER
+    with _LOCK:
+        _RECORDER = recorder or Recorder()
+        return _RECORDER
+
+
+def disable():
+    '''
+    Stop recording, returns the recorder that was enabled (if any).
+    '''
+    global _RECORDER
+    with _LOCK:
+        recorder, _RECORDER = _RECORDER, None
+    if recorder is not None:
+        recorder.stopped = time.perf_counter()
+    return recorder
+
+
+def enabled():
+    return _RECORDER is not None
+
+
+def span(name, **fields):
+    '''
+    Returns a context manager timing the stage `name`, see the module
+    docstring.
+    '''
+    recorder = _RECORDER
+    if recorder is None:
+        return _NULL_SPAN
+    return recorder.span(name, **fields)
+
+
+def timed(name):
+    '''
+    Decorator recording every call of the function as a span `name`.
+    '''
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _RECORDER is None:
+                return function(*args, **kwargs)
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record(name, duration, **fields):
+    '''
+    Record a span of `duration` seconds measured elsewhere, if enabled.
+    '''
+    recorder = _RECORDER
+    if recorder is not None:
+        recorder.record(name, duration, **fields)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+'''
+Market status, as a structured object, with a schedule aware cache.
+
+US stock sessions follow the NYSE calendar in `trading_calendar` (New York
+time, weekdays other than holidays, with early closes):
+  04:00 - 09:30  extended-hours (pre-market)
+  09:30 - 16:00  open            (13:00 on early close days)
+  16:00 - 20:00  extended-hours  (13:00 - 17:00 on early close days)
+  otherwise      closed
+
+`MarketStatusCache` keeps the last `MarketStatus` fetched from Polygon until
+its TTL runs out or the next session boundary is reached, whichever comes
+first, so frequent "is the market open?" checks rarely need a request.
+Questions about other times are answered from the schedule alone.
+'''
+
+import datetime
+import threading
+import time
+
+from .trading_calendar import NEW_YORK, sessions
+
+# seconds a fetched market status is trusted for, at most
+DEFAULT_MARKET_STATUS_TTL = 300
+
+# seconds a status fetched right after a session boundary is trusted for,
+# in case the server has not flipped over to the new session yet
+DEFAULT_MARKET_STATUS_MARGIN = 15
+
+
+def _as_new_york(at):
+    '''
+    Accepts Unix seconds, a timezone aware datetime or None (now).
+    '''
+    if at is None:
+        at = time.time()
+    if isinstance(at, datetime.datetime):
+        return at.astimezone(NEW_YORK)
+    return datetime.datetime.fromtimestamp(at, tz=NEW_YORK)
+
+
+def session_at(at=None):
+    '''
+    Returns the scheduled US stock session ('open', 'extended-hours' or
+    'closed') at `at` (Unix seconds or an aware datetime, default now),
+    taking holidays and early closes into account.
+    '''
+    local = _as_new_york(at)
+    session = 'closed'
+    for start, name in sessions(local.date()):
+        if local.time() >= start:
+            session = name
+    return session
+
+
+def next_transition(at=None):
+    '''
+    Returns the (aware) datetime of the first session boundary after `at`.
+    '''
+    local = _as_new_york(at)
+    day = local.date()
+    while True:
+        for start, _ in sessions(day)[1:]:
+            boundary = datetime.datetime.combine(day, start, NEW_YORK)
+            if boundary > local:
+                return boundary
+        day += datetime.timedelta(days=1)
+
+
+class MarketStatus:
+    '''
+    Polygon `marketstatus` response. Keeps the response attribute names
+    (market, serverTime, exchanges, currencies), plus `fetched_at` (Unix
+    seconds).
+    '''
+
+    def __init__(self, market, serverTime=None, exchanges=None,
+                 currencies=None, fetched_at=None, **extra):
+        self.market = market
+        self.serverTime = serverTime
+        self.exchanges = dict(exchanges or {})
+        self.currencies = dict(currencies or {})
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self.extra = extra
+
+    @classmethod
+    def from_response(cls, resp, fetched_at=None):
+        return cls(fetched_at=fetched_at, **resp.__dict__)
+
+    def __repr__(self):
+        return f'<MarketStatus {self.market} as of {self.serverTime}>'
+
+    def is_open(self, exchange=None):
+        '''
+        True if US stocks (or just `exchange`, eg 'nyse') are in the regular
+        session.
+        '''
+        status = self.exchanges.get(exchange) if exchange else self.market
+        return status == 'open'
+
+    def to_dict(self):
+        return dict(self.extra, market=self.market, serverTime=self.serverTime,
+                    exchanges=self.exchanges, currencies=self.currencies)
+
+    def template(self):
+        return (f'As of {self.serverTime}\n'
+                f'  Global Crypto:\t{self.currencies.get("crypto")}\n'
+                f'  Global FX:\t\t{self.currencies.get("fx")}\n'
+                f'  US Stocks:\t\t{self.market}\n'
+                f'\tNYSE:\t\t{self.exchanges.get("nyse")}\n'
+                f'\tNASDAQ:\t\t{self.exchanges.get("nasdaq")}\n'
+                f'\tOTC:\t\t{self.exchanges.get("otc")}\n'
+        )
+
+
+class MarketStatusCache:
+    '''
+    Caches the `MarketStatus` returned by `fetch()` (any callable) until
+    `ttl` seconds pass or the next session boundary, whichever is first.
+    A status fetched within `margin` seconds after a boundary is only kept
+    for `margin` seconds. Safe to share across threads.
+    '''
+
+    def __init__(self, fetch, ttl=DEFAULT_MARKET_STATUS_TTL,
+                 margin=DEFAULT_MARKET_STATUS_MARGIN, clock=time.time):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.margin = margin
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._status = None
+        self._expires = 0
+
+    def _expiry(self, status):
+        fetched_at = status.fetched_at
+        expires = min(fetched_at + self.ttl,
+                      next_transition(fetched_at).timestamp())
+        if session_at(fetched_at - self.margin) != session_at(fetched_at):
+            # just after a boundary, the server may not have caught up yet
+            expires = min(expires, fetched_at + self.margin)
+        return expires
+
+    def get(self):
+        '''
+        Returns the cached status, fetching a fresh one when it has expired.
+        '''
+        with self._lock:
+            now = self.clock()
+            if self._status is None or now >= self._expires:
+                self._put(self.fetch(), now)
+            return self._status
+
+    def _put(self, status, fetched_at):
+        status.fetched_at = fetched_at
+        self._status = status
+        self._expires = self._expiry(status)
+
+    def cached(self):
+        '''
+        Returns the cached status if it has not expired yet, else None.
+        '''
+        with self._lock:
+            if self._status is not None and self.clock() < self._expires:
+                return self._status
+        return None
+
+    def put(self, status, fetched_at=None):
+        '''
+        Cache a status fetched elsewhere (eg, asynchronously) at `fetched_at`
+        (default now), instead of calling `fetch`.
+        '''
+        with self._lock:
+            self._put(status, self.clock() if fetched_at is None
+                      else fetched_at)
+
+    def invalidate(self):
+        with self._lock:
+            self._status = None
+
+    def is_open(self, exchange='nyse', at=None):
+        '''
+        Is `exchange` in its regular session at `at` (Unix seconds or an aware
+        datetime, default now)? Times covered by the cached status use it,
+        any other time is answered from the schedule without a request.
+        '''
+        if at is None:
+            return self.get().is_open(exchange)
+
+        now = self.clock()
+        at_ts = at.timestamp() if isinstance(at, datetime.datetime) else at
+        with self._lock:
+            status = self._status
+            fresh = (status is not None and
+                     status.fetched_at <= at_ts < self._expires and
+                     now < self._expires)
+        if fresh:
+            return status.is_open(exchange)
+        return session_at(at_ts) == 'open'
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+'''
+Resample fine grained bars (usually 1 minute) into coarser ones locally,
+instead of asking Polygon again for every multiplier / timespan.
+
+Buckets are aligned to New York time:
+  minute, hour   clock aligned from New York midnight, eg 1 hour bars start
+                 on the hour (09:00, 10:00, ...), never straddling a date (5
+                 hour bars start at 00:00, 05:00, ... 20:00, the last one of
+                 a date 4 hours long)
+  day            New York dates, multi-day bars count from the first date
+  week           weeks starting on Sunday
+  month, quarter, year
+                 calendar months, quarters and years
+
+Each bar's open is the first open of its bucket, close the last close, high /
+low the extremes, volume and trade count ('n') the sums, and 'vw' the volume
+weighted average of the bars' 'vw'. Bars are stamped with the start of their
+bucket. Everything is vectorized, and `resample_many` converts timestamps to
+New York time once for several timeframes. eg,
+
+    minutes = poly.get_ticker_aggregates(api_key, 'BAC', ..., as_bars=True)
+    frames = resample_many(minutes, [(5, 'minute'), (1, 'hour'), (1, 'day')])
+    frames[(1, 'hour')].c
+'''
+
+import numpy
+
+from .bars import Bars
+from .market import NEW_YORK
+
+TIMESPANS = ('minute', 'hour', 'day', 'week', 'month', 'quarter', 'year')
+
+MINUTE_MS = 60 * 1000
+DAY_MS = 24 * 60 * MINUTE_MS
+
+# bucket width of the intraday timespans, in msec
+INTRADAY_MS = {
+    'minute': MINUTE_MS,
+    'hour': 60 * MINUTE_MS,
+}
+
+# bucket width of the calendar timespans, in months
+MONTHS = {
+    'month': 1,
+    'quarter': 3,
+    'year': 12,
+}
+
+# 1970-01-01 (day 0) was a Thursday, Sunday weeks start 4 days earlier
+WEEK_OFFSET_DAYS = 4
+
+
+def local_timestamps(bars):
+    '''
+    Returns the bar timestamps as New York wall clock time, in Unix msec
+    (ie, as if New York was UTC).
+    '''
+    import pandas
+    return pandas.to_datetime(bars.t, unit='ms', utc=True).tz_convert(
+        NEW_YORK).tz_localize(None).as_unit('ms').asi8
+
+
+def _local_midnight_to_utc(days):
+    '''
+    Converts New York dates (days since 1970-01-01) into the Unix msec
+    timestamp of their midnight.
+    '''
+    import pandas
+    local = pandas.DatetimeIndex(
+        numpy.asarray(days, dtype='int64').astype('datetime64[D]'))
+    return local.tz_localize(NEW_YORK).tz_convert('UTC').as_unit('ms').asi8
+
+
+def _buckets(bars, local_ms, multiplier, timespan):
+    '''
+    Returns (starts, t): the index of the first bar of each bucket and the
+    Unix msec timestamp each bucket starts at.
+    '''
+    days = local_ms // DAY_MS
+    if timespan in INTRADAY_MS:
+        # counted from each New York midnight, so widths that don't divide a
+        # day still restart at midnight (the last bucket of a date is short)
+        width = multiplier * INTRADAY_MS[timespan]
+        since_midnight = local_ms - days * DAY_MS
+        keys = days * (DAY_MS // width + 1) + since_midnight // width
+    else:
+        if timespan == 'day':
+            keys = (days - days[0]) // multiplier
+        elif timespan == 'week':
+            keys = (days + WEEK_OFFSET_DAYS) // (7 * multiplier)
+        else:
+            months = days.astype('datetime64[D]').astype(
+                'datetime64[M]').astype('int64')
+            keys = months // (MONTHS[timespan] * multiplier)
+
+    # a new bucket starts wherever the key changes. Intraday buckets also
+    # break where the UTC offset changes, which keeps apart the two 01:00
+    # hours New York has when daylight saving time ends.
+    changes = numpy.diff(keys) != 0
+    if timespan in INTRADAY_MS:
+        changes |= numpy.diff(local_ms - bars.t) != 0
+    starts = numpy.flatnonzero(changes) + 1
+    starts = numpy.concatenate(([0], starts))
+
+    if timespan in INTRADAY_MS:
+        t = bars.t[starts] - since_midnight[starts] % width
+    else:
+        if timespan == 'day':
+            first_days = days[0] + keys[starts] * multiplier
+        elif timespan == 'week':
+            first_days = keys[starts] * 7 * multiplier - WEEK_OFFSET_DAYS
+        else:
+            first_months = keys[starts] * MONTHS[timespan] * multiplier
+            first_days = first_months.astype('datetime64[M]').astype(
+                'datetime64[D]').astype('int64')
+        t = _local_midnight_to_utc(first_days)
+    return starts, t
+
+
+def _aggregate(bars, starts, t):
+    ends = numpy.concatenate((starts[1:], [len(bars)]))
+    has_vw = ~numpy.isnan(bars.vw)
+    weights = numpy.where(has_vw, bars.v, 0)
+    weighted = numpy.add.reduceat(
+        numpy.where(has_vw, bars.vw * bars.v, 0), starts)
+    volume = numpy.add.reduceat(weights, starts)
+    vw = numpy.full(len(starts), numpy.nan)
+    numpy.divide(weighted, volume, out=vw, where=volume > 0)
+    return Bars(
+        bars.ticker,
+        t=t,
+        o=bars.o[starts],
+        h=numpy.maximum.reduceat(bars.h, starts),
+        l=numpy.minimum.reduceat(bars.l, starts),
+        c=bars.c[ends - 1],
+        v=numpy.add.reduceat(bars.v, starts),
+        vw=vw,
+        n=numpy.add.reduceat(bars.n, starts))
+
+
+def resample_many(bars, timeframes, local_ms=None):
+    '''
+    Resample `bars` (a `Bars`, oldest first) into every (multiplier,
+    timespan) of `timeframes`, returning {(multiplier, timespan): Bars}.
+
+    local_ms: (optional) the bars' New York times, see `local_timestamps`,
+        when the caller already has them.
+    '''
+    timeframes = list(timeframes)
+    for multiplier, timespan in timeframes:
+        if timespan not in TIMESPANS:
+            raise ValueError(f"unknown timespan ({timespan})")
+        if multiplier < 1:
+            raise ValueError(f"multiplier must be at least 1 ({multiplier})")
+    if not len(bars):
+        return {timeframe: Bars(bars.ticker) for timeframe in timeframes}
+    if local_ms is None:
+        local_ms = local_timestamps(bars)
+
+    resampled = {}
+    for multiplier, timespan in timeframes:
+        starts, t = _buckets(bars, local_ms, multiplier, timespan)
+        resampled[(multiplier, timespan)] = _aggregate(bars, starts, t)
+    return resampled
+
+
+def resample(bars, multiplier=1, timespan='day'):
+    '''
+    Resample `bars` (a `Bars`, oldest first) into `multiplier` x `timespan`
+    bars, eg resample(minute_bars, 5, 'minute') for 5 minute bars.
+    '''
+    return resample_many(bars, [(multiplier, timespan)])[(multiplier, timespan)]
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+'''
+Central request scheduler for Polygon.io API calls.
+
+Every request made by a `PolyClient` goes through a `RequestScheduler`,
+which:
+  * paces requests with a token bucket, so we stay within the plan's
+    requests per minute ('requests_per_minute' in the JSON config),
+  * keeps two priority lanes, 'interactive' requests (eg, the CLI) always go
+    ahead of waiting 'bulk' requests (eg, backfills),
+  * retries rate limited (429), server error (5xx) and connection failures
+    with jittered exponential backoff, honouring any Retry-After header.
+
+Schedulers are shared per api key (see `poly.get_scheduler`), since that is
+what Polygon rate limits on.
+'''
+
+import random
+import threading
+import time
+
+from . import instrument
+
+PRIORITIES = ('interactive', 'bulk')
+
+# HTTP status codes worth retrying, on top of any 5xx
+RETRY_STATUSES = (408, 429)
+
+DEFAULT_MAX_RETRIES = 5
+
+# seconds, the backoff before retry N is a random time up to
+# min(DEFAULT_BACKOFF_MAX, DEFAULT_BACKOFF * 2 ** N)
+DEFAULT_BACKOFF = 0.5
+DEFAULT_BACKOFF_MAX = 30.0
+
+# seconds between `try_acquire` attempts while behind interactive requests
+DEFAULT_POLL = 0.01
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+class RequestScheduler:
+    '''
+    Token bucket rate limiter with priority lanes and retries.
+
+    requests_per_minute: sustained request rate, None for no limit.
+    burst: how many requests may go out back to back after a quiet spell.
+        Defaults to 1, ie requests are evenly spaced.
+    sleep, clock: used to wait between retries and to refill the bucket,
+        replaceable for testing.
+    '''
+
+    def __init__(self, requests_per_minute=None, burst=1,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF,
+                 backoff_max=DEFAULT_BACKOFF_MAX, sleep=time.sleep,
+                 clock=time.monotonic):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.sleep = sleep
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._waiting = dict.fromkeys(PRIORITIES, 0)
+        self.requests = 0
+        self.retries = 0
+        self.configure(requests_per_minute, burst)
+
+    def configure(self, requests_per_minute=None, burst=1):
+        '''
+        Change the rate limit, eg once the JSON config has been loaded.
+        '''
+        with self._cond:
+            self.requests_per_minute = requests_per_minute
+            self.burst = max(burst or 1, 1)
+            self._tokens = float(self.burst)
+            self._updated = self.clock()
+            self._cond.notify_all()
+
+    def _refill(self):
+        now = self.clock()
+        if self.requests_per_minute:
+            rate = self.requests_per_minute / 60.0
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._updated) * rate)
+        self._updated = now
+
+    def _take(self, priority):
+        '''
+        Take a token for a `priority` request, if it may go now. Returns 0,
+        or else the seconds to wait before trying again (None while behind
+        interactive requests without a rate limit). Call holding the lock.
+        '''
+        self._refill()
+        behind = priority == 'bulk' and self._waiting['interactive'] > 0
+        if not behind and not self.requests_per_minute:
+            return 0
+        if not behind and self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        if self.requests_per_minute:
+            rate = self.requests_per_minute / 60.0
+            return max((1 - self._tokens) / rate, 0.001)
+        return None
+
+    def acquire(self, priority='interactive'):
+        '''
+        Block until a request with `priority` may be sent.
+        '''
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown priority ({priority})")
+        with self._cond:
+            self._waiting[priority] += 1
+            waited = None
+            try:
+                while True:
+                    wait = self._take(priority)
+                    if wait == 0:
+                        return
+                    if waited is None:
+                        waited = time.perf_counter()
+                    self._cond.wait(wait)
+            finally:
+                if waited is not None:
+                    instrument.record('rate_limit.wait',
+                                      time.perf_counter() - waited,
+                                      priority=priority)
+                self._waiting[priority] -= 1
+                self.requests += 1
+                self._cond.notify_all()
+
+    def try_acquire(self, priority='interactive'):
+        '''
+        Non-blocking `acquire`, for callers that wait in their own way (eg,
+        an asyncio event loop). Returns 0 when a request with `priority` may
+        be sent now, else the seconds to wait before trying again.
+        '''
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown priority ({priority})")
+        with self._cond:
+            wait = self._take(priority)
+            if wait == 0:
+                self.requests += 1
+                return 0
+        return DEFAULT_POLL if wait is None else wait
+
+    def backoff_delay(self, attempt, response=None):
+        '''
+        Seconds to wait before retry number `attempt` (from 0).
+        '''
+        ceiling = min(self.backoff_max, self.backoff * 2 ** attempt)
+        return max(random.uniform(0, ceiling), _retry_after(response))
+
+    def call(self, fn, *args, priority='interactive', **kwargs):
+        '''
+        Call `fn(*args, **kwargs)` once the rate limit allows, retrying
+        transient failures. Anything else (or running out of retries) raises.
+        '''
+        with instrument.span('request', call=getattr(fn, '__name__', None),
+                             priority=priority, retries=0) as span:
+            return self._call(span, fn, args, kwargs, priority)
+
+    def _call(self, span, fn, args, kwargs, priority):
+        import requests
+        attempt = 0
+        while True:
+            self.acquire(priority)
+            try:
+                return fn(*args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                response = None
+                failure = error
+            except requests.HTTPError as error:
+                response = error.response
+                status = getattr(response, 'status_code', None)
+                if status is None or not (status in RETRY_STATUSES or
+                                          status >= 500):
+                    raise
+                failure = error
+            if attempt >= self.max_retries:
+                raise failure
+            self.sleep(self.backoff_delay(attempt, response))
+            attempt += 1
+            span.add(retries=1)
+            with self._cond:
+                self.retries += 1
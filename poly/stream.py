@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+'''
+Streaming minute bars and trades from the Polygon.io websocket.
+
+`StreamClient` subscribes to minute aggregates ('AM') and / or trades ('T')
+for any number of tickers and keeps the latest bars of every ticker in a
+fixed size `RingBuffer`, so live monitoring never has to re-poll the REST
+aggregates. Trades are rolled up into minute bars as they arrive, which
+also fills the buffers for tickers only subscribed to trades.
+
+eg,
+    client = StreamClient(api_key, ['BAC', 'T'], channels=('AM',))
+    client.on('bar', lambda ticker, bar: print(ticker, bar['c']))
+    client.start()
+    ...
+    client.buffer('BAC').bars().c.mean()
+    client.close()
+
+Bars use the same fields as the REST aggregates (see `bars.FIELDS`).
+'''
+
+import json
+import threading
+
+DEFAULT_STREAM_URL = 'wss://socket.polygon.io/stocks'
+
+# 'AM' minute aggregates, 'T' trades
+CHANNELS = ('AM', 'T')
+
+# latest bars kept per ticker, a full regular session of minute bars
+DEFAULT_BUFFER_SIZE = 390
+
+EVENTS = ('bar', 'trade', 'status')
+
+MINUTE_MS = 60 * 1000
+
+
+def bar_from_aggregate(event):
+    '''
+    Converts an 'AM' event into a bar dictionary, like the REST aggregates.
+    '''
+    return {
+        't': event['s'],
+        'o': event['o'],
+        'h': event['h'],
+        'l': event['l'],
+        'c': event['c'],
+        'v': event['v'],
+        'vw': event.get('vw', float('nan')),
+        'n': event.get('n', 0),
+        }
+
+
+class RingBuffer:
+    '''
+    Fixed size, columnar buffer of the latest `size` bars of one ticker.
+    Appending is O(1), the oldest bar is overwritten once it is full. Safe
+    to read while another thread appends.
+    '''
+
+    def __init__(self, ticker, size=DEFAULT_BUFFER_SIZE):
+        import numpy
+        from .bars import FIELDS
+        self.ticker = ticker
+        self.size = size
+        self._arrays = {field: numpy.zeros(size, dtype=dtype)
+                        for field, dtype in FIELDS.items()}
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def __repr__(self):
+        return f'<RingBuffer {self.ticker} ({len(self)}/{self.size} bars)>'
+
+    def append(self, bar):
+        '''
+        Add a bar dictionary. A bar with the same timestamp as the latest
+        one replaces it (eg, a corrected minute aggregate).
+        '''
+        from .bars import MISSING
+        with self._lock:
+            last = (self._next - 1) % self.size
+            if self._count and self._arrays['t'][last] == bar['t']:
+                index = last
+            else:
+                index = self._next
+                self._next = (self._next + 1) % self.size
+                self._count = min(self._count + 1, self.size)
+            for field, array in self._arrays.items():
+                array[index] = bar.get(field, MISSING.get(field, 0))
+
+    def last(self):
+        '''
+        Returns the latest bar as a dictionary, or None.
+        '''
+        with self._lock:
+            if not self._count:
+                return None
+            index = (self._next - 1) % self.size
+            return {field: array[index].item()
+                    for field, array in self._arrays.items()}
+
+    def bars(self, count=None):
+        '''
+        Returns (a copy of) the latest `count` bars (default all), oldest
+        first, as `Bars`.
+        '''
+        import numpy
+        from .bars import Bars
+        with self._lock:
+            count = self._count if count is None else min(count, self._count)
+            indices = (self._next - count + numpy.arange(count)) % self.size
+            arrays = {field: array[indices]
+                      for field, array in self._arrays.items()}
+        return Bars(self.ticker, **arrays)
+
+
+class StreamClient:
+    '''
+    Websocket client for the Polygon.io stocks cluster.
+
+    tickers: symbols to subscribe to.
+    channels: any of 'AM' (minute aggregates) and 'T' (trades).
+    buffer_size: bars kept per ticker, see `RingBuffer`.
+    url: the websocket url, eg a local stand-in server for testing.
+
+    Callbacks are registered with `on(event, callback)`:
+      'bar'     callback(ticker, bar) for every new (or updated) minute bar
+      'trade'   callback(ticker, trade event)
+      'status'  callback(status event), eg {'status': 'auth_success', ...}
+    Callbacks are called on the websocket thread.
+    '''
+
+    def __init__(self, api_key, tickers, channels=('AM',),
+                 buffer_size=DEFAULT_BUFFER_SIZE, url=DEFAULT_STREAM_URL):
+        for channel in channels:
+            if channel not in CHANNELS:
+                raise ValueError(f"unknown channel ({channel})")
+        self.api_key = api_key
+        self.tickers = list(dict.fromkeys(ticker.upper() for ticker in tickers))
+        self.channels = tuple(channels)
+        self.buffer_size = buffer_size
+        self.url = url
+        self.authenticated = threading.Event()
+        self._callbacks = {event: [] for event in EVENTS}
+        self._lock = threading.Lock()
+        self._buffers = {ticker: RingBuffer(ticker, buffer_size)
+                         for ticker in self.tickers}
+        # minute bars being built from trades, per ticker
+        self._partial = {}
+        self._ws = None
+        self._thread = None
+
+    def on(self, event, callback):
+        '''
+        Register `callback` for `event` ('bar', 'trade' or 'status').
+        '''
+        if event not in EVENTS:
+            raise ValueError(f"unknown event ({event})")
+        self._callbacks[event].append(callback)
+        return callback
+
+    def buffer(self, ticker):
+        return self._buffers[ticker.upper()]
+
+    def partial(self, ticker):
+        '''
+        Returns the minute bar currently being built from trades, or None.
+        '''
+        with self._lock:
+            bar = self._partial.get(ticker.upper())
+            return dict(bar) if bar else None
+
+    def _emit(self, event, *args):
+        for callback in self._callbacks[event]:
+            callback(*args)
+
+    def _subscription(self):
+        return ','.join(f'{channel}.{ticker}' for channel in self.channels
+                        for ticker in self.tickers)
+
+    ## websocket handlers ##
+
+    def _on_open(self, ws):
+        ws.send(json.dumps({'action': 'auth', 'params': self.api_key}))
+
+    def _on_message(self, ws, message):
+        for event in json.loads(message):
+            kind = event.get('ev')
+            if kind == 'status':
+                self._on_status(ws, event)
+            elif kind == 'AM':
+                self._on_bar(event['sym'], bar_from_aggregate(event))
+            elif kind == 'T':
+                self._on_trade(event)
+
+    def _on_status(self, ws, event):
+        if event.get('status') == 'auth_success':
+            self.authenticated.set()
+            ws.send(json.dumps({'action': 'subscribe',
+                                'params': self._subscription()}))
+        self._emit('status', event)
+
+    def _on_bar(self, ticker, bar):
+        with self._lock:
+            buffer = self._buffers.get(ticker)
+            if buffer is None:
+                return
+            buffer.append(bar)
+        self._emit('bar', ticker, bar)
+
+    def _on_trade(self, event):
+        ticker = event['sym']
+        price, size = event['p'], event.get('s', 0)
+        start = event['t'] - event['t'] % MINUTE_MS
+        finished = None
+        with self._lock:
+            bar = self._partial.get(ticker)
+            if bar is not None and bar['t'] != start:
+                finished, bar = bar, None
+            if bar is None:
+                bar = self._partial[ticker] = {
+                    't': start, 'o': price, 'h': price, 'l': price,
+                    'c': price, 'v': 0, 'vw': 0.0, 'n': 0}
+            bar['h'] = max(bar['h'], price)
+            bar['l'] = min(bar['l'], price)
+            bar['c'] = price
+            volume = bar['v'] + size
+            if volume:
+                bar['vw'] = (bar['vw'] * bar['v'] + price * size) / volume
+            bar['v'] = volume
+            bar['n'] += 1
+        self._emit('trade', ticker, event)
+        # minute aggregates, when subscribed, are the bars of record
+        if finished is not None and 'AM' not in self.channels:
+            self._on_bar(ticker, finished)
+
+    ## running ##
+
+    def run(self, **run_options):
+        '''
+        Connect and process messages until the connection is closed (see
+        `close`). `run_options` are passed on to
+        websocket.WebSocketApp.run_forever, eg reconnect=5.
+        '''
+        import websocket
+        self._ws = websocket.WebSocketApp(
+            self.url, on_open=self._on_open, on_message=self._on_message)
+        self._ws.run_forever(**run_options)
+
+    def start(self, **run_options):
+        '''
+        `run` in a background (daemon) thread.
+        '''
+        self._thread = threading.Thread(target=self.run, kwargs=run_options,
+                                        daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def close(self):
+        if self._ws is not None:
+            self._ws.close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
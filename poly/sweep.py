@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+'''
+Parameter sweeps of a backtest, spread over a pool of processes.
+
+The bars are copied once into one `multiprocessing.shared_memory` block.
+Every worker process maps that block when it starts and builds read-only
+`Bars` viewing it, so tasks only carry their parameters: the bar data is
+never pickled, copied or sent to a worker again, however many tasks run.
+
+Each finished task is appended to an NDJSON results file as it arrives (one
+line per parameter set, flushed), so a sweep that is interrupted resumes
+where it stopped: parameter sets already in the file are skipped, and those
+that failed are run again. eg,
+
+    def crossover(bars, fast, slow):
+        return numpy.where(indicators.sma(bars, fast) >
+                           indicators.sma(bars, slow), 1.0, 0.0)
+
+    report = run_sweep(minutes, crossover,
+                       {'fast': range(5, 50, 5), 'slow': range(50, 500, 25)},
+                       './crossover.ndjson', commission=0.0005)
+    best = max((result for result in load_results('./crossover.ndjson')
+                if 'metrics' in result),
+               key=lambda result: result['metrics']['sharpe'])
+
+Results lines look like
+    {"params": {"fast": 5, "slow": 50}, "metrics": {...}, "seconds": 0.41}
+or, for a task that raised, {"params": {...}, "error": "ValueError: ..."}.
+
+The strategy must be importable by the workers (a module level function),
+and is called as strategy(bars, **params) for each ticker's `Bars`.
+'''
+
+import itertools
+import json
+import os
+import time
+
+import numpy
+
+from . import backtest
+from .bars import Bars, FIELDS
+
+# the worker's view of the shared bars, set up by `_init_worker`
+_WORKER = {}
+
+
+def parameter_grid(grid):
+    '''
+    Returns the list of parameter dictionaries of `grid`: either
+    {name: values} (every combination, in order) or an iterable of
+    parameter dictionaries (as is).
+    '''
+    if isinstance(grid, dict):
+        names = list(grid)
+        return [dict(zip(names, values))
+                for values in itertools.product(*(grid[name]
+                                                  for name in names))]
+    return [dict(params) for params in grid]
+
+
+def _params_key(params):
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+class SharedBars:
+    '''
+    `Bars` of several tickers packed into one shared memory block. The
+    `layout` (block name, tickers, offsets) is all a process needs to
+    `attach`.
+    '''
+
+    def __init__(self, shm, layout, owner):
+        self.shm = shm
+        self.layout = layout
+        self.owner = owner
+
+    @classmethod
+    def create(cls, bars_by_ticker):
+        from multiprocessing import shared_memory
+        layout = {'tickers': []}
+        offset = 0
+        for ticker, bars in bars_by_ticker.items():
+            layout['tickers'].append((ticker, offset, len(bars)))
+            offset += len(bars) * sum(numpy.dtype(dtype).itemsize
+                                      for dtype in FIELDS.values())
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        layout['name'] = shm.name
+        shared = cls(shm, layout, owner=True)
+        for ticker, views in shared.bars(writeable=True).items():
+            for field in FIELDS:
+                getattr(views, field)[:] = getattr(bars_by_ticker[ticker],
+                                                   field)
+        return shared
+
+    @classmethod
+    def attach(cls, layout):
+        from multiprocessing import shared_memory
+        return cls(shared_memory.SharedMemory(name=layout['name']), layout,
+                   owner=False)
+
+    def bars(self, writeable=False):
+        '''
+        Returns {ticker: `Bars` viewing the shared block}, read-only unless
+        `writeable`.
+        '''
+        bars_by_ticker = {}
+        for ticker, offset, size in self.layout['tickers']:
+            arrays = {}
+            for field, dtype in FIELDS.items():
+                array = numpy.ndarray(size, dtype=dtype, buffer=self.shm.buf,
+                                      offset=offset)
+                array.flags.writeable = writeable
+                arrays[field] = array
+                offset += array.nbytes
+            bars_by_ticker[ticker] = Bars(ticker, **arrays)
+        return bars_by_ticker
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _init_worker(layout, strategy, options):
+    shared = SharedBars.attach(layout)
+    _WORKER.update(shared=shared, bars=shared.bars(), strategy=strategy,
+                   options=options)
+
+
+def _run_task(params):
+    '''
+    Backtest one parameter set in a worker, returns its results line.
+    '''
+    started = time.perf_counter()
+    strategy = _WORKER['strategy']
+    try:
+        result = backtest.run(_WORKER['bars'],
+                              lambda bars: strategy(bars, **params),
+                              **_WORKER['options'])
+        line = {'params': params, 'metrics': result.metrics()}
+    except Exception as error:
+        line = {'params': params, 'error': f'{type(error).__name__}: {error}'}
+    line['seconds'] = time.perf_counter() - started
+    return line
+
+
+def load_results(path):
+    '''
+    Returns the results lines of a sweep (see the module docstring). A
+    partly written last line, left by an interrupted sweep, is ignored.
+    '''
+    results = []
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    results.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return results
+
+
+def _open_results(path, resume):
+    '''
+    Opens the results file for appending and returns it with the keys of
+    the parameter sets already done.
+    '''
+    done = set()
+    if resume:
+        done = {_params_key(line['params']) for line in load_results(path)
+                if 'metrics' in line}
+        # drop a partly written last line, so appends start on a new one
+        if os.path.exists(path):
+            with open(path, 'rb+') as f:
+                data = f.read()
+                f.truncate(data.rfind(b'\n') + 1)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return open(path, 'a' if resume else 'w'), done
+
+
+def run_sweep(bars, strategy, grid, output, processes=None, resume=True,
+              chunksize=1, progress=None, **backtest_options):
+    '''
+    Backtest `strategy` (strategy(bars, **params) -> signals, see
+    `backtest.run`) for every parameter set of `grid` (see `parameter_grid`)
+    over `bars` (`Bars`, or a list / {ticker: Bars}), in `processes` worker
+    processes (default one per CPU). Results are appended to the NDJSON file
+    `output` as they finish; with `resume`, parameter sets already there are
+    skipped. Other keyword arguments (eg commission) go to `backtest.run`.
+
+    progress: optional callable, called with each results line.
+
+    Returns a report: tasks (in the grid), skipped (already done), done,
+    failed and seconds.
+    '''
+    import multiprocessing
+    started = time.monotonic()
+    bars_by_ticker = backtest._as_bars_by_ticker(bars)
+    tasks = parameter_grid(grid)
+    results, done = _open_results(output, resume)
+    pending = [params for params in tasks if _params_key(params) not in done]
+    report = {'tasks': len(tasks), 'skipped': len(tasks) - len(pending),
+              'done': 0, 'failed': 0}
+
+    shared = SharedBars.create(bars_by_ticker)
+    try:
+        with results, multiprocessing.Pool(
+                processes, initializer=_init_worker,
+                initargs=(shared.layout, strategy, backtest_options)) as pool:
+            for line in pool.imap_unordered(_run_task, pending, chunksize):
+                results.write(json.dumps(line, default=str) + '\n')
+                results.flush()
+                report['failed' if 'error' in line else 'done'] += 1
+                if progress is not None:
+                    progress(line)
+    finally:
+        shared.close()
+    report['seconds'] = time.monotonic() - started
+    return report
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+'''
+NYSE trading calendar: holidays, early closes and session hours, in New
+York time.
+
+A regular trading day has three sessions:
+  04:00 - 09:30  extended-hours (pre-market)
+  09:30 - 16:00  open
+  16:00 - 20:00  extended-hours (after-hours)
+On early close days (the day before Independence Day, the day after
+Thanksgiving and Christmas Eve) the regular session ends at 13:00 and the
+after-hours session at 17:00. Weekends and holidays have no sessions.
+
+Holidays follow the NYSE rules (a Saturday holiday is observed on the
+Friday before, except New Year's Day, a Sunday one on the Monday after),
+plus the unscheduled closures in `SPECIAL_CLOSURES`. Everything is worked
+out from the rules, so any year is covered without a download.
+
+eg,
+    is_trading_day(datetime.date(2021, 1, 18))  # False, MLK day
+    previous_trading_day(datetime.date(2021, 1, 19))  # 2021-01-15
+    session_minutes(datetime.date(2021, 11, 26))  # 780, an early close
+'''
+
+import datetime
+import functools
+import zoneinfo
+
+NEW_YORK = zoneinfo.ZoneInfo('America/New_York')
+
+# (start, session) boundaries of a regular trading day, in New York time
+SESSIONS = [
+    (datetime.time(0, 0), 'closed'),
+    (datetime.time(4, 0), 'extended-hours'),
+    (datetime.time(9, 30), 'open'),
+    (datetime.time(16, 0), 'extended-hours'),
+    (datetime.time(20, 0), 'closed'),
+]
+
+# the same for early close days
+EARLY_CLOSE_SESSIONS = [
+    (datetime.time(0, 0), 'closed'),
+    (datetime.time(4, 0), 'extended-hours'),
+    (datetime.time(9, 30), 'open'),
+    (datetime.time(13, 0), 'extended-hours'),
+    (datetime.time(17, 0), 'closed'),
+]
+
+NO_SESSIONS = [(datetime.time(0, 0), 'closed')]
+
+# closures outside the holiday rules (national days of mourning, weather,
+# September 11th)
+SPECIAL_CLOSURES = {
+    datetime.date(2001, 9, 11): 'September 11',
+    datetime.date(2001, 9, 12): 'September 11',
+    datetime.date(2001, 9, 13): 'September 11',
+    datetime.date(2001, 9, 14): 'September 11',
+    datetime.date(2004, 6, 11): 'Ronald Reagan day of mourning',
+    datetime.date(2007, 1, 2): 'Gerald Ford day of mourning',
+    datetime.date(2012, 10, 29): 'Hurricane Sandy',
+    datetime.date(2012, 10, 30): 'Hurricane Sandy',
+    datetime.date(2018, 12, 5): 'George H.W. Bush day of mourning',
+    datetime.date(2025, 1, 9): 'Jimmy Carter day of mourning',
+}
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def _nth_weekday(year, month, weekday, n):
+    '''
+    The `n`th `weekday` (0 = Monday) of a month, counting from the end if
+    `n` is negative.
+    '''
+    if n > 0:
+        first = datetime.date(year, month, 1)
+        return first + datetime.timedelta(
+            days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    following = datetime.date(year + month // 12, month % 12 + 1, 1)
+    last = following - ONE_DAY
+    return last - datetime.timedelta(
+        days=(last.weekday() - weekday) % 7 + 7 * (-n - 1))
+
+
+def _easter(year):
+    '''
+    Gregorian Easter Sunday (the anonymous Gregorian algorithm).
+    '''
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+
+def _observed(day):
+    if day.weekday() == 5:
+        return day - ONE_DAY
+    if day.weekday() == 6:
+        return day + ONE_DAY
+    return day
+
+
+@functools.lru_cache(maxsize=None)
+def holidays(year):
+    '''
+    Returns {date: name} of the weekdays NYSE is closed in `year`.
+    '''
+    days = {}
+    new_year = datetime.date(year, 1, 1)
+    # a Saturday New Year's Day is not observed on the Friday before
+    if new_year.weekday() != 5:
+        days[_observed(new_year)] = "New Year's Day"
+    if year >= 1998:
+        days[_nth_weekday(year, 1, 0, 3)] = 'Martin Luther King Jr. Day'
+    days[_nth_weekday(year, 2, 0, 3)] = "Washington's Birthday"
+    days[_easter(year) - 2 * ONE_DAY] = 'Good Friday'
+    days[_nth_weekday(year, 5, 0, -1)] = 'Memorial Day'
+    if year >= 2022:
+        days[_observed(datetime.date(year, 6, 19))] = 'Juneteenth'
+    days[_observed(datetime.date(year, 7, 4))] = 'Independence Day'
+    days[_nth_weekday(year, 9, 0, 1)] = 'Labor Day'
+    days[_nth_weekday(year, 11, 3, 4)] = 'Thanksgiving Day'
+    days[_observed(datetime.date(year, 12, 25))] = 'Christmas Day'
+    days.update((day, name) for day, name in SPECIAL_CLOSURES.items()
+                if day.year == year)
+    return days
+
+
+@functools.lru_cache(maxsize=None)
+def early_closes(year):
+    '''
+    Returns the set of dates in `year` when the regular session closes at
+    13:00.
+    '''
+    days = set()
+    independence = datetime.date(year, 7, 4)
+    if independence.weekday() in (1, 2, 3, 4):
+        days.add(independence - ONE_DAY)
+    days.add(_nth_weekday(year, 11, 3, 4) + ONE_DAY)
+    christmas_eve = datetime.date(year, 12, 24)
+    if christmas_eve.weekday() < 5:
+        days.add(christmas_eve)
+    return {day for day in days if day not in holidays(year)}
+
+
+def is_trading_day(day):
+    return day.weekday() < 5 and day not in holidays(day.year)
+
+
+def is_early_close(day):
+    return day in early_closes(day.year)
+
+
+def sessions(day):
+    '''
+    Returns the (start, session) boundaries of `day`, like `SESSIONS`.
+    '''
+    if not is_trading_day(day):
+        return NO_SESSIONS
+    if is_early_close(day):
+        return EARLY_CLOSE_SESSIONS
+    return SESSIONS
+
+
+def session_hours(day, extended=False):
+    '''
+    Returns the (open, close) New York datetimes of the regular session of
+    `day` (or from pre-market to the end of after-hours, if `extended`), or
+    None if it is not a trading day.
+    '''
+    boundaries = sessions(day)
+    if len(boundaries) == 1:
+        return None
+    start, end = (1, 4) if extended else (2, 3)
+    return (datetime.datetime.combine(day, boundaries[start][0], NEW_YORK),
+            datetime.datetime.combine(day, boundaries[end][0], NEW_YORK))
+
+
+def session_minutes(day, extended=True):
+    '''
+    Minutes of trading on `day`, by default including extended hours (as
+    Polygon's minute aggregates do).
+    '''
+    hours = session_hours(day, extended)
+    if hours is None:
+        return 0
+    return int((hours[1] - hours[0]).total_seconds()) // 60
+
+
+def trading_days(start, end):
+    '''
+    Returns the trading days from `start` to `end` (inclusive).
+    '''
+    days = []
+    day = start
+    while day <= end:
+        if is_trading_day(day):
+            days.append(day)
+        day += ONE_DAY
+    return days
+
+
+def previous_trading_day(day):
+    '''
+    Returns the last trading day before `day`.
+    '''
+    day -= ONE_DAY
+    while not is_trading_day(day):
+        day -= ONE_DAY
+    return day
+
+
+def next_trading_day(day):
+    '''
+    Returns the first trading day after `day`.
+    '''
+    day += ONE_DAY
+    while not is_trading_day(day):
+        day += ONE_DAY
+    return day
+
+
+def last_trading_day(day):
+    '''
+    Returns `day` if it is a trading day, else the trading day before it.
+    '''
+    return day if is_trading_day(day) else previous_trading_day(day)
+
+
+def new_york_today():
+    return datetime.datetime.now(NEW_YORK).date()
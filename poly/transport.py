@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+'''
+Pluggable transports for `PolyClient` requests.
+
+Every Polygon request a `PolyClient` makes goes through its transport, in one
+of three modes:
+
+  passthrough  send the request to Polygon (the default)
+  record       send the request and save the request and its response to an
+               archive directory
+  replay       answer every request from an archive directory, without any
+               network (or rate limiting); a request missing from the archive
+               raises `ReplayMissError`
+
+Archives hold one gzipped JSON file per distinct request, named after a hash
+of the request (endpoint and parameters, never the api key), eg,
+
+    ./archive/3f1c...e2.json.gz  {"request": {...}, "response": {...}}
+
+so recording the same request again overwrites it and a rerun with the same
+arguments replays exactly what was recorded.
+
+eg,
+    client = PolyClient(api_key, transport=open_transport('record', './arc'))
+    client.get_dividends(['BAC'])
+    ...
+    client = PolyClient(None, transport=open_transport('replay', './arc'))
+    client.get_dividends(['BAC'])  # no network
+'''
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import types
+
+MODES = ('passthrough', 'record', 'replay')
+
+ARCHIVE_SUFFIX = '.json.gz'
+
+
+class ReplayMissError(LookupError):
+    '''
+    A replayed request was never recorded.
+    '''
+
+
+def request_key(endpoint, args, kwargs):
+    '''
+    Returns the archive entry of a request, as a JSON serializable dictionary.
+    Dates (and anything else not JSON native) are stored as strings.
+    '''
+    return json.loads(json.dumps(
+        {'endpoint': endpoint, 'args': list(args), 'params': kwargs},
+        sort_keys=True, default=str))
+
+
+def archive_name(key):
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode())
+    return digest.hexdigest()[:32] + ARCHIVE_SUFFIX
+
+
+class PassthroughTransport:
+    '''
+    Sends every request, see the module docstring.
+    '''
+    mode = 'passthrough'
+
+    def request(self, send, endpoint, *args, **kwargs):
+        '''
+        Returns the response of `endpoint` (a polygon RESTClient method
+        name), sending it with `send(endpoint, *args, **kwargs)` if needed.
+        '''
+        return send(endpoint, *args, **kwargs)
+
+
+class RecordTransport(PassthroughTransport):
+    '''
+    Sends every request and saves it, with its response, under `path`.
+    '''
+    mode = 'record'
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def request(self, send, endpoint, *args, **kwargs):
+        response = send(endpoint, *args, **kwargs)
+        key = request_key(endpoint, args, kwargs)
+        entry = json.dumps({'request': key, 'response': vars(response)},
+                           default=str).encode()
+        # write next to the destination and rename it into place, so a
+        # concurrent replay never reads half an entry
+        fd, temporary = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(gzip.compress(entry, compresslevel=6))
+            os.replace(temporary, os.path.join(self.path, archive_name(key)))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        return response
+
+
+class ReplayTransport(PassthroughTransport):
+    '''
+    Answers every request from the archive under `path`, never sending one.
+    Responses have the same attributes as polygon's response objects.
+    '''
+    mode = 'replay'
+
+    def __init__(self, path):
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"no replay archive at {path}")
+        self.path = path
+
+    def request(self, send, endpoint, *args, **kwargs):
+        key = request_key(endpoint, args, kwargs)
+        try:
+            with gzip.open(os.path.join(self.path, archive_name(key))) as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            raise ReplayMissError(
+                f"{endpoint} {key['args']} {key['params']} was not recorded "
+                f"in {self.path}") from None
+        return types.SimpleNamespace(**entry['response'])
+
+
+TRANSPORTS = {
+    'passthrough': PassthroughTransport,
+    'record': RecordTransport,
+    'replay': ReplayTransport,
+}
+
+
+def open_transport(mode='passthrough', path=None):
+    '''
+    Returns a transport for `mode` (see `MODES`). 'record' and 'replay' need
+    the archive directory `path`.
+    '''
+    if mode not in TRANSPORTS:
+        raise ValueError(f"unknown transport mode ({mode})")
+    if mode == 'passthrough':
+        return PassthroughTransport()
+    if not path:
+        raise ValueError(f"the {mode} transport needs an archive directory")
+    return TRANSPORTS[mode](path)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+'''
+Streaming writers for aggregate bars.
+
+Each writer accepts bars chunk by chunk (`write(bars)`), so large backfills
+never have to be held in memory all at once. Output goes to a temporary file
+next to the destination, which is renamed into place only once the writer is
+closed successfully, so a crash never leaves a half-written file behind.
+
+Supported formats:
+  json    : a single JSON array (same as `poly.json_dump` always wrote)
+  ndjson  : one JSON object per line
+  csv     : comma separated values with a header row
+  parquet : compressed columnar Parquet (requires pyarrow)
+  arrow   : compressed Arrow IPC file (requires pyarrow)
+
+eg,
+    with open_writer('BAC.ndjson') as writer:
+        for bars in poly.iter_ticker_aggregates(api_key, 'BAC', ...):
+            writer.write(bars)
+'''
+
+import contextlib
+import csv
+import json
+import os
+import tempfile
+
+from . import instrument
+
+# file extension to format name
+EXTENSIONS = {
+    'json': 'json',
+    'ndjson': 'ndjson',
+    'jsonl': 'ndjson',
+    'csv': 'csv',
+    'parquet': 'parquet',
+    'arrow': 'arrow',
+    'feather': 'arrow',
+}
+
+# preferred column order for aggregate bars, any other keys follow after
+BAR_FIELDS = ['t', 'o', 'h', 'l', 'c', 'v', 'vw', 'n']
+
+
+def format_from_path(path):
+    '''
+    Returns the format name implied by the extension of `path`.
+    Raises RuntimeError if the extension is not supported.
+    '''
+    extension = os.path.basename(path).split('.')[-1].lower()
+    if extension not in EXTENSIONS:
+        raise RuntimeError(
+            f'unsupported file extension ({extension}), expected one of: '
+            f'{", ".join(sorted(EXTENSIONS))}')
+    return EXTENSIONS[extension]
+
+
+def _bar_fields(bars):
+    keys = []
+    for bar in bars:
+        for key in bar:
+            if key not in keys:
+                keys.append(key)
+    return ([k for k in BAR_FIELDS if k in keys] +
+            [k for k in keys if k not in BAR_FIELDS])
+
+
+def _columns(bars):
+    '''
+    Returns the columns of a file whose first chunk is `bars`: every bar
+    field (whether or not these bars have it), then any other keys.
+    '''
+    return BAR_FIELDS + [k for k in _bar_fields(bars) if k not in BAR_FIELDS]
+
+
+def _check_columns(bars, columns):
+    '''
+    Raises RuntimeError if `bars` have keys the file has no column for.
+    '''
+    extra = [k for k in _bar_fields(bars) if k not in columns]
+    if extra:
+        raise RuntimeError(f'bars have fields ({", ".join(extra)}) missing '
+                           'from the columns of the earlier ones')
+
+
+class BarWriter:
+    '''
+    Base class for the streaming writers. Sub classes implement `_open`,
+    `_write` and `_close` against the temporary file.
+    '''
+    binary = False
+
+    def __init__(self, path, overwrite=False):
+        if os.path.exists(path) and overwrite is False:
+            raise FileExistsError(f"path exists ({path})")
+        self.path = path
+        self.count = 0
+        dirs = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirs, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(
+            dir=dirs, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+        if self.binary:
+            self._file = os.fdopen(fd, 'wb')
+        else:
+            self._file = os.fdopen(fd, 'w', newline='')
+        self._open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @instrument.timed('writer.write')
+    def write(self, bars):
+        '''
+        Append a chunk (list) of bar dictionaries to the output.
+        '''
+        if bars:
+            self._write(bars)
+            self.count += len(bars)
+
+    def close(self):
+        '''
+        Finish writing and atomically move the output into place.
+        '''
+        try:
+            self._close()
+            self._file.close()
+        except BaseException:
+            self.abort()
+            raise
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        '''
+        Throw away everything written so far, leaving any existing file
+        at `path` untouched.
+        '''
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+    def _open(self):
+        pass
+
+    def _write(self, bars):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+
+class JSONWriter(BarWriter):
+    def _open(self):
+        self._file.write('[')
+
+    def _write(self, bars):
+        separator = ', ' if self.count else ''
+        self._file.write(separator + ', '.join(json.dumps(bar) for bar in bars))
+
+    def _close(self):
+        self._file.write(']')
+
+
+class NDJSONWriter(BarWriter):
+    def _write(self, bars):
+        self._file.write(''.join(json.dumps(bar) + '\n' for bar in bars))
+
+
+class CSVWriter(BarWriter):
+    '''
+    The header has every bar field, missing values are left empty.
+    '''
+    def _open(self):
+        self._writer = None
+
+    def _write(self, bars):
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._file, _columns(bars))
+            self._writer.writeheader()
+        else:
+            _check_columns(bars, self._writer.fieldnames)
+        self._writer.writerows(bars)
+
+
+class _ArrowWriter(BarWriter):
+    '''
+    Shared pyarrow handling for the columnar formats. The bar fields have
+    fixed (nullable) types, the same as `Bars`, so chunks that differ (eg a
+    fractional volume after whole ones, or no 'vw') still fit; the types of
+    any other keys are taken from the first chunk.
+    '''
+    binary = True
+    compression = 'zstd'
+
+    def _open(self):
+        try:
+            import pyarrow
+        except ImportError:
+            self.abort()
+            raise RuntimeError(
+                f'{type(self).__name__} requires pyarrow '
+                '($> pip install pyarrow)') from None
+        self._pyarrow = pyarrow
+        self._writer = None
+
+    def _schema_for(self, bars):
+        from .bars import FIELDS
+        pyarrow = self._pyarrow
+        fields = [pyarrow.field(k, pyarrow.from_numpy_dtype(FIELDS[k]))
+                  for k in BAR_FIELDS]
+        extra = [k for k in _columns(bars) if k not in BAR_FIELDS]
+        if extra:
+            fields += pyarrow.Table.from_pylist(
+                [{k: bar.get(k) for k in extra} for bar in bars]).schema
+        return pyarrow.schema(fields)
+
+    def _write(self, bars):
+        if self._writer is None:
+            self._schema = self._schema_for(bars)
+            self._writer = self._new_writer(self._schema)
+        else:
+            _check_columns(bars, self._schema.names)
+        # missing fields are nulls
+        self._writer.write_table(self._pyarrow.Table.from_pylist(
+            bars, schema=self._schema))
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def abort(self):
+        # close pyarrow's writer first, it would write to the closed file
+        # when collected
+        if getattr(self, '_writer', None) is not None:
+            with contextlib.suppress(Exception):
+                self._writer.close()
+            self._writer = None
+        super().abort()
+
+    def _new_writer(self, schema):
+        raise NotImplementedError
+
+
+class ParquetWriter(_ArrowWriter):
+    def _new_writer(self, schema):
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetWriter(self._file, schema,
+                                             compression=self.compression)
+
+
+class ArrowWriter(_ArrowWriter):
+    def _new_writer(self, schema):
+        import pyarrow.ipc
+        options = pyarrow.ipc.IpcWriteOptions(compression=self.compression)
+        return pyarrow.ipc.new_file(self._file, schema, options=options)
+
+
+WRITERS = {
+    'json': JSONWriter,
+    'ndjson': NDJSONWriter,
+    'csv': CSVWriter,
+    'parquet': ParquetWriter,
+    'arrow': ArrowWriter,
+}
+
+
+def open_writer(path, format=None, overwrite=False):
+    '''
+    Returns a streaming writer for `path`. The format is taken from `format`
+    if given, otherwise from the file extension of `path`.
+    '''
+    if format is None:
+        format = format_from_path(path)
+    if format not in WRITERS:
+        raise RuntimeError(
+            f'unsupported format ({format}), expected one of: '
+            f'{", ".join(sorted(WRITERS))}')
+    return WRITERS[format](path, overwrite=overwrite)
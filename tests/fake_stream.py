@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+'''
+Local stand-in for the Polygon.io stocks websocket, for tests.
+
+Speaks just enough of the websocket protocol (RFC 6455, text frames only)
+to accept one client, authenticate it, wait for its subscription and then
+send it the scripted events.
+
+eg,
+    with FakeStreamServer([[{'ev': 'AM', 'sym': 'BAC', ...}]]) as server:
+        client = StreamClient(api_key, ['BAC'], url=server.url)
+        client.run()
+    server.received  # the client's auth and subscribe messages
+'''
+
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+
+GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+def _recv_exactly(conn, size):
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('client went away')
+        data += chunk
+    return data
+
+
+def recv_frame(conn):
+    '''
+    Returns (opcode, payload) of the next (masked) client frame.
+    '''
+    first, second = _recv_exactly(conn, 2)
+    opcode = first & 0x0f
+    length = second & 0x7f
+    if length == 126:
+        length, = struct.unpack('!H', _recv_exactly(conn, 2))
+    elif length == 127:
+        length, = struct.unpack('!Q', _recv_exactly(conn, 8))
+    mask = _recv_exactly(conn, 4) if second & 0x80 else b'\0\0\0\0'
+    payload = _recv_exactly(conn, length)
+    return opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+def send_frame(conn, payload, opcode=0x1):
+    header = bytes([0x80 | opcode])
+    if len(payload) < 126:
+        header += bytes([len(payload)])
+    elif len(payload) < 65536:
+        header += bytes([126]) + struct.pack('!H', len(payload))
+    else:
+        header += bytes([127]) + struct.pack('!Q', len(payload))
+    conn.sendall(header + payload)
+
+
+class FakeStreamServer:
+    '''
+    Serves `messages` (a list of event lists, one websocket message each) to
+    the first client that authenticates and subscribes, then closes.
+    '''
+
+    def __init__(self, messages, api_key=None):
+        self.messages = messages
+        self.api_key = api_key
+        self.received = []
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen(1)
+        self.url = f'ws://127.0.0.1:{self._sock.getsockname()[1]}/stocks'
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._thread.join(5)
+        self._sock.close()
+
+    def _send(self, conn, events):
+        send_frame(conn, json.dumps(events).encode())
+
+    def _receive(self, conn):
+        opcode, payload = recv_frame(conn)
+        if opcode == 0x8:
+            raise ConnectionError('client closed')
+        message = json.loads(payload)
+        self.received.append(message)
+        return message
+
+    def _serve(self):
+        conn, _ = self._sock.accept()
+        with conn:
+            request = b''
+            while b'\r\n\r\n' not in request:
+                request += conn.recv(4096)
+            headers = dict(
+                line.split(': ', 1) for line in
+                request.decode().split('\r\n')[1:] if ': ' in line)
+            accept = base64.b64encode(hashlib.sha1(
+                (headers['Sec-WebSocket-Key'] + GUID).encode()).digest())
+            conn.sendall(b'HTTP/1.1 101 Switching Protocols\r\n'
+                         b'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+                         b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+            try:
+                self._send(conn, [{'ev': 'status', 'status': 'connected'}])
+                auth = self._receive(conn)
+                if self.api_key is not None and auth['params'] != self.api_key:
+                    self._send(conn, [{'ev': 'status',
+                                       'status': 'auth_failed'}])
+                    return
+                self._send(conn, [{'ev': 'status', 'status': 'auth_success'}])
+                self._receive(conn)
+                for events in self.messages:
+                    self._send(conn, events)
+                send_frame(conn, struct.pack('!H', 1000), opcode=0x8)
+                recv_frame(conn)
+            except ConnectionError:
+                pass
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+import asyncio
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from .. import poly
+from ..poly import aio
+from ..benchmarks.fake_polygon import FakePolygonServer
+
+API_KEY = 'NaOW_Dp24BpexIR8A9qADvh3owYD98Ka'
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients():
+    poly.close_clients()
+    yield
+    poly.close_clients()
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_async_client__same_results_as_sync():
+    query = dict(from_='2021-01-04', to='2021-01-22', limit=2000)
+    with FakePolygonServer(dividends=5) as server:
+        with poly.PolyClient(API_KEY, base_url=server.url) as client:
+            expected = (client.get_marketstatus(ttl=0, verbose=False),
+                        client.get_dividends(['BAC', 'T']),
+                        client.get_ticker_aggregates('BAC', **query))
+
+        async def fetch():
+            async with aio.AsyncPolyClient(API_KEY,
+                                           base_url=server.url) as client:
+                return await asyncio.gather(
+                    client.get_marketstatus(ttl=0),
+                    client.get_dividends(['bac', 'T']),
+                    client.get_ticker_aggregates('bac', **query),
+                    client.get_ticker_aggregates('BAC', as_bars=True,
+                                                 **query))
+        status, dividends, aggregates, bars = _run(fetch())
+
+    assert status.to_dict() == expected[0].to_dict()
+    assert dividends == expected[1]
+    assert aggregates == expected[2]
+    assert bars.t.tolist() == [bar['t'] for bar in aggregates['results']]
+
+
+def test_async_client__concurrency_limit():
+    '''
+    No more than `max_concurrency` requests reach the server at once.
+    '''
+    with FakePolygonServer(dividends=1, latency=0.05) as server:
+        async def fetch():
+            async with aio.AsyncPolyClient(API_KEY, max_concurrency=3,
+                                           base_url=server.url) as client:
+                return await client.get_dividends(
+                    [f'T{n}' for n in range(20)])
+        dividends = _run(fetch())
+    assert len(dividends) == 20
+    assert len(server.requests) == 20
+    assert server.peak_in_flight == 3
+
+
+def test_async_client__market_status_shared_and_cached():
+    with FakePolygonServer() as server:
+        async def fetch():
+            async with aio.AsyncPolyClient(API_KEY,
+                                           base_url=server.url) as client:
+                first = await asyncio.gather(
+                    *(client.get_marketstatus() for _ in range(5)))
+                return first + [await client.get_marketstatus()]
+        statuses = _run(fetch())
+    assert server.requests == ['/v1/marketstatus/now']
+    assert all(status is statuses[0] for status in statuses)
+
+
+def test_async_client__cancellation_cancels_requests(monkeypatch):
+    started = []
+    cancelled = []
+
+    async def slow_get(self, path, **query_params):
+        started.append(path)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(path)
+            raise
+
+    monkeypatch.setattr(aio.AsyncPolyClient, '_get', slow_get)
+
+    async def fetch():
+        async with aio.AsyncPolyClient(API_KEY) as client:
+            task = asyncio.ensure_future(client.get_ticker_aggregates(
+                'BAC', '2021-01-04', '2021-01-29', limit=2000))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    _run(fetch())
+    assert len(started) > 1
+    assert sorted(cancelled) == sorted(started)
+
+
+def test_async_client__failure_cancels_siblings(monkeypatch):
+    cancelled = []
+
+    async def failing_get(self, path, **query_params):
+        if path.endswith('/BAD'):
+            raise RuntimeError('no such ticker')
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(path)
+            raise
+
+    monkeypatch.setattr(aio.AsyncPolyClient, '_get', failing_get)
+
+    async def fetch():
+        async with aio.AsyncPolyClient(API_KEY) as client:
+            await client.get_dividends(['BAC', 'BAD', 'T'])
+
+    with pytest.raises(RuntimeError):
+        _run(fetch())
+    assert len(cancelled) == 2
+
+
+def test_async_client__retries_server_errors(monkeypatch):
+    statuses = iter([503, 429, 200])
+    scheduler = poly.RequestScheduler(backoff=0.001)
+
+    with FakePolygonServer() as server:
+        original = server._server.RequestHandlerClass.do_GET
+
+        def flaky_get(handler):
+            status = next(statuses)
+            if status != 200:
+                handler._send_json({'status': 'ERROR'}, status=status)
+            else:
+                original(handler)
+
+        monkeypatch.setattr(server._server.RequestHandlerClass, 'do_GET',
+                            flaky_get)
+
+        async def fetch():
+            async with aio.AsyncPolyClient(API_KEY, base_url=server.url,
+                                           scheduler=scheduler) as client:
+                return await client.get_marketstatus(ttl=0)
+        status = _run(fetch())
+    assert status.market == 'open'
+    assert scheduler.retries == 2
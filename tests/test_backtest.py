@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+import numpy
+import pytest
+
+from .. import poly
+from ..poly import backtest
+from ..poly.bars import Bars
+
+MINUTE = 60000
+T0 = 1609770600000  # 2021-01-04T09:30:00-05:00
+
+
+def _bars(ticker, closes, minutes=None):
+    if minutes is None:
+        minutes = range(len(closes))
+    return Bars(ticker, t=T0 + numpy.asarray(minutes) * MINUTE,
+                c=numpy.asarray(closes, dtype=float))
+
+
+def test_run__single_ticker():
+    '''
+    A position taken at a close earns the next bar's return, and every
+    change of position pays commission and slippage.
+    '''
+    bars = _bars('BAC', [10.0, 11.0, 12.1, 6.05])
+    result = backtest.run(bars, [1.0, 1.0, 0.0, 0.0], capital=100.0,
+                          commission=0.006, slippage=0.004)
+    assert result.tickers == ['BAC']
+    assert result.turnover.tolist() == [1.0, 0.0, 1.0, 0.0]
+    numpy.testing.assert_allclose(result.returns, [-0.01, 0.1, 0.09, 0.0])
+    numpy.testing.assert_allclose(result.equity,
+                                  100 * numpy.cumprod([0.99, 1.1, 1.09, 1.0]))
+    metrics = result.metrics()
+    assert metrics['trades'] == 2
+    assert metrics['turnover'] == 2.0
+    assert metrics['costs'] == pytest.approx(0.02)
+    assert metrics['exposure'] == 0.5
+    assert metrics['total_return'] == pytest.approx(0.99 * 1.1 * 1.09 - 1)
+    assert metrics['max_drawdown'] == pytest.approx(-0.01)
+
+
+def test_run__no_look_ahead():
+    '''
+    The last signal has nothing left to earn, and shorting pays when the
+    price falls.
+    '''
+    bars = _bars('BAC', [10.0, 9.0, 8.1])
+    short = backtest.run(bars, [-1.0, -1.0, -1.0])
+    flipped = backtest.run(bars, [-1.0, -1.0, 1.0])
+    assert short.equity[-1] == pytest.approx(1.1 * 1.1)
+    assert flipped.equity[-1] == short.equity[-1]
+    assert backtest.run(bars, [-1.0, -1.0, -1.0],
+                        allow_short=False).equity[-1] == 1.0
+
+
+def test_run__position_limits():
+    bars = _bars('BAC', [10.0, 11.0])
+    result = backtest.run(bars, [2.0, numpy.nan], max_position=0.5)
+    assert result.positions[:, 0].tolist() == [0.5, 0.0]
+    assert result.equity[-1] == pytest.approx(1.05)
+
+    both = backtest.run([_bars('BAC', [10.0, 11.0]), _bars('T', [10.0, 9.0])],
+                        {'BAC': [1.0, 1.0], 'T': [-1.0, -1.0]}, max_gross=1.0)
+    assert both.positions.tolist() == [[0.5, -0.5], [0.5, -0.5]]
+    assert both.equity[-1] == pytest.approx(1.1)
+    assert both.contributions() == pytest.approx({'BAC': 0.05, 'T': 0.05})
+
+
+def test_run__aligns_tickers():
+    '''
+    Tickers are aligned on all timestamps, carrying each one's close and
+    signal over its missing bars. Nothing is held before a ticker's first
+    bar.
+    '''
+    bac = _bars('BAC', [10.0, 11.0, 12.0, 13.0], [0, 1, 2, 3])
+    t = _bars('T', [20.0, 30.0], [1, 3])
+    result = backtest.run({'BAC': bac, 'T': t},
+                          lambda bars: numpy.ones(len(bars)))
+    assert result.t.tolist() == bac.t.tolist()
+    assert result.positions[:, 1].tolist() == [0.0, 1.0, 1.0, 1.0]
+    assert result.asset_returns[:, 1].tolist() == [0.0, 0.0, 0.0, 0.5]
+    numpy.testing.assert_allclose(result.returns,
+                                  [0.0, 0.1, 1 / 11, 1 / 12 + 0.5])
+
+
+def test_run__strategy_with_indicators():
+    rng = numpy.random.default_rng(1)
+    closes = 100 * numpy.exp(numpy.cumsum(rng.normal(0, 0.001, 5000)))
+    bars = _bars('BAC', closes)
+
+    def crossover(bars, fast=5, slow=20):
+        return numpy.where(poly.indicators.sma(bars, fast) >
+                           poly.indicators.sma(bars, slow), 1.0, 0.0)
+
+    result = backtest.run(bars, crossover, commission=0.0001)
+    metrics = result.metrics()
+    assert set(metrics) == {'total_return', 'cagr', 'volatility', 'sharpe',
+                            'max_drawdown', 'turnover', 'annual_turnover',
+                            'costs', 'exposure', 'trades'}
+    assert metrics['max_drawdown'] <= 0
+    assert 0 < metrics['exposure'] < 1
+    assert metrics['trades'] == int((numpy.diff(crossover(bars),
+                                                prepend=0) != 0).sum())
+    assert result.equity[-1] == pytest.approx(
+        numpy.prod(1 + result.returns))
+
+
+def test_run__bad_signals():
+    bars = _bars('BAC', [10.0, 11.0])
+    with pytest.raises(ValueError):
+        backtest.run(bars, [1.0])
+    with pytest.raises(ValueError):
+        backtest.run([bars, _bars('T', [1.0, 2.0])], [1.0, 1.0])
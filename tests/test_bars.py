@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+import datetime
+
+import numpy
+
+from ..poly import bars as poly_bars
+
+MINUTE = 60000
+T0 = 1609770600000  # 2021-01-04T09:30:00-05:00
+
+RESULTS = [
+    {'t': T0 + 2 * MINUTE, 'o': 3.0, 'h': 3.5, 'l': 2.5, 'c': 3.0, 'v': 30,
+     'vw': 3.1, 'n': 3},
+    {'t': T0, 'o': 1.0, 'h': 1.5, 'l': 0.5, 'c': 1.0, 'v': 10, 'vw': 1.1,
+     'n': 1},
+    {'t': T0 + MINUTE, 'o': 2.0, 'h': 2.5, 'l': 1.5, 'c': 2.0, 'v': 20},
+]
+
+
+## Bars
+
+def test_bars__from_results_typed_and_sorted():
+    '''
+    Arrays are typed per field and ordered oldest first. Optional fields
+    missing from a bar are filled in.
+    '''
+    bars = poly_bars.Bars.from_results(RESULTS, ticker='BAC')
+    assert len(bars) == 3
+    assert bars.t.dtype == numpy.int64
+    assert bars.c.dtype == numpy.float64
+    assert bars.v.dtype == numpy.float64
+    assert bars.n.dtype == numpy.int64
+    assert bars.t.tolist() == [T0, T0 + MINUTE, T0 + 2 * MINUTE]
+    assert bars.n.tolist() == [1, 0, 3]
+    assert numpy.isnan(bars.vw[1])
+
+
+def test_bars__between_is_a_view():
+    '''
+    Time range slices share memory with the original arrays.
+    '''
+    bars = poly_bars.Bars.from_results(RESULTS)
+    window = bars.between(T0 + MINUTE, T0 + 2 * MINUTE)
+    assert window.t.tolist() == [T0 + MINUTE]
+    assert numpy.shares_memory(window.c, bars.c)
+
+    start = datetime.datetime.fromtimestamp((T0 + MINUTE) / 1000,
+                                            tz=datetime.timezone.utc)
+    assert len(bars.between(start)) == 2
+    assert len(bars.between(end=T0)) == 0
+
+
+def test_bars__concat_dedups_on_timestamp():
+    first = poly_bars.Bars.from_results(RESULTS[:2])
+    second = poly_bars.Bars.from_results(RESULTS[1:])
+    bars = poly_bars.Bars.concat([second, first])
+    assert bars.t.tolist() == [T0, T0 + MINUTE, T0 + 2 * MINUTE]
+    assert len(poly_bars.Bars.concat([])) == 0
+
+
+def test_bars__concat_keeps_last_repeated_bar():
+    '''
+    Like merging aggregate responses, a later bar replaces an earlier one
+    with the same timestamp.
+    '''
+    older = poly_bars.Bars.from_results(RESULTS)
+    newer = poly_bars.Bars.from_results([dict(RESULTS[1], c=9.0)])
+    bars = poly_bars.Bars.concat([older, newer])
+    assert bars.c.tolist() == [9.0, 2.0, 3.0]
+
+
+def test_bars__fractional_volume_is_kept():
+    bars = poly_bars.Bars.from_results([dict(RESULTS[1], v=1.7)])
+    assert bars.v.tolist() == [1.7]
+
+
+def test_bars__round_trips():
+    bars = poly_bars.Bars.from_results(RESULTS)
+    frame = bars.to_dataframe()
+    assert list(frame.columns) == list(poly_bars.FIELDS)
+    assert str(frame.index[0]) == '2021-01-04 09:30:00-05:00'
+    assert bars.to_results()[0] == RESULTS[1]
+    assert bars[0] == RESULTS[1]
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+import os
+import subprocess
+import sys
+
+import numpy
+import pytest
+
+from ..poly import barstore
+from ..poly.bars import Bars
+
+MINUTE = 60000
+T0 = 1609770600000  # 2021-01-04T09:30:00-05:00
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _bars(start, stop):
+    t = T0 + numpy.arange(start, stop) * MINUTE
+    price = numpy.arange(start, stop) * 1.0
+    return Bars('BAC', t=t, o=price, h=price + 1, l=price - 1, c=price,
+                v=price * 10, vw=price, n=numpy.arange(start, stop))
+
+
+@pytest.fixture
+def store(tmp_path):
+    # a small stride, so ranges cross many index entries
+    return barstore.BarStore(str(tmp_path), index_stride=7)
+
+
+def test_barstore__round_trip(store):
+    key = store.key('bac', 1, 'minute', True)
+    assert store.count(key) == 0
+    assert len(store.read(key)) == 0
+    assert store.append(key, _bars(0, 100)) == 100
+    bars = store.read(key)
+    assert store.count(key) == 100
+    assert bars.ticker == 'BAC'
+    expected = _bars(0, 100)
+    for field in barstore.FIELDS:
+        assert (getattr(bars, field) == getattr(expected, field)).all()
+        assert getattr(bars, field).dtype == barstore.FIELDS[field]
+
+
+def test_barstore__append_skips_stored_bars(store):
+    key = store.key('BAC', 1, 'minute', True)
+    assert store.append(key, _bars(0, 50)) == 50
+    # overlapping and repeated bars only add what is new
+    assert store.append(key, _bars(40, 80)) == 30
+    assert store.append(key, _bars(0, 80)) == 0
+    assert store.append(key, _bars(80, 100).to_results()) == 20
+    assert store.read(key).t.tolist() == _bars(0, 100).t.tolist()
+
+
+def test_barstore__read_range_matches_between(store):
+    key = store.key('BAC', 1, 'minute', True)
+    store.append(key, _bars(0, 60))
+    store.append(key, _bars(60, 100))
+    expected = _bars(0, 100)
+    for start in range(-2, 103, 3):
+        for end in range(-2, 103, 5):
+            window = store.read(key, T0 + start * MINUTE, T0 + end * MINUTE)
+            assert window.t.tolist() == expected.between(
+                T0 + start * MINUTE, T0 + end * MINUTE).t.tolist()
+    assert len(store.read(key, start=T0 + 50 * MINUTE)) == 50
+    assert len(store.read(key, end=T0 + 50 * MINUTE)) == 50
+
+
+def test_barstore__read_is_a_read_only_view(store):
+    key = store.key('BAC', 1, 'minute', True)
+    store.append(key, _bars(0, 100))
+    first, second = store.read(key), store.read(key, start=T0 + 10 * MINUTE)
+    # both view the same mapped pages, nothing was copied
+    assert numpy.shares_memory(first.c, second.c)
+    assert not first.c.flags.writeable
+    with pytest.raises(ValueError):
+        first.c[0] = 1.0
+
+
+def test_barstore__reader_sees_appends(store):
+    key = store.key('BAC', 1, 'minute', True)
+    store.append(key, _bars(0, 10))
+    assert len(store.read(key)) == 10
+    other = barstore.BarStore(store.path)
+    other.append(key, _bars(10, 20))
+    assert len(store.read(key)) == 20
+
+
+def test_barstore__interrupted_append_ignored(store):
+    key = store.key('BAC', 1, 'minute', True)
+    store.append(key, _bars(0, 20))
+    bars_path, index_path = store._paths(key)
+    # records written past the header's count, and a lost index
+    with open(bars_path, 'ab') as f:
+        f.write(b'\xff' * barstore.RECORD.itemsize * 3)
+    open(index_path, 'wb').close()
+    reader = barstore.BarStore(store.path)
+    assert reader.read(key, start=T0 + 15 * MINUTE).t.tolist() == \
+        _bars(15, 20).t.tolist()
+    assert store.append(key, _bars(20, 30)) == 10
+    assert reader.read(key).t.tolist() == _bars(0, 30).t.tolist()
+    # the append rebuilt the index
+    assert len(barstore.BarStore(store.path).read(
+        key, start=T0 + 15 * MINUTE)) == 15
+
+
+def test_barstore__shared_between_processes(store):
+    key = store.key('BAC', 1, 'minute', True)
+    store.append(key, _bars(0, 100))
+    code = ('import sys; from poly.barstore import BarStore; '
+            'bars = BarStore(sys.argv[1]).read(sys.argv[2]); '
+            'print(len(bars), bars.c.sum())')
+    output = subprocess.run(
+        [sys.executable, '-c', code, store.path, key], check=True,
+        capture_output=True, text=True, cwd=ROOT).stdout
+    assert output.split() == ['100', str(_bars(0, 100).c.sum())]
+
+
+def test_barstore__not_a_store_file(store):
+    key = store.key('BAC', 1, 'minute', True)
+    bars_path, _ = store._paths(key)
+    store.append(key, _bars(0, 1))
+    with open(bars_path, 'r+b') as f:
+        f.write(b'PARQUET!')
+    with pytest.raises(RuntimeError):
+        store.read(key)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+import json
+import os
+import subprocess
+import sys
+
+from .. import poly
+from ..benchmarks.fake_polygon import FakePolygonServer
+
+API_KEY = 'NaOW_Dp24BpexIR8A9qADvh3owYD98Ka'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_poly_client__base_url_stand_in():
+    with FakePolygonServer(dividends=3) as server, \
+            poly.PolyClient(API_KEY, base_url=server.url) as client:
+        status = client.get_marketstatus(ttl=0, verbose=False)
+        dividends = client.get_dividends(['bac'])
+        aggregates = client.get_ticker_aggregates('BAC', '2021-01-04',
+                                                  '2021-01-08')
+    assert status.is_open('nyse')
+    assert dividends['BAC']['count'] == 3
+    assert aggregates['resultsCount'] == 5 * 390
+    # 2021-01-04 09:30 New York
+    assert aggregates['results'][0]['t'] == 1609770600000
+    assert server.requests[:2] == ['/v1/marketstatus/now',
+                                   '/v2/reference/dividends/BAC']
+
+
+def test_benchmarks__writes_results(tmp_path):
+    output = tmp_path / 'results.json'
+    subprocess.run([sys.executable, os.path.join(ROOT, 'benchmarks', 'run.py'),
+                    '--bars', '800', '--tickers', '3', '--repeat', '1',
+                    '--only', 'marketstatus', 'aggregates',
+                    '--output', str(output)],
+                   check=True, capture_output=True)
+    document = json.loads(output.read_text())
+    assert document['parameters']['bars'] == 3 * 390
+    results = {result['name']: result for result in document['results']}
+    assert sorted(results) == ['aggregates', 'marketstatus']
+    assert results['aggregates']['items'] == 3 * 390
+    assert results['aggregates']['throughput']['unit'] == 'bars/s'
+    assert results['aggregates']['peak_memory_bytes'] > 0
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import datetime
+import tempfile
+
+from ..poly import cache
+
+DAY = datetime.timedelta(days=1)
+JAN_4 = datetime.date(2021, 1, 4)
+
+
+## BarCache
+
+def test_bar_cache__key_includes_query_shape():
+    '''
+    Different multipliers, timespans and adjustments never share a key.
+    '''
+    keys = {
+        cache.BarCache.key('bac', 1, 'minute', True),
+        cache.BarCache.key('BAC', 1, 'minute', False),
+        cache.BarCache.key('BAC', 5, 'minute', True),
+        cache.BarCache.key('BAC', 1, 'hour', True),
+    }
+    assert len(keys) == 4
+
+
+def test_bar_cache__empty_cache_is_all_missing():
+    '''
+    With nothing cached, the whole range is one missing range.
+    '''
+    with tempfile.TemporaryDirectory() as tdir:
+        bar_cache = cache.BarCache(tdir)
+        key = bar_cache.key('BAC', 1, 'minute', True)
+        assert bar_cache.missing_ranges(key, JAN_4, JAN_4 + 6 * DAY) == [
+            (JAN_4, JAN_4 + 6 * DAY)]
+        assert bar_cache.load(key, JAN_4, JAN_4 + 6 * DAY) == []
+
+
+def test_bar_cache__store_then_find_gaps():
+    '''
+    Stored dates (including dates stored without bars) are no longer missing,
+    leaving only the gaps around them. Loading returns bars in date order.
+    '''
+    with tempfile.TemporaryDirectory() as tdir:
+        bar_cache = cache.BarCache(tdir)
+        key = bar_cache.key('BAC', 1, 'minute', True)
+        bar_cache.store(key, {
+            JAN_4 + 2 * DAY: [{'t': 3}],
+            JAN_4 + 1 * DAY: [{'t': 1}, {'t': 2}],
+            JAN_4 + 4 * DAY: [],
+        })
+        assert bar_cache.missing_ranges(key, JAN_4, JAN_4 + 6 * DAY) == [
+            (JAN_4, JAN_4),
+            (JAN_4 + 3 * DAY, JAN_4 + 3 * DAY),
+            (JAN_4 + 5 * DAY, JAN_4 + 6 * DAY)]
+        assert bar_cache.load(key, JAN_4, JAN_4 + 6 * DAY) == [
+            {'t': 1}, {'t': 2}, {'t': 3}]
+        assert bar_cache.load(key, JAN_4 + 2 * DAY, JAN_4 + 2 * DAY) == [
+            {'t': 3}]
+
+
+def test_is_cacheable__only_single_day_bars():
+    assert cache.is_cacheable(5, 'minute')
+    assert cache.is_cacheable(1, 'day')
+    assert not cache.is_cacheable(5, 'day')
+    assert not cache.is_cacheable(1, 'week')
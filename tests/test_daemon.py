@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from ..poly import daemon
+from ..benchmarks.fake_polygon import FakePolygonServer
+
+API_KEY = 'NaOW_Dp24BpexIR8A9qADvh3owYD98Ka'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(ROOT, 'bin', 'trademin-poly.py')
+
+
+def _echo(argv):
+    '''
+    A stand-in for the CLI: echoes its arguments and working directory.
+    '''
+    if argv[0] == 'fail':
+        sys.exit('echo: failed')
+    if argv[0] == 'raise':
+        raise ValueError('boom')
+    print (' '.join(argv))
+    print (os.getcwd(), file=sys.stderr)
+    return 0
+
+
+@pytest.fixture
+def running(tmp_path):
+    server = daemon.Daemon(_echo, str(tmp_path / 'poly.sock'))
+    thread = threading.Thread(target=server.serve)
+    thread.start()
+    yield server
+    daemon.stop(server.path)
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def _forward(argv, path):
+    stdout, stderr = io.StringIO(), io.StringIO()
+    status = daemon.forward(argv, path, stdout, stderr)
+    return status, stdout.getvalue(), stderr.getvalue()
+
+
+def test_daemon__runs_forwarded_commands(running, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert daemon.is_running(running.path)
+    assert oct(os.stat(running.path).st_mode & 0o777) == oct(0o700)
+    assert _forward(['aggregates', 'BAC'], running.path) == (
+        0, 'aggregates BAC\n', f'{tmp_path}\n')
+    status, stdout, stderr = _forward(['fail'], running.path)
+    assert (status, stdout, stderr) == (1, '', 'echo: failed\n')
+    status, _, stderr = _forward(['raise'], running.path)
+    assert status == 1
+    assert 'ValueError: boom' in stderr
+    # the daemon's own output is left alone
+    assert not isinstance(sys.stdout, daemon._ReplyStream)
+
+
+def test_daemon__not_running(tmp_path):
+    path = str(tmp_path / 'poly.sock')
+    assert daemon.forward(['marketstatus'], path) is None
+    assert not daemon.stop(path)
+    # a stale socket left by a killed daemon is replaced
+    open(path, 'w').close()
+    daemon.Daemon(_echo, path).server_close()
+
+
+def test_daemon__one_per_socket(running):
+    with pytest.raises(RuntimeError):
+        daemon.Daemon(_echo, running.path)
+    assert daemon.is_running(running.path)
+
+
+def _cli(*argv, env):
+    return subprocess.run([sys.executable, CLI] + list(argv), env=env,
+                          check=True, capture_output=True, text=True).stdout
+
+
+def test_cli__forwards_to_serve(tmp_path):
+    config = tmp_path / 'polygon.json'
+    config.write_text('{"api_key": "%s"}' % API_KEY)
+    socket = str(tmp_path / 'poly.sock')
+    with FakePolygonServer() as server:
+        env = dict(os.environ, POLY_BASE_URL=server.url,
+                   TRADEMIN_POLY_SOCKET=socket)
+        serving = subprocess.Popen(
+            [sys.executable, CLI, '--config', str(config), 'serve'], env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.monotonic() + 30
+            while not daemon.is_running(socket):
+                assert time.monotonic() < deadline
+                assert serving.poll() is None
+                time.sleep(0.05)
+            first = _cli('--config', str(config), 'marketstatus', env=env)
+            second = _cli('--config', str(config), 'marketstatus', env=env)
+            # the daemon's client kept the status cached
+            assert first == second
+            assert 'US Stocks' in first
+            assert server.requests.count('/v1/marketstatus/now') == 1
+            assert _cli('--config', str(config), '--no-daemon',
+                        'marketstatus', env=env) == first
+            assert server.requests.count('/v1/marketstatus/now') == 2
+            # a different POLY_BASE_URL is not forwarded, it runs here
+            with FakePolygonServer() as other:
+                assert _cli('--config', str(config), 'marketstatus',
+                            env=dict(env, POLY_BASE_URL=other.url)) == first
+                assert other.requests.count('/v1/marketstatus/now') == 1
+            assert server.requests.count('/v1/marketstatus/now') == 2
+        finally:
+            _cli('serve', '--stop', env=env)
+            assert serving.wait(10) == 0
+    assert not os.path.exists(socket)
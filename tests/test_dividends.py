@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+import datetime
+import os
+import sqlite3
+import tempfile
+
+import pandas
+
+from ..poly import dividends
+
+TODAY = datetime.date(2021, 2, 15)
+
+HISTORY = {
+    'BAC': [
+        {'ticker': 'BAC', 'exDate': '2019-12-05', 'amount': 0.18},
+        {'ticker': 'BAC', 'exDate': '2020-03-05', 'amount': 0.18},
+        {'ticker': 'BAC', 'exDate': '2020-06-04', 'amount': 0.18},
+        {'ticker': 'BAC', 'exDate': '2020-09-03', 'amount': 0.18},
+        {'ticker': 'BAC', 'exDate': '2020-12-03', 'amount': 0.18},
+    ],
+    'T': [
+        {'ticker': 'T', 'exDate': '2021-01-08', 'amount': 0.52},
+        {'ticker': 'T', 'exDate': '2021-04-08', 'amount': 0.52},
+    ],
+    'UBER': [],
+}
+
+
+## dividend_calendar
+
+def test_dividend_calendar__many_tickers():
+    '''
+    Every requested ticker gets an entry, guessed or announced.
+    '''
+    calendar = dividends.dividend_calendar(HISTORY, today=TODAY)
+    assert list(calendar) == ['BAC', 'T', 'UBER']
+
+    assert calendar['BAC']['last'] is HISTORY['BAC'][-1]
+    assert calendar['BAC']['next'] == {
+        'ticker': 'BAC', 'guess': 1, 'exDate': '2021-03-05', 'amount': 0.18}
+
+    assert calendar['T']['last'] is HISTORY['T'][-1]
+    assert calendar['T']['next'] is HISTORY['T'][-1]
+
+    assert calendar['UBER'] == {'last': None, 'next': None}
+
+
+def test_dividend_calendar__december_wraps_to_earliest_month():
+    calendar = dividends.dividend_calendar(
+        HISTORY, today=datetime.date(2021, 12, 20))
+    assert calendar['BAC']['next']['exDate'] == '2021-03-05'
+
+
+def test_dividend_calendar__no_guess():
+    calendar = dividends.dividend_calendar(HISTORY, today=TODAY, guess=False)
+    assert calendar['BAC']['next'] is None
+    assert calendar['T']['next'] is HISTORY['T'][-1]
+
+
+def test_dividend_calendar__frame_input():
+    '''
+    A plain frame of all the histories gives the same answers.
+    '''
+    frame = pandas.DataFrame(HISTORY['BAC'] + HISTORY['T'])
+    calendar = dividends.dividend_calendar(frame, today=TODAY)
+    assert list(calendar) == ['BAC', 'T']
+    assert calendar['BAC']['next']['exDate'] == '2021-03-05'
+    assert calendar['T']['last'] == HISTORY['T'][-1]
+
+
+## DividendStore
+
+def test_dividend_store__round_trip():
+    store = dividends.DividendStore(':memory:')
+    assert store.load('BAC') == []
+    assert store.count('BAC') is None
+    store.save('BAC', HISTORY['BAC'][::-1], count=5)
+    assert store.load('BAC') == HISTORY['BAC']
+    assert store.count('BAC') == 5
+    # saving again replaces the whole history
+    store.save('BAC', HISTORY['BAC'][:1])
+    assert store.load('BAC') == HISTORY['BAC'][:1]
+
+
+def test_dividend_store__same_ex_date_dividends_are_kept():
+    '''
+    A regular and a special dividend on the same exDate are both stored.
+    '''
+    regular = {'ticker': 'X', 'exDate': '2020-12-03', 'amount': 0.18}
+    special = {'ticker': 'X', 'exDate': '2020-12-03', 'amount': 1.00}
+    store = dividends.DividendStore(':memory:')
+    store.save('X', [regular, special])
+    assert store.load('X') == [regular, special]
+    assert store.count('X') == 2
+
+
+def test_dividend_store__old_schema_is_rebuilt():
+    with tempfile.TemporaryDirectory() as tdir:
+        path = os.path.join(tdir, 'dividends.sqlite')
+        db = sqlite3.connect(path)
+        db.execute('CREATE TABLE dividends (ticker TEXT NOT NULL,'
+                   ' exDate TEXT NOT NULL, record TEXT NOT NULL,'
+                   ' PRIMARY KEY (ticker, exDate))')
+        db.execute('CREATE TABLE refreshed (ticker TEXT PRIMARY KEY,'
+                   ' refreshed_at REAL NOT NULL, count INTEGER,'
+                   ' next_exDate TEXT)')
+        db.execute("INSERT INTO refreshed VALUES ('X', 0, 2, NULL)")
+        db.commit()
+        db.close()
+
+        store = dividends.DividendStore(path)
+        assert store.count('X') is None
+        store.save('X', HISTORY['BAC'])
+        assert store.load('X') == HISTORY['BAC']
+        store.close()
+
+
+def test_dividend_store__stale_tickers():
+    '''
+    Tickers are stale when never stored, too old, or when their next exDate
+    was reached since they were refreshed.
+    '''
+    day = 86400
+    now = datetime.datetime(2021, 2, 15, 12).timestamp()
+    store = dividends.DividendStore(':memory:')
+    store.save('FRESH', [], refreshed_at=now - day, next_ex_date='2021-03-05')
+    store.save('OLD', [], refreshed_at=now - 10 * day)
+    store.save('PASSED', [], refreshed_at=now - 2 * day,
+               next_ex_date='2021-02-14')
+    store.save('LONG_GONE', [], refreshed_at=now - 2 * day,
+               next_ex_date='2016-02-14')
+
+    tickers = ['NEW', 'FRESH', 'OLD', 'PASSED', 'LONG_GONE']
+    assert store.stale_tickers(tickers, 7, now=now) == ['NEW', 'OLD', 'PASSED']
+    assert store.stale_tickers(tickers, 30, now=now) == ['NEW', 'PASSED']
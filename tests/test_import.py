@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+'''
+Import time guards: `import poly` (and so the cheap CLI subcommands) must not
+pay for numpy, pandas, requests or the Polygon client until a function
+actually needs them.
+'''
+
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(ROOT, 'bin', 'trademin-poly.py')
+
+HEAVY_MODULES = ('numpy', 'pandas', 'pyarrow', 'requests', 'polygon',
+                 'sqlite3', 'websocket')
+
+# `import poly` on top of a bare interpreter, generous for slow CI machines
+MAX_IMPORT_OVERHEAD = 0.25
+
+
+def _python(code, cwd):
+    return subprocess.run([sys.executable, '-c', code], cwd=cwd, check=True,
+                          capture_output=True, text=True).stdout
+
+
+def _best_of(command, cwd, runs=5):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, check=True, capture_output=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def test_import__no_heavy_modules():
+    loaded = _python(
+        'import sys, poly; '
+        f'print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))',
+        ROOT)
+    assert loaded.strip() == ''
+
+
+def test_import__heavy_modules_load_on_first_use():
+    loaded = _python(
+        'import sys, poly; poly.Bars; poly.resample; '
+        'print("numpy" in sys.modules, "pandas" in sys.modules)', ROOT)
+    assert loaded.split() == ['True', 'False']
+
+
+def test_import__cli_help_skips_heavy_modules():
+    code = ('import runpy, sys; sys.argv = [sys.argv[0], "--help"]\n'
+            'try:\n'
+            f'    runpy.run_path({CLI!r}, run_name="__main__")\n'
+            'except SystemExit:\n'
+            '    pass\n'
+            f'print(",".join(m for m in {HEAVY_MODULES!r} '
+            'if m in sys.modules), file=sys.stderr)')
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                            capture_output=True, text=True)
+    assert result.stderr.strip() == ''
+
+
+def test_import__close_to_bare_interpreter():
+    bare = _best_of([sys.executable, '-c', 'pass'], ROOT)
+    poly = _best_of([sys.executable, '-c', 'import poly'], ROOT)
+    assert poly - bare < MAX_IMPORT_OVERHEAD
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+import json
+import threading
+
+import pytest
+
+from .. import poly
+from ..poly import instrument
+from ..benchmarks.fake_polygon import FakePolygonServer
+
+API_KEY = 'NaOW_Dp24BpexIR8A9qADvh3owYD98Ka'
+
+
+@pytest.fixture
+def recorder():
+    recorder = instrument.enable()
+    yield recorder
+    instrument.disable()
+
+
+def test_span__disabled_is_shared_no_op():
+    assert not instrument.enabled()
+    with instrument.span('a') as first, instrument.span('b') as second:
+        first.add(bytes=10)
+    assert first is second
+
+
+def test_span__records_durations_and_counters(recorder):
+    with instrument.span('stage', ticker='BAC') as span:
+        span.add(bytes=10)
+        span.add(bytes=5, retries=1)
+    with pytest.raises(ValueError):
+        with instrument.span('stage'):
+            raise ValueError
+    threads = [threading.Thread(target=instrument.record,
+                                args=('http', 0.5), kwargs={'bytes': 1})
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    summary = recorder.summary()
+    assert list(summary) == ['http', 'stage']
+    assert summary['http']['count'] == 4
+    assert summary['http']['total'] == pytest.approx(2.0)
+    assert summary['http']['bytes'] == 4
+    assert summary['stage']['count'] == 2
+    assert summary['stage']['bytes'] == 15
+    assert summary['stage']['retries'] == 1
+    spans = recorder.to_dict()['spans']
+    assert spans[0]['ticker'] == 'BAC'
+    assert spans[1]['error'] == 'ValueError'
+    assert 'wall time' in recorder.table()
+
+
+def test_timed__only_records_when_enabled():
+    calls = []
+
+    @instrument.timed('work')
+    def work(value):
+        calls.append(value)
+        return value * 2
+
+    assert work(1) == 2
+    recorder = instrument.enable()
+    try:
+        assert work(2) == 4
+    finally:
+        instrument.disable()
+    assert work(3) == 6
+    assert calls == [1, 2, 3]
+    assert recorder.summary()['work']['count'] == 1
+
+
+def test_instrument__poly_requests(recorder, tmp_path):
+    cache = poly.BarCache(str(tmp_path))
+    with FakePolygonServer() as server, \
+            poly.PolyClient(API_KEY, base_url=server.url) as client:
+        client.get_ticker_aggregates('BAC', '2021-01-04', '2021-01-15',
+                                     limit=2000, cache=cache)
+        client.get_dividends(['BAC'])
+    requests = len(server.requests)
+
+    report = json.loads(recorder.json())
+    summary = report['summary']
+    assert summary['request']['count'] == requests
+    assert summary['request']['retries'] == 0
+    assert summary['http']['count'] == requests
+    assert summary['http']['bytes'] > 0
+    for stage in ('date_parse', 'aggregates.merge', 'cache.store',
+                  'dividends.calendar'):
+        assert summary[stage]['count'] >= 1
+    calls = {span['call'] for span in report['spans']
+             if span['name'] == 'request'}
+    assert calls == {'stocks_equities_aggregates', 'reference_stock_dividends'}
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import datetime
+
+from ..poly import market
+
+
+def _ny(*args):
+    return datetime.datetime(*args, tzinfo=market.NEW_YORK)
+
+
+class FakeFetch:
+    '''
+    Counts fetches, always reporting `market` as the US stocks status.
+    '''
+    def __init__(self, market='open'):
+        self.market = market
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return market.MarketStatus(self.market, exchanges={'nyse': self.market})
+
+
+class FakeClock:
+    def __init__(self, at):
+        self.now = at.timestamp()
+
+    def __call__(self):
+        return self.now
+
+
+## session schedule
+
+def test_session_at():
+    assert market.session_at(_ny(2021, 1, 4, 3, 59)) == 'closed'
+    assert market.session_at(_ny(2021, 1, 4, 4, 0)) == 'extended-hours'
+    assert market.session_at(_ny(2021, 1, 4, 9, 30)) == 'open'
+    assert market.session_at(_ny(2021, 1, 4, 16, 0)) == 'extended-hours'
+    assert market.session_at(_ny(2021, 1, 4, 20, 0)) == 'closed'
+    assert market.session_at(_ny(2021, 1, 9, 12, 0)) == 'closed'  # Saturday
+
+
+def test_session_at__holidays_and_early_closes():
+    assert market.session_at(_ny(2021, 1, 18, 12, 0)) == 'closed'  # MLK day
+    assert market.session_at(_ny(2021, 11, 26, 12, 59)) == 'open'
+    assert market.session_at(_ny(2021, 11, 26, 13, 0)) == 'extended-hours'
+    assert market.session_at(_ny(2021, 11, 26, 17, 0)) == 'closed'
+
+
+def test_next_transition__skips_weekend():
+    assert market.next_transition(_ny(2021, 1, 4, 10, 0)) == _ny(2021, 1, 4, 16)
+    assert market.next_transition(_ny(2021, 1, 8, 21, 0)) == _ny(2021, 1, 11, 4)
+    # and holidays
+    assert market.next_transition(_ny(2021, 1, 15, 21, 0)) == _ny(2021, 1, 19, 4)
+
+
+## MarketStatusCache
+
+def test_market_status_cache__ttl_and_transitions():
+    '''
+    A status is reused until its TTL runs out or the session changes.
+    '''
+    fetch = FakeFetch()
+    clock = FakeClock(_ny(2021, 1, 4, 10, 0))
+    cache = market.MarketStatusCache(fetch, ttl=3600, clock=clock)
+
+    assert cache.get().is_open('nyse')
+    clock.now += 1800
+    assert cache.get().is_open('nyse')
+    assert fetch.calls == 1
+
+    clock.now += 1800  # ttl expired
+    cache.get()
+    assert fetch.calls == 2
+
+    fetch = FakeFetch()
+    cache = market.MarketStatusCache(fetch, ttl=86400, clock=clock)
+    clock.now = _ny(2021, 1, 4, 15, 0).timestamp()
+    cache.get()
+    clock.now = _ny(2021, 1, 4, 15, 59, 59).timestamp()
+    cache.get()
+    assert fetch.calls == 1
+    clock.now = _ny(2021, 1, 4, 16, 0, 30).timestamp()  # session changed
+    fetch.market = 'extended-hours'
+    assert not cache.get().is_open('nyse')
+    assert fetch.calls == 2
+
+
+def test_market_status_cache__just_after_boundary_uses_margin():
+    fetch = FakeFetch()
+    clock = FakeClock(_ny(2021, 1, 4, 9, 30, 5))
+    cache = market.MarketStatusCache(fetch, ttl=3600, margin=15, clock=clock)
+    cache.get()
+    clock.now += 20
+    cache.get()
+    assert fetch.calls == 2
+
+
+def test_market_status_cache__is_open_at_other_times_uses_schedule():
+    '''
+    Questions about times the cached status does not cover never fetch.
+    '''
+    fetch = FakeFetch('closed')  # eg, a holiday
+    clock = FakeClock(_ny(2021, 1, 18, 10, 0))
+    cache = market.MarketStatusCache(fetch, clock=clock)
+    assert not cache.is_open('nyse')
+    assert not cache.is_open('nyse', clock.now + 60)
+    assert cache.is_open('nyse', _ny(2021, 1, 19, 10, 0))
+    assert not cache.is_open('nyse', _ny(2021, 1, 19, 8, 0))
+    assert fetch.calls == 1
@@ -1,15 +1,29 @@
 #!/usr/bin/env python
 
+import datetime
 import os
 import tempfile
+import time
+import types
 
 import pytest
 
 from .. import poly
+from ..poly import trading_calendar
 
 EX_API_KEY = 'NaOW_Dp24BpexIR8A9qADvh3owYD98Ka'
 EX_API_KEY_RANDOM = 'THISISNOTAVALIDKEYBUTITDOESNOTMATTER'
 
+
+@pytest.fixture(autouse=True)
+def fresh_clients():
+    '''
+    Shared clients must not leak (monkeypatched) state between tests.
+    '''
+    poly.close_clients()
+    yield
+    poly.close_clients()
+
 ## todo ##
 ## poly.json_dump 
 
@@ -170,3 +184,493 @@ def test_save_api_key_to_path__valid_config_api_key_not_defined():
     the existing data values PLUS one additional api_key key and value pair.
     '''
     pass
+
+
+## get_ticker_aggregates
+
+class FakeAggregatesClient:
+    '''
+    Stand-in for polygon.RESTClient which serves one minute bar per trading
+    day (at 14:30 UTC) for whatever date range is requested.
+    '''
+    calls = []
+    queries = []
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def stocks_equities_aggregates(self, ticker, multiplier, timespan,
+                                   from_, to, limit, **query_params):
+        FakeAggregatesClient.calls.append((from_, to))
+        FakeAggregatesClient.queries.append(query_params)
+        results = []
+        day = from_
+        while day <= to:
+            if trading_calendar.is_trading_day(day):
+                ts = datetime.datetime(day.year, day.month, day.day, 14, 30,
+                                       tzinfo=datetime.timezone.utc)
+                results.append({'t': int(ts.timestamp() * 1000), 'c': 1.0})
+            day += datetime.timedelta(days=1)
+        return types.SimpleNamespace(ticker=ticker, status='OK',
+                                     queryCount=len(results),
+                                     resultsCount=len(results),
+                                     results=results)
+
+
+def test__aggregate_windows__minute_windows_fit_limit():
+    '''
+    Minute bars are windowed so that each window covers at most
+    limit // 960 days, and the windows cover the range without gaps.
+    '''
+    start = datetime.date(2021, 1, 1)
+    end = datetime.date(2021, 12, 31)
+    windows = poly._aggregate_windows(start, end, 'minute', 50000)
+    assert windows[0][0] == start
+    assert windows[-1][1] == end
+    for (_, prev_to), (next_from, _) in zip(windows, windows[1:]):
+        assert next_from == prev_to + datetime.timedelta(days=1)
+    assert all((w_to - w_from).days + 1 <= 52 for w_from, w_to in windows)
+
+
+def test__aggregate_windows__daily_single_window():
+    '''
+    A year of daily bars fits comfortably in a single request.
+    '''
+    start = datetime.date(2021, 1, 1)
+    end = datetime.date(2021, 12, 31)
+    assert poly._aggregate_windows(start, end, 'day', 5000) == [(start, end)]
+
+
+def test__aggregate_windows__sized_by_trading_sessions():
+    '''
+    With `trading`, windows hold as many sessions as fit in `limit`: the MLK
+    day holiday and weekends take no room, early closes take less.
+    '''
+    start = datetime.date(2021, 1, 1)
+    end = datetime.date(2021, 1, 31)
+    windows = poly._aggregate_windows(start, end, 'minute', 960 * 5,
+                                      trading=True)
+    assert windows == [
+        (datetime.date(2021, 1, 1), datetime.date(2021, 1, 8)),
+        (datetime.date(2021, 1, 9), datetime.date(2021, 1, 15)),
+        (datetime.date(2021, 1, 16), datetime.date(2021, 1, 25)),
+        (datetime.date(2021, 1, 26), datetime.date(2021, 1, 31))]
+    # Thanksgiving week: the Friday early close (780 minutes) still fits
+    assert poly._aggregate_windows(
+        datetime.date(2021, 11, 22), datetime.date(2021, 11, 26), 'minute',
+        960 * 3 + 780, trading=True) == [
+        (datetime.date(2021, 11, 22), datetime.date(2021, 11, 26))]
+    # nothing to request over a holiday weekend
+    assert poly._aggregate_windows(
+        datetime.date(2021, 1, 16), datetime.date(2021, 1, 18), 'minute',
+        5000, trading=True) == []
+
+
+def test_get_ticker_aggregates__closed_days_need_no_request(monkeypatch):
+    '''
+    A stock query over a weekend sends nothing, crypto is still requested.
+    '''
+    FakeAggregatesClient.calls = []
+    monkeypatch.setattr(poly, 'RESTClient', FakeAggregatesClient)
+    data = poly.get_ticker_aggregates(EX_API_KEY, 'BAC', '2021-01-09',
+                                      '2021-01-10')
+    assert FakeAggregatesClient.calls == []
+    assert data['ticker'] == 'BAC'
+    assert data['resultsCount'] == 0
+    poly.get_ticker_aggregates(EX_API_KEY, 'X:BTCUSD', '2021-01-09',
+                               '2021-01-10')
+    assert FakeAggregatesClient.calls == [
+        (datetime.date(2021, 1, 9), datetime.date(2021, 1, 10))]
+
+
+def test_get_ticker_aggregates__chunked_merge(monkeypatch):
+    '''
+    A range longer than one window is fetched as several requests and merged
+    into one de-duplicated, ordered result. Only trading days are requested.
+    '''
+    FakeAggregatesClient.calls = []
+    monkeypatch.setattr(poly, 'RESTClient', FakeAggregatesClient)
+    data = poly.get_ticker_aggregates(EX_API_KEY, 'bac', '2021-01-01',
+                                      '2021-01-31', limit=960 * 7,
+                                      sort='desc', max_workers=3)
+    assert sorted(FakeAggregatesClient.calls) == [
+        (datetime.date(2021, 1, 1), datetime.date(2021, 1, 12)),
+        (datetime.date(2021, 1, 13), datetime.date(2021, 1, 22)),
+        (datetime.date(2021, 1, 23), datetime.date(2021, 1, 31))]
+    assert data['ticker'] == 'BAC'
+    assert data['resultsCount'] == 19
+    timestamps = [bar['t'] for bar in data['results']]
+    assert timestamps == sorted(set(timestamps), reverse=True)
+
+
+def test_get_ticker_aggregates__sends_unadjusted(monkeypatch):
+    '''
+    The adjustment is requested, not only used to key the cache.
+    '''
+    monkeypatch.setattr(poly, 'RESTClient', FakeAggregatesClient)
+    for unadjusted, expected in ((True, 'true'), (False, 'false')):
+        FakeAggregatesClient.queries = []
+        poly.get_ticker_aggregates(EX_API_KEY, 'BAC', '2021-01-04',
+                                   '2021-01-08', unadjusted=unadjusted)
+        assert FakeAggregatesClient.queries == [{'unadjusted': expected}]
+
+
+def test_get_ticker_aggregates__truncated_window_is_split(monkeypatch):
+    '''
+    A window whose response hits `limit` is split and fetched again.
+    '''
+    FakeAggregatesClient.calls = []
+    monkeypatch.setattr(poly, 'RESTClient', FakeAggregatesClient)
+    data = poly.get_ticker_aggregates(EX_API_KEY, 'BAC', '2021-01-01',
+                                      '2021-01-10', timespan='day', limit=4)
+    assert data['resultsCount'] == 5
+    assert len(FakeAggregatesClient.calls) > 3
+
+
+def test_get_ticker_aggregates__cache_fills_gaps_only(monkeypatch):
+    '''
+    With a cache, a repeated query is served from disk without any requests
+    and an extended query only requests the dates not cached yet.
+    '''
+    monkeypatch.setattr(poly, 'RESTClient', FakeAggregatesClient)
+    with tempfile.TemporaryDirectory() as tdir:
+        bar_cache = poly.BarCache(tdir)
+
+        FakeAggregatesClient.calls = []
+        first = poly.get_ticker_aggregates(EX_API_KEY, 'BAC', '2021-01-01',
+                                           '2021-01-10', cache=bar_cache)
+        assert FakeAggregatesClient.calls
+
+        FakeAggregatesClient.calls = []
+        again = poly.get_ticker_aggregates(EX_API_KEY, 'BAC', '2021-01-01',
+                                           '2021-01-10', cache=bar_cache)
+        assert FakeAggregatesClient.calls == []
+        assert again['results'] == first['results']
+
+        FakeAggregatesClient.calls = []
+        extended = poly.get_ticker_aggregates(EX_API_KEY, 'BAC', '2021-01-01',
+                                              '2021-01-12', cache=bar_cache)
+        assert FakeAggregatesClient.calls == [
+            (datetime.date(2021, 1, 11), datetime.date(2021, 1, 12))]
+        assert extended['resultsCount'] == 7
+
+
+class FakeMinuteClient(FakeAggregatesClient):
+    '''
+    Serves a full 390 minute regular session for every weekday, truncated
+    to `limit` bars like Polygon does.
+    '''
+    def stocks_equities_aggregates(self, ticker, multiplier, timespan,
+                                   from_, to, limit, **query_params):
+        FakeAggregatesClient.calls.append((from_, to))
+        results = []
+        day = from_
+        while day <= to:
+            if day.weekday() < 5:
+                ts = datetime.datetime(day.year, day.month, day.day, 14, 30,
+                                       tzinfo=datetime.timezone.utc)
+                start = int(ts.timestamp() * 1000)
+                results.extend({'t': start + minute * 60000, 'c': 1.0}
+                               for minute in range(390))
+            day += datetime.timedelta(days=1)
+        results = results[:limit]
+        return types.SimpleNamespace(ticker=ticker, status='OK',
+                                     queryCount=len(results),
+                                     resultsCount=len(results),
+                                     results=results)
+
+
+def test_get_ticker_aggregates__truncated_day_is_not_cached(monkeypatch):
+    '''
+    A single day that is still truncated by `limit` is returned as is, but
+    never cached as that day's complete data.
+    '''
+    monkeypatch.setattr(poly, 'RESTClient', FakeMinuteClient)
+    with tempfile.TemporaryDirectory() as tdir:
+        bar_cache = poly.BarCache(tdir)
+        data = poly.get_ticker_aggregates(EX_API_KEY, 'BAC', '2021-01-04',
+                                          '2021-01-05', limit=100,
+                                          cache=bar_cache)
+        assert data['resultsCount'] == 200
+        key = bar_cache.key('BAC', 1, 'minute', True)
+        assert bar_cache.missing_ranges(
+            key, datetime.date(2021, 1, 4), datetime.date(2021, 1, 5)) == [
+            (datetime.date(2021, 1, 4), datetime.date(2021, 1, 5))]
+
+        poly.get_ticker_aggregates(EX_API_KEY, 'BAC', '2021-01-02',
+                                   '2021-01-04', limit=1000, cache=bar_cache)
+        assert bar_cache.missing_ranges(
+            key, datetime.date(2021, 1, 2), datetime.date(2021, 1, 4)) == []
+        assert len(bar_cache.load(key, datetime.date(2021, 1, 4),
+                                  datetime.date(2021, 1, 4))) == 390
+
+
+## timestamps_to_isoformat
+
+def test_timestamp_to_isoformat__independent_of_host_timezone(monkeypatch):
+    '''
+    Conversion to New York time must not depend on the host's local timezone.
+    '''
+    monkeypatch.setenv('TZ', 'Asia/Tokyo')
+    time.tzset()
+    try:
+        assert (poly.timestamp_to_isoformat(1609770600000) ==
+                '2021-01-04T09:30:00-05:00')
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+
+def test_timestamps_to_isoformat__matches_single_conversion():
+    '''
+    The batch conversion gives the same strings as converting one at a time,
+    across both sides of a daylight saving change and with msec fractions.
+    '''
+    timestamps = [1609770600000, 1615705200000, 1615791600000,
+                  1636257600000, 1636264800000, 1609770600123]
+    assert poly.timestamps_to_isoformat(timestamps) == [
+        poly.timestamp_to_isoformat(ts) for ts in timestamps]
+    assert poly.timestamps_to_isoformat([]) == []
+
+
+def test_iter_ticker_aggregates__yields_ordered_windows(monkeypatch):
+    '''
+    The streaming form yields one chunk per window, newest first with
+    sort='desc', and the chunks add up to the merged result.
+    '''
+    monkeypatch.setattr(poly, 'RESTClient', FakeAggregatesClient)
+    query = dict(from_='2021-01-01', to='2021-01-31', limit=960 * 7,
+                 sort='desc')
+    chunks = list(poly.iter_ticker_aggregates(EX_API_KEY, 'BAC', **query))
+    assert len(chunks) == 3
+    streamed = [bar for bars in chunks for bar in bars]
+    merged = poly.get_ticker_aggregates(EX_API_KEY, 'BAC', **query)
+    assert streamed == merged['results']
+
+
+def test_get_ticker_aggregates__as_bars(monkeypatch):
+    '''
+    as_bars returns the same bars as a columnar, oldest first, Bars object.
+    '''
+    monkeypatch.setattr(poly, 'RESTClient', FakeAggregatesClient)
+    query = dict(from_='2021-01-01', to='2021-01-31', limit=960 * 7)
+    bars = poly.get_ticker_aggregates(EX_API_KEY, 'bac', as_bars=True, **query)
+    data = poly.get_ticker_aggregates(EX_API_KEY, 'bac', **query)
+    assert bars.ticker == 'BAC'
+    assert bars.t.tolist() == [bar['t'] for bar in data['results']]
+
+
+class FailingMinuteClient(FakeMinuteClient):
+    '''
+    Like FakeMinuteClient, but every request for 'BAD' fails.
+    '''
+    def stocks_equities_aggregates(self, ticker, *args, **kwargs):
+        if ticker == 'BAD':
+            raise RuntimeError('no such ticker')
+        return super().stocks_equities_aggregates(ticker, *args, **kwargs)
+
+
+def test_save_universe_aggregates__partitioned_by_ticker_and_date(monkeypatch):
+    '''
+    Every ticker gets one file per New York date, a failing ticker is
+    reported without stopping the others.
+    '''
+    monkeypatch.setattr(poly, 'RESTClient', FailingMinuteClient)
+    seen = []
+    with tempfile.TemporaryDirectory() as tdir:
+        report = poly.save_universe_aggregates(
+            EX_API_KEY, ['t', 'BAC', 'BAD', 'bac'], tdir, '2021-01-04',
+            '2021-01-10', limit=1000, format='csv', max_tickers=2,
+            progress=lambda ticker, report: seen.append(ticker))
+        assert sorted(os.listdir(tdir)) == ['BAC', 'BAD', 'T']
+        assert sorted(os.listdir(os.path.join(tdir, 'BAC'))) == [
+            f'2021-01-{day:02d}.csv' for day in range(4, 9)]
+        assert os.listdir(os.path.join(tdir, 'BAD')) == []
+        with open(os.path.join(tdir, 'T', '2021-01-05.csv')) as f:
+            assert len(f.readlines()) == 390 + 1
+
+    assert sorted(seen) == ['BAC', 'BAD', 'T']
+    assert report['tickers'] == 3
+    assert report['succeeded'] == ['T', 'BAC']
+    assert list(report['failed']) == ['BAD']
+    assert 'no such ticker' in report['failed']['BAD']
+    assert report['bars'] == 2 * 5 * 390
+    assert report['files'] == 2 * 5
+    # one session per window at this limit, plus however many windows of the
+    # failing ticker were requested before it gave up
+    assert report['requests'] >= 2 * 5
+    assert report['seconds'] >= 0
+
+
+def test_load_universe():
+    with tempfile.TemporaryDirectory() as tdir:
+        path = os.path.join(tdir, 'universe.txt')
+        with open(path, 'w') as f:
+            f.write('# large caps\nbac, T\n\nUBER KO  # more\nT\n')
+        assert poly.load_universe(path) == ['BAC', 'T', 'UBER', 'KO']
+
+
+## date_parse
+
+def test_date_parse__iso_fast_path_matches_dateutil():
+    '''
+    ISO dates skip dateutil, but give the same UTC result it would.
+    '''
+    from dateutil.parser import parse as dtparse
+    expected = dtparse('2021-01-04').replace(tzinfo=datetime.timezone.utc)
+    assert poly.date_parse(' 2021-01-04 ', as_date=False) == expected
+    assert poly.date_parse('2021-01-04') == datetime.date(2021, 1, 4)
+    assert poly.date_parse('Jan 4 2021') == datetime.date(2021, 1, 4)
+
+
+def test_date_parse__relative_dates_are_not_memoized():
+    '''
+    'today' and 'yesterday' are always worked out afresh.
+    '''
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    assert poly.date_parse('Today') == today
+    assert poly.date_parse('yesterday') == today - datetime.timedelta(days=1)
+
+
+def test_date_parse__trading_sessions(monkeypatch):
+    '''
+    With `trading`, 'today' and 'yesterday' are trading days in New York.
+    '''
+    # a Monday after a Friday holiday (Good Friday)
+    monkeypatch.setattr(poly.trading_calendar, 'new_york_today',
+                        lambda: datetime.date(2021, 4, 5))
+    assert poly.date_parse('today', trading=True) == datetime.date(2021, 4, 5)
+    assert poly.date_parse('yesterday', trading=True) == \
+        datetime.date(2021, 4, 1)
+    assert poly.date_parse('yesterday', as_date=False, trading=True) == \
+        datetime.datetime(2021, 4, 1, tzinfo=datetime.timezone.utc)
+    monkeypatch.setattr(poly.trading_calendar, 'new_york_today',
+                        lambda: datetime.date(2021, 4, 4))
+    assert poly.date_parse('today', trading=True) == datetime.date(2021, 4, 1)
+    assert poly.date_parse('2021-04-04', trading=True) == \
+        datetime.date(2021, 4, 4)
+
+
+def test_date_parse_many__keeps_order():
+    dates = poly.date_parse_many(['2021-01-05', '2020-12-31', '2021-01-05'])
+    assert dates == [datetime.date(2021, 1, 5), datetime.date(2020, 12, 31),
+                     datetime.date(2021, 1, 5)]
+
+
+## dividends
+
+DIVIDENDS = [
+    {'ticker': 'BAC', 'exDate': '2019-03-07', 'amount': 0.15},
+    {'ticker': 'BAC', 'exDate': '2019-06-06', 'amount': 0.15},
+    {'ticker': 'BAC', 'exDate': '2019-09-05', 'amount': 0.18},
+    {'ticker': 'BAC', 'exDate': '2019-12-05', 'amount': 0.18},
+    {'ticker': 'BAC', 'exDate': '2020-03-05', 'amount': 0.18},
+    {'ticker': 'BAC', 'exDate': '2020-06-04', 'amount': 0.18},
+]
+
+
+def test__get_last_dividend():
+    assert poly._get_last_dividend([]) is None
+    assert poly._get_last_dividend(DIVIDENDS[::-1]) == DIVIDENDS[-1]
+
+
+def test__get_next_dividend__known_future_date():
+    future = {'ticker': 'BAC', 'exDate': '2999-01-01', 'amount': 1.0}
+    assert poly._get_next_dividend(DIVIDENDS + [future]) == future
+
+
+def test__get_next_dividend__guess():
+    '''
+    When every known exDate is in the past, the next one is guessed from
+    the months dividends were paid in before.
+    '''
+    next_dividend = poly._get_next_dividend(DIVIDENDS)
+    assert next_dividend['guess'] == 1
+    assert next_dividend['ticker'] == 'BAC'
+    assert poly._get_next_dividend(DIVIDENDS, guess=False) is None
+
+
+class FakeDividendsClient(FakeAggregatesClient):
+    '''
+    Stand-in for polygon.RESTClient serving `DIVIDENDS` for every ticker.
+    '''
+    def reference_stock_dividends(self, symbol, **query_params):
+        FakeDividendsClient.calls.append(symbol)
+        results = [dict(record, ticker=symbol) for record in DIVIDENDS]
+        return types.SimpleNamespace(status='OK', count=len(results),
+                                     results=results)
+
+
+def test_get_dividends__store_skips_fresh_tickers(monkeypatch):
+    '''
+    With a store, only tickers that are not stored yet are requested, and
+    the summaries are the same either way.
+    '''
+    monkeypatch.setattr(poly, 'RESTClient', FakeDividendsClient)
+    store = poly.DividendStore(':memory:')
+
+    FakeDividendsClient.calls = []
+    first = poly.get_dividends(EX_API_KEY, ['bac', 'T'], store=store)
+    assert FakeDividendsClient.calls == ['BAC', 'T']
+
+    FakeDividendsClient.calls = []
+    second = poly.get_dividends(EX_API_KEY, ['BAC', 'T', 'KO'], store=store)
+    assert FakeDividendsClient.calls == ['KO']
+    assert second['BAC'] == first['BAC']
+    assert second['KO']['count'] == len(DIVIDENDS)
+    assert second['KO']['next']['guess'] == 1
+
+
+## PolyClient
+
+def test_poly_client__rest_client_uses_pooled_session():
+    with poly.PolyClient(EX_API_KEY, pool_size=8) as client:
+        assert client._rest._session is client.session
+        adapter = client.session.get_adapter('https://api.polygon.io')
+        assert adapter._pool_maxsize == 8
+
+
+def test_get_client__shared_per_api_key(monkeypatch):
+    '''
+    Module level wrappers reuse one client (and so one session) per api key.
+    '''
+    created = []
+
+    class CountingClient(FakeDividendsClient):
+        def __init__(self, api_key):
+            super().__init__(api_key)
+            created.append(api_key)
+
+    monkeypatch.setattr(poly, 'RESTClient', CountingClient)
+    assert poly.get_client(EX_API_KEY) is poly.get_client(EX_API_KEY)
+    assert poly.get_client(EX_API_KEY) is not poly.get_client(EX_API_KEY_RANDOM)
+    poly.get_dividends(EX_API_KEY, ['BAC'])
+    poly.get_ticker_aggregates(EX_API_KEY, 'BAC', '2021-01-01', '2021-01-31',
+                               limit=960 * 7)
+    assert created == [EX_API_KEY, EX_API_KEY_RANDOM]
+
+
+def test_get_scheduler__configured_from_config():
+    '''
+    Clients of both priority lanes share the api key's scheduler, and the
+    config's rate limit is applied to it.
+    '''
+    config = {'api_key': EX_API_KEY, 'requests_per_minute': 120,
+              'requests_burst': 5}
+    scheduler = poly.get_scheduler(EX_API_KEY, config)
+    try:
+        assert scheduler.requests_per_minute == 120
+        assert scheduler.burst == 5
+        assert poly.get_client(EX_API_KEY).scheduler is scheduler
+        bulk = poly.get_client(EX_API_KEY, 'bulk')
+        assert bulk.scheduler is scheduler
+        assert bulk.priority == 'bulk'
+        assert bulk is not poly.get_client(EX_API_KEY)
+    finally:
+        scheduler.configure()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+import datetime
+
+import numpy
+import pandas
+import pytest
+
+from ..poly import bars as poly_bars
+from ..poly import resample
+from ..poly.market import NEW_YORK
+
+
+def _ms(*args):
+    return int(datetime.datetime(*args, tzinfo=NEW_YORK).timestamp() * 1000)
+
+
+def _minute_bars(days, seed=0):
+    '''
+    1 minute bars for the regular session (09:30 - 16:00) of every date in
+    `days`, with random prices and volumes.
+    '''
+    rng = numpy.random.default_rng(seed)
+    t = numpy.concatenate([
+        _ms(day.year, day.month, day.day, 9, 30) + numpy.arange(390) * 60000
+        for day in days])
+    c = 100 + numpy.cumsum(rng.normal(0, 0.1, len(t)))
+    o = c + rng.normal(0, 0.05, len(t))
+    h = numpy.maximum(o, c) + rng.random(len(t))
+    l = numpy.minimum(o, c) - rng.random(len(t))
+    v = rng.integers(1, 1000, len(t)).astype(float)
+    vw = (h + l) / 2
+    n = rng.integers(1, 50, len(t))
+    return poly_bars.Bars('BAC', t=t, o=o, h=h, l=l, c=c, v=v, vw=vw, n=n)
+
+
+# either side of the 2021-03-14 daylight saving change
+DAYS = [datetime.date(2021, 3, 11), datetime.date(2021, 3, 12),
+        datetime.date(2021, 3, 15), datetime.date(2021, 4, 1)]
+
+
+def _reference(bars, rule):
+    '''
+    The same resampling done the slow way, with pandas.
+    '''
+    frame = bars.to_dataframe()
+    frame['pv'] = frame['vw'] * frame['v']
+    grouped = frame.resample(rule, label='left', closed='left').agg({
+        't': 'first', 'o': 'first', 'h': 'max', 'l': 'min', 'c': 'last',
+        'v': 'sum', 'pv': 'sum', 'n': 'sum'}).dropna(subset=['t'])
+    grouped['vw'] = grouped['pv'] / grouped['v']
+    grouped['t'] = grouped.index.as_unit('ms').asi8
+    return grouped
+
+
+@pytest.mark.parametrize('multiplier, timespan, rule', [
+    (5, 'minute', '5min'),
+    (15, 'minute', '15min'),
+    (1, 'hour', '1h'),
+    (1, 'day', '1D'),
+])
+def test_resample__matches_pandas(multiplier, timespan, rule):
+    bars = _minute_bars(DAYS)
+    resampled = resample.resample(bars, multiplier, timespan)
+    expected = _reference(bars, rule)
+    assert resampled.ticker == 'BAC'
+    assert resampled.t.tolist() == expected['t'].tolist()
+    for field in ('o', 'h', 'l', 'c', 'v', 'n'):
+        assert getattr(resampled, field).tolist() == expected[field].tolist()
+    numpy.testing.assert_allclose(resampled.vw, expected['vw'])
+
+
+def test_resample__new_york_alignment():
+    '''
+    Hours start on the hour, days at New York midnight (across the daylight
+    saving change), weeks on Sunday, quarters on their first day.
+    '''
+    bars = _minute_bars(DAYS)
+    hours = resample.resample(bars, 1, 'hour')
+    assert hours.t[0] == _ms(2021, 3, 11, 9)
+    assert len(hours) == 4 * 7
+
+    days = resample.resample(bars, 1, 'day')
+    assert days.t.tolist() == [_ms(d.year, d.month, d.day) for d in DAYS]
+    assert days.v.tolist() == [bars.between(_ms(d.year, d.month, d.day),
+                               _ms(d.year, d.month, d.day, 23)).v.sum()
+                               for d in DAYS]
+
+    weeks = resample.resample(bars, 1, 'week')
+    assert weeks.t.tolist() == [_ms(2021, 3, 7), _ms(2021, 3, 14),
+                                _ms(2021, 3, 28)]
+
+    quarters = resample.resample(bars, 1, 'quarter')
+    assert quarters.t.tolist() == [_ms(2021, 1, 1), _ms(2021, 4, 1)]
+    assert quarters.o[0] == bars.o[0]
+    assert quarters.c[0] == bars.c[3 * 390 - 1]
+
+    years = resample.resample(bars, 1, 'year')
+    assert len(years) == 1
+    assert years.h[0] == bars.h.max()
+    assert years.n[0] == bars.n.sum()
+
+
+def test_resample__multi_day_counts_from_first_date():
+    bars = _minute_bars(DAYS)
+    two_days = resample.resample(bars, 2, 'day')
+    assert two_days.t.tolist() == [_ms(2021, 3, 11), _ms(2021, 3, 15),
+                                   _ms(2021, 3, 31)]
+
+
+def test_resample__fall_back_hours_are_kept_apart():
+    '''
+    On 2021-11-07, 01:00 - 02:00 New York happens twice.
+    '''
+    start = _ms(2021, 11, 7, 0, 0)
+    t = start + numpy.arange(4 * 60) * 60000
+    bars = poly_bars.Bars('X', t=t, o=numpy.ones(len(t)), h=numpy.ones(len(t)),
+                          l=numpy.ones(len(t)), c=numpy.ones(len(t)),
+                          v=numpy.ones(len(t)))
+    hours = resample.resample(bars, 1, 'hour')
+    assert numpy.diff(hours.t).tolist() == [3600000] * 3
+    assert hours.v.tolist() == [60, 60, 60, 60]
+    # vw is missing from every bar, so it stays missing
+    assert numpy.isnan(hours.vw).all()
+
+
+def test_resample_many__same_as_one_at_a_time():
+    bars = _minute_bars(DAYS)
+    timeframes = [(5, 'minute'), (1, 'hour'), (1, 'day'), (1, 'month')]
+    many = resample.resample_many(bars, timeframes)
+    assert list(many) == timeframes
+    for multiplier, timespan in timeframes:
+        one = resample.resample(bars, multiplier, timespan)
+        assert many[(multiplier, timespan)].to_results() == one.to_results()
+
+
+def test_resample__empty_and_invalid():
+    assert len(resample.resample(poly_bars.Bars('X'), 1, 'day')) == 0
+    with pytest.raises(ValueError):
+        resample.resample(poly_bars.Bars('X'), 1, 'fortnight')
+    with pytest.raises(ValueError):
+        resample.resample(_minute_bars(DAYS[:1]), 0, 'minute')
+
+
+def test_resample__widths_not_dividing_a_day_restart_at_midnight():
+    bars = _minute_bars(DAYS[:2])
+    sevens = resample.resample(bars, 7, 'minute')
+    assert sevens.t[0] == _ms(2021, 3, 11, 9, 27)
+    assert all((resample.local_timestamps(sevens) % resample.DAY_MS) %
+               (7 * 60000) == 0)
+    assert sevens.v.sum() == bars.v.sum()
+
+    # round the clock bars over two dates
+    start = _ms(2021, 3, 11)
+    t = start + numpy.arange(2 * 24 * 60) * 60000
+    ones = numpy.ones(len(t))
+    bars = poly_bars.Bars('X:BTCUSD', t=t, o=ones, h=ones, l=ones, c=ones,
+                          v=ones)
+    fives = resample.resample(bars, 5, 'hour')
+    assert fives.t.tolist() == [_ms(2021, 3, day, hour) for day in (11, 12)
+                                for hour in (0, 5, 10, 15, 20)]
+    assert fives.v.tolist() == [300, 300, 300, 300, 240] * 2
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+import threading
+import time
+import types
+
+import pytest
+import requests
+
+from ..poly import scheduler
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeSleep:
+    '''
+    Records the requested delays instead of sleeping.
+    '''
+    def __init__(self):
+        self.delays = []
+
+    def __call__(self, seconds):
+        self.delays.append(seconds)
+
+
+def _http_error(status, retry_after=None):
+    headers = {} if retry_after is None else {'Retry-After': str(retry_after)}
+    response = types.SimpleNamespace(status_code=status, headers=headers)
+    return requests.HTTPError(f'{status} error', response=response)
+
+
+class Flaky:
+    '''
+    Raises each of `errors` in turn, then returns 'ok'.
+    '''
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+## token bucket
+
+def test_request_scheduler__no_limit_never_waits():
+    clock = FakeClock()
+    sched = scheduler.RequestScheduler(clock=clock)
+    for _ in range(100):
+        sched.acquire()
+    assert sched.requests == 100
+
+
+def test_request_scheduler__burst_then_paced():
+    '''
+    `burst` requests go straight out, the next one waits for a token to be
+    refilled at the configured rate.
+    '''
+    clock = FakeClock()
+    # 100 requests per second, so the real time waits are tiny
+    sched = scheduler.RequestScheduler(6000, burst=2, clock=clock)
+    sched.acquire()
+    sched.acquire()
+
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (sched.acquire(), done.set()),
+                              daemon=True)
+    thread.start()
+    assert not done.wait(0.05)
+
+    clock.now += 0.02
+    assert done.wait(2)
+    thread.join()
+    assert sched.requests == 3
+
+
+def test_request_scheduler__bulk_yields_to_interactive():
+    '''
+    Once a token is available, a waiting interactive request takes it ahead
+    of a bulk request that has been waiting longer.
+    '''
+    clock = FakeClock()
+    sched = scheduler.RequestScheduler(6000, burst=1, clock=clock)
+    sched.acquire()
+
+    order = []
+    def request(priority):
+        sched.acquire(priority)
+        order.append(priority)
+
+    bulk = threading.Thread(target=request, args=('bulk',), daemon=True)
+    bulk.start()
+    _wait_for(lambda: sched._waiting['bulk'] == 1)
+    interactive = threading.Thread(target=request, args=('interactive',),
+                                   daemon=True)
+    interactive.start()
+    _wait_for(lambda: sched._waiting['interactive'] == 1)
+
+    clock.now += 0.02
+    interactive.join(2)
+    assert order == ['interactive']
+    clock.now += 0.02
+    bulk.join(2)
+    assert order == ['interactive', 'bulk']
+
+
+def test_request_scheduler__unknown_priority():
+    with pytest.raises(ValueError):
+        scheduler.RequestScheduler().acquire('urgent')
+
+
+## retries
+
+def test_request_scheduler__retries_rate_limits_and_server_errors():
+    sleep = FakeSleep()
+    sched = scheduler.RequestScheduler(sleep=sleep, backoff=1, backoff_max=4)
+    fn = Flaky(_http_error(429, retry_after=7), _http_error(503),
+               requests.ConnectionError())
+    assert sched.call(fn) == 'ok'
+    assert fn.calls == 4
+    assert sched.retries == 3
+    # Retry-After wins over a shorter backoff, the rest stay under the ceiling
+    assert sleep.delays[0] == 7
+    assert 0 <= sleep.delays[1] <= 2
+    assert 0 <= sleep.delays[2] <= 4
+
+
+def test_request_scheduler__client_errors_are_not_retried():
+    sleep = FakeSleep()
+    sched = scheduler.RequestScheduler(sleep=sleep)
+    fn = Flaky(_http_error(404))
+    with pytest.raises(requests.HTTPError):
+        sched.call(fn)
+    assert fn.calls == 1
+    assert sleep.delays == []
+
+
+def test_request_scheduler__gives_up_after_max_retries():
+    sleep = FakeSleep()
+    sched = scheduler.RequestScheduler(max_retries=2, sleep=sleep)
+    fn = Flaky(*[_http_error(500)] * 5)
+    with pytest.raises(requests.HTTPError):
+        sched.call(fn)
+    assert fn.calls == 3
+    assert len(sleep.delays) == 2
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+import threading
+
+import pytest
+
+from ..poly import stream
+from .fake_stream import FakeStreamServer
+
+API_KEY = 'NaOW_Dp24BpexIR8A9qADvh3owYD98Ka'
+MINUTE = 60000
+T0 = 1609770600000  # 2021-01-04T09:30:00-05:00
+
+
+def _aggregate(sym, minute, close):
+    return {'ev': 'AM', 'sym': sym, 'v': 100 + minute, 'av': 1000,
+            'op': 10.0, 'vw': close - 0.01, 'o': close - 0.05,
+            'c': close, 'h': close + 0.1, 'l': close - 0.1, 'a': close,
+            'z': 10, 's': T0 + minute * MINUTE, 'e': T0 + (minute + 1) * MINUTE}
+
+
+def _trade(sym, ms, price, size):
+    return {'ev': 'T', 'sym': sym, 'x': 4, 'i': '1', 'z': 1, 'p': price,
+            's': size, 'c': [0], 't': T0 + ms}
+
+
+## RingBuffer
+
+def test_ring_buffer__keeps_latest_bars_in_order():
+    buffer = stream.RingBuffer('BAC', size=3)
+    assert buffer.last() is None
+    assert len(buffer.bars()) == 0
+    for minute in range(5):
+        buffer.append({'t': T0 + minute * MINUTE, 'c': float(minute)})
+    assert len(buffer) == 3
+    assert buffer.bars().c.tolist() == [2.0, 3.0, 4.0]
+    assert buffer.bars(2).t.tolist() == [T0 + 3 * MINUTE, T0 + 4 * MINUTE]
+    assert buffer.last()['c'] == 4.0
+
+    # an update of the latest minute replaces it
+    buffer.append({'t': T0 + 4 * MINUTE, 'c': 9.0})
+    assert buffer.bars().c.tolist() == [2.0, 3.0, 9.0]
+
+
+def test_ring_buffer__consistent_while_appending():
+    '''
+    Snapshots taken while another thread appends are never torn.
+    '''
+    buffer = stream.RingBuffer('BAC', size=64)
+    done = threading.Event()
+
+    def append():
+        for minute in range(20000):
+            buffer.append({'t': T0 + minute * MINUTE, 'c': float(minute)})
+        done.set()
+
+    thread = threading.Thread(target=append)
+    thread.start()
+    while not done.is_set():
+        bars = buffer.bars()
+        assert ((bars.t - T0) // MINUTE == bars.c).all()
+        assert (bars.c[1:] - bars.c[:-1] == 1).all()
+    thread.join()
+
+
+## StreamClient
+
+def test_stream_client__minute_aggregates():
+    '''
+    Minute aggregates fill each ticker's buffer and reach the callbacks.
+    Tickers that were not subscribed to are ignored.
+    '''
+    messages = [
+        [_aggregate('BAC', 0, 30.0), _aggregate('T', 0, 28.0)],
+        [_aggregate('BAC', 1, 30.5)],
+        [_aggregate('BAC', 2, 31.0), _aggregate('KO', 2, 50.0)],
+    ]
+    with FakeStreamServer(messages, api_key=API_KEY) as server:
+        client = stream.StreamClient(API_KEY, ['bac', 'T'], buffer_size=2,
+                                     url=server.url)
+        seen = []
+        statuses = []
+        client.on('bar', lambda ticker, bar: seen.append((ticker, bar['c'])))
+        client.on('status', lambda event: statuses.append(event['status']))
+        client.run()
+
+    assert server.received == [
+        {'action': 'auth', 'params': API_KEY},
+        {'action': 'subscribe', 'params': 'AM.BAC,AM.T'}]
+    assert statuses == ['connected', 'auth_success']
+    assert client.authenticated.is_set()
+    assert seen == [('BAC', 30.0), ('T', 28.0), ('BAC', 30.5), ('BAC', 31.0)]
+
+    bac = client.buffer('BAC').bars()
+    assert bac.t.tolist() == [T0 + MINUTE, T0 + 2 * MINUTE]
+    assert bac.c.tolist() == [30.5, 31.0]
+    assert bac.v.tolist() == [101, 102]
+    assert client.buffer('t').last()['c'] == 28.0
+
+
+def test_stream_client__trades_roll_up_into_minute_bars():
+    messages = [
+        [_trade('BAC', 1000, 30.0, 100), _trade('BAC', 20000, 31.0, 300)],
+        [_trade('BAC', 59999, 29.5, 100)],
+        [_trade('BAC', MINUTE + 5, 30.2, 50)],
+    ]
+    with FakeStreamServer(messages) as server:
+        client = stream.StreamClient(API_KEY, ['BAC'], channels=('T',),
+                                     url=server.url)
+        trades = []
+        client.on('trade', lambda ticker, trade: trades.append(trade['p']))
+        client.run()
+
+    assert trades == [30.0, 31.0, 29.5, 30.2]
+    bar = client.buffer('BAC').last()
+    assert bar == {'t': T0, 'o': 30.0, 'h': 31.0, 'l': 29.5, 'c': 29.5,
+                   'v': 500, 'vw': pytest.approx(30.5), 'n': 3}
+    assert client.partial('BAC')['t'] == T0 + MINUTE
+    assert client.partial('BAC')['v'] == 50
+
+
+def test_stream_client__start_in_background():
+    with FakeStreamServer([[_aggregate('BAC', 0, 30.0)]]) as server:
+        client = stream.StreamClient(API_KEY, ['BAC'], url=server.url)
+        client.start()
+        client._thread.join(5)
+        client.close()
+    assert len(client.buffer('BAC')) == 1
+
+
+def test_stream_client__unknown_channel_or_event():
+    with pytest.raises(ValueError):
+        stream.StreamClient(API_KEY, ['BAC'], channels=('Q',))
+    client = stream.StreamClient(API_KEY, ['BAC'])
+    with pytest.raises(ValueError):
+        client.on('quote', print)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import json
+
+import numpy
+import pytest
+
+from ..poly import backtest, sweep
+from ..poly.bars import Bars
+
+MINUTE = 60000
+T0 = 1609770600000  # 2021-01-04T09:30:00-05:00
+
+
+def _bars(ticker, size, seed):
+    rng = numpy.random.default_rng(seed)
+    closes = 100 * numpy.exp(numpy.cumsum(rng.normal(0, 0.001, size)))
+    return Bars(ticker, t=T0 + numpy.arange(size) * MINUTE, c=closes,
+                v=numpy.full(size, 100.0))
+
+
+def momentum(bars, lookback, threshold=0.0):
+    '''
+    Long after rising more than `threshold` over `lookback` bars.
+    '''
+    if lookback <= 0:
+        raise ValueError('lookback must be positive')
+    change = numpy.full(len(bars), numpy.nan)
+    change[lookback:] = bars.c[lookback:] / bars.c[:-lookback] - 1
+    return numpy.where(change > threshold, 1.0, 0.0)
+
+
+def test_parameter_grid():
+    assert sweep.parameter_grid({'a': [1, 2], 'b': 'xy'}) == [
+        {'a': 1, 'b': 'x'}, {'a': 1, 'b': 'y'},
+        {'a': 2, 'b': 'x'}, {'a': 2, 'b': 'y'}]
+    assert sweep.parameter_grid([{'a': 1}]) == [{'a': 1}]
+
+
+def test_shared_bars__views_one_block():
+    bars = {'BAC': _bars('BAC', 100, 1), 'T': _bars('T', 50, 2)}
+    shared = sweep.SharedBars.create(bars)
+    try:
+        attached = sweep.SharedBars.attach(shared.layout)
+        views = attached.bars()
+        assert list(views) == ['BAC', 'T']
+        for ticker in bars:
+            assert views[ticker].t.tolist() == bars[ticker].t.tolist()
+            assert views[ticker].c.tolist() == bars[ticker].c.tolist()
+            assert not views[ticker].c.flags.writeable
+        block = numpy.frombuffer(attached.shm.buf, dtype=numpy.uint8)
+        assert all(numpy.shares_memory(views[ticker].c, block)
+                   for ticker in bars)
+        del views, block
+        attached.close()
+    finally:
+        shared.close()
+
+
+def test_run_sweep__matches_backtest(tmp_path):
+    bars = [_bars('BAC', 2000, 1), _bars('T', 1500, 2)]
+    output = str(tmp_path / 'results.ndjson')
+    seen = []
+    report = sweep.run_sweep(bars, momentum,
+                             {'lookback': [5, 10, 20], 'threshold': [0, 0.001]},
+                             output, processes=2, progress=seen.append,
+                             commission=0.0005)
+    assert report['tasks'] == 6
+    assert report['done'] == 6
+    assert report['skipped'] == report['failed'] == 0
+    assert len(seen) == 6
+
+    results = sweep.load_results(output)
+    assert len(results) == 6
+    for line in results:
+        params = line['params']
+        expected = backtest.run(
+            bars, lambda bars: momentum(bars, **params), commission=0.0005)
+        assert line['metrics'] == pytest.approx(expected.metrics())
+
+
+def test_run_sweep__resumes(tmp_path):
+    bars = _bars('BAC', 500, 1)
+    output = tmp_path / 'results.ndjson'
+    grid = {'lookback': [-1, 5, 10, 20]}
+    done = {'params': {'lookback': 5}, 'metrics': {'sharpe': 1.0}}
+    failed = {'params': {'lookback': 10}, 'error': 'MemoryError: '}
+    # an interrupted sweep: one done, one failed, one cut off mid line
+    output.write_text(json.dumps(done) + '\n' + json.dumps(failed) + '\n' +
+                      '{"params": {"lookback": 20}, "metr')
+
+    report = sweep.run_sweep(bars, momentum, grid, str(output), processes=2)
+    assert report['skipped'] == 1
+    assert report['done'] == 2
+    assert report['failed'] == 1
+
+    results = sweep.load_results(str(output))
+    assert len(output.read_text().splitlines()) == len(results) == 5
+    # the done line was kept as is, not run again
+    assert results[0] == done
+    finished = {line['params']['lookback']: line for line in results[2:]}
+    assert 'lookback must be positive' in finished[-1]['error']
+    assert 'metrics' in finished[10] and 'metrics' in finished[20]
+
+    report = sweep.run_sweep(bars, momentum, grid, str(output), processes=1)
+    assert report['skipped'] == 3
+    assert report['failed'] == 1
+    report = sweep.run_sweep(bars, momentum, grid, str(output), processes=1,
+                             resume=False)
+    assert report['skipped'] == 0
+    assert len(sweep.load_results(str(output))) == 4
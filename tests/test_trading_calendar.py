@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import datetime
+
+from ..poly import trading_calendar
+
+
+def _day(*args):
+    return datetime.date(*args)
+
+
+def test_holidays__2021():
+    assert sorted(trading_calendar.holidays(2021)) == [
+        _day(2021, 1, 1), _day(2021, 1, 18), _day(2021, 2, 15),
+        _day(2021, 4, 2), _day(2021, 5, 31), _day(2021, 7, 5),
+        _day(2021, 9, 6), _day(2021, 11, 25), _day(2021, 12, 24)]
+
+
+def test_holidays__observance_rules():
+    # a Saturday New Year's Day is not observed on the Friday before
+    assert _day(2021, 12, 31) not in trading_calendar.holidays(2021)
+    assert _day(2022, 1, 1) not in trading_calendar.holidays(2022)
+    # Sunday holidays move to Monday, Saturday ones to Friday
+    assert _day(2022, 12, 26) in trading_calendar.holidays(2022)
+    assert _day(2022, 6, 20) in trading_calendar.holidays(2022)
+    assert _day(2020, 7, 3) in trading_calendar.holidays(2020)
+    # Juneteenth only from 2022
+    assert _day(2021, 6, 18) not in trading_calendar.holidays(2021)
+    # Good Friday follows Easter
+    assert _day(2024, 3, 29) in trading_calendar.holidays(2024)
+    assert _day(2025, 4, 18) in trading_calendar.holidays(2025)
+    # special closures
+    assert not trading_calendar.is_trading_day(_day(2012, 10, 29))
+    assert not trading_calendar.is_trading_day(_day(2025, 1, 9))
+
+
+def test_early_closes():
+    assert trading_calendar.early_closes(2021) == {_day(2021, 11, 26)}
+    assert trading_calendar.early_closes(2024) == {
+        _day(2024, 7, 3), _day(2024, 11, 29), _day(2024, 12, 24)}
+    assert trading_calendar.session_minutes(_day(2024, 12, 24)) == 780
+    assert trading_calendar.session_minutes(_day(2024, 12, 23)) == 960
+    assert trading_calendar.session_minutes(_day(2024, 12, 25)) == 0
+    assert trading_calendar.session_minutes(_day(2024, 12, 24),
+                                            extended=False) == 210
+
+
+def test_session_hours():
+    ny = trading_calendar.NEW_YORK
+    assert trading_calendar.session_hours(_day(2021, 1, 4)) == (
+        datetime.datetime(2021, 1, 4, 9, 30, tzinfo=ny),
+        datetime.datetime(2021, 1, 4, 16, tzinfo=ny))
+    assert trading_calendar.session_hours(_day(2021, 11, 26),
+                                          extended=True) == (
+        datetime.datetime(2021, 11, 26, 4, tzinfo=ny),
+        datetime.datetime(2021, 11, 26, 17, tzinfo=ny))
+    assert trading_calendar.session_hours(_day(2021, 1, 9)) is None
+
+
+def test_trading_days():
+    assert trading_calendar.trading_days(_day(2021, 1, 14),
+                                         _day(2021, 1, 20)) == [
+        _day(2021, 1, 14), _day(2021, 1, 15), _day(2021, 1, 19),
+        _day(2021, 1, 20)]
+    assert trading_calendar.previous_trading_day(_day(2021, 1, 19)) == \
+        _day(2021, 1, 15)
+    assert trading_calendar.next_trading_day(_day(2021, 1, 15)) == \
+        _day(2021, 1, 19)
+    assert trading_calendar.last_trading_day(_day(2021, 1, 18)) == \
+        _day(2021, 1, 15)
+    assert trading_calendar.last_trading_day(_day(2021, 1, 19)) == \
+        _day(2021, 1, 19)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+import gzip
+
+import pytest
+
+from .. import poly
+from ..poly import transport
+from ..benchmarks.fake_polygon import FakePolygonServer
+
+API_KEY = 'NaOW_Dp24BpexIR8A9qADvh3owYD98Ka'
+
+
+def _session(client):
+    return (client.get_marketstatus(ttl=0, verbose=False).to_dict(),
+            client.get_dividends(['BAC', 'T']),
+            client.get_ticker_aggregates('BAC', '2021-01-04', '2021-01-15',
+                                         limit=2000))
+
+
+def test_transport__record_then_replay(tmp_path):
+    archive = str(tmp_path / 'archive')
+    with FakePolygonServer() as server, poly.PolyClient(
+            API_KEY, base_url=server.url,
+            transport=transport.open_transport('record', archive)) as client:
+        recorded = _session(client)
+    requests = len(server.requests)
+    # the limit splits the range into several windows
+    assert requests > 4
+
+    # the server is gone, every response comes from the archive
+    with poly.PolyClient(API_KEY, base_url=server.url,
+                         transport=poly.open_transport('replay',
+                                                       archive)) as client:
+        replayed = _session(client)
+    assert replayed == recorded
+    assert len(server.requests) == requests
+    assert len(list((tmp_path / 'archive').iterdir())) == requests
+
+
+def test_transport__replay_miss(tmp_path):
+    replay = transport.open_transport('replay', str(tmp_path))
+    with poly.PolyClient(API_KEY, transport=replay) as client:
+        with pytest.raises(poly.ReplayMissError):
+            client.get_dividends(['BAC'])
+
+
+def test_transport__archive_has_no_api_key(tmp_path):
+    with FakePolygonServer() as server, poly.PolyClient(
+            API_KEY, base_url=server.url,
+            transport=transport.open_transport('record',
+                                               str(tmp_path))) as client:
+        client.get_dividends(['BAC'])
+    entry, = tmp_path.iterdir()
+    assert API_KEY not in entry.name
+    with gzip.open(entry) as f:
+        recorded = f.read()
+    assert b'reference_stock_dividends' in recorded
+    assert API_KEY.encode() not in recorded
+
+
+def test_set_transport__shared_clients(tmp_path):
+    client = poly.get_client(API_KEY)
+    assert client.transport.mode == 'passthrough'
+    try:
+        poly.set_transport(transport.open_transport('replay', str(tmp_path)))
+        assert client.transport.mode == 'replay'
+        assert poly.get_client(API_KEY, 'bulk').transport.mode == 'replay'
+        poly.set_transport(None)
+        assert client.transport.mode == 'passthrough'
+    finally:
+        poly.set_transport(None)
+        poly.close_clients()
+
+
+def test_open_transport__bad_arguments(tmp_path):
+    with pytest.raises(ValueError):
+        transport.open_transport('tape', str(tmp_path))
+    with pytest.raises(ValueError):
+        transport.open_transport('record')
+    with pytest.raises(FileNotFoundError):
+        transport.open_transport('replay', str(tmp_path / 'missing'))
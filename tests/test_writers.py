@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+import csv
+import json
+import os
+import tempfile
+
+import pytest
+
+from ..poly import writers
+
+BARS = [
+    {'t': 1609770600000, 'o': 1.0, 'h': 2.0, 'l': 0.5, 'c': 1.5, 'v': 100,
+     'vw': 1.2, 'n': 3},
+    {'t': 1609770660000, 'o': 1.5, 'h': 2.5, 'l': 1.0, 'c': 2.0, 'v': 200,
+     'vw': 1.8, 'n': 5},
+    {'t': 1609770720000, 'o': 2.0, 'h': 2.0, 'l': 2.0, 'c': 2.0, 'v': 10,
+     'vw': 2.0, 'n': 1},
+]
+
+
+def _write_in_chunks(path, format=None):
+    with writers.open_writer(path, format) as writer:
+        writer.write(BARS[:2])
+        writer.write([])
+        writer.write(BARS[2:])
+    return writer
+
+
+## format_from_path
+
+def test_format_from_path__known_extensions():
+    assert writers.format_from_path('a/b.json') == 'json'
+    assert writers.format_from_path('b.jsonl') == 'ndjson'
+    assert writers.format_from_path('b.CSV') == 'csv'
+    assert writers.format_from_path('b.parquet') == 'parquet'
+
+
+def test_format_from_path__unknown_extension():
+    pytest.raises(RuntimeError, writers.format_from_path, 'bars.txt')
+
+
+## open_writer
+
+def test_open_writer__json_chunks_make_one_array():
+    with tempfile.TemporaryDirectory() as tdir:
+        path = os.path.join(tdir, 'bars.json')
+        writer = _write_in_chunks(path)
+        assert writer.count == 3
+        with open(path) as _path:
+            assert json.load(_path) == BARS
+
+
+def test_open_writer__ndjson():
+    with tempfile.TemporaryDirectory() as tdir:
+        path = os.path.join(tdir, 'sub', 'bars.ndjson')
+        _write_in_chunks(path)
+        with open(path) as _path:
+            assert [json.loads(line) for line in _path] == BARS
+
+
+def test_open_writer__csv_with_format_override():
+    '''
+    Passing `format` wins over the file extension.
+    '''
+    with tempfile.TemporaryDirectory() as tdir:
+        path = os.path.join(tdir, 'bars.txt')
+        _write_in_chunks(path, 'csv')
+        with open(path) as _path:
+            rows = list(csv.DictReader(_path))
+        assert list(rows[0]) == writers.BAR_FIELDS
+        assert [float(row['c']) for row in rows] == [1.5, 2.0, 2.0]
+
+
+def test_open_writer__existing_path_no_overwrite():
+    with tempfile.TemporaryDirectory() as tdir:
+        path = os.path.join(tdir, 'bars.json')
+        _write_in_chunks(path)
+        pytest.raises(FileExistsError, writers.open_writer, path)
+
+
+def test_open_writer__failure_leaves_existing_file_untouched():
+    '''
+    An error while writing must not leave a partial file, or any temporary
+    files, behind.
+    '''
+    with tempfile.TemporaryDirectory() as tdir:
+        path = os.path.join(tdir, 'bars.ndjson')
+        _write_in_chunks(path)
+        with pytest.raises(KeyboardInterrupt):
+            with writers.open_writer(path, overwrite=True) as writer:
+                writer.write(BARS[:1])
+                raise KeyboardInterrupt
+        assert os.listdir(tdir) == ['bars.ndjson']
+        with open(path) as _path:
+            assert len(_path.readlines()) == 3
+
+
+@pytest.mark.parametrize('extension', ['parquet', 'arrow'])
+def test_open_writer__columnar(extension):
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.ipc
+    import pyarrow.parquet
+    with tempfile.TemporaryDirectory() as tdir:
+        path = os.path.join(tdir, f'bars.{extension}')
+        _write_in_chunks(path)
+        if extension == 'parquet':
+            table = pyarrow.parquet.read_table(path)
+        else:
+            table = pyarrow.ipc.open_file(path).read_all()
+        assert table.to_pylist() == BARS
+
+
+# a whole then a fractional volume, and a chunk without 'vw' / 'n'
+MIXED_CHUNKS = [
+    [{'t': 1609770600000, 'o': 1.0, 'h': 2.0, 'l': 0.5, 'c': 1.5, 'v': 100}],
+    [{'t': 1609770660000, 'o': 1.5, 'h': 2.5, 'l': 1.0, 'c': 2.0,
+      'v': 100.5, 'vw': 1.8, 'n': 5}],
+]
+
+
+@pytest.mark.parametrize('extension', ['csv', 'parquet', 'arrow'])
+def test_open_writer__mixed_chunks(extension):
+    with tempfile.TemporaryDirectory() as tdir:
+        path = os.path.join(tdir, f'bars.{extension}')
+        with writers.open_writer(path) as writer:
+            for chunk in MIXED_CHUNKS:
+                writer.write(chunk)
+        if extension == 'csv':
+            with open(path) as _path:
+                rows = list(csv.DictReader(_path))
+            assert list(rows[0]) == writers.BAR_FIELDS
+            assert [row['v'] for row in rows] == ['100', '100.5']
+            assert [row['vw'] for row in rows] == ['', '1.8']
+            return
+        pyarrow = pytest.importorskip('pyarrow')
+        import pyarrow.ipc
+        import pyarrow.parquet
+        if extension == 'parquet':
+            table = pyarrow.parquet.read_table(path)
+        else:
+            table = pyarrow.ipc.open_file(path).read_all()
+        assert table.schema.field('t').type == pyarrow.int64()
+        assert table.schema.field('v').type == pyarrow.float64()
+        assert table.column('v').to_pylist() == [100.0, 100.5]
+        assert table.column('vw').to_pylist() == [None, 1.8]
+        assert table.column('n').to_pylist() == [None, 5]
+
+
+@pytest.mark.parametrize('extension', ['csv', 'parquet'])
+def test_open_writer__new_fields_in_later_chunks(extension):
+    if extension == 'parquet':
+        pytest.importorskip('pyarrow')
+    with tempfile.TemporaryDirectory() as tdir:
+        path = os.path.join(tdir, f'bars.{extension}')
+        with pytest.raises(RuntimeError):
+            with writers.open_writer(path) as writer:
+                writer.write(BARS[:1])
+                writer.write([dict(BARS[1], otc=True)])
+        assert os.listdir(tdir) == []